@@ -0,0 +1,360 @@
+# run.py
+"""
+Times the hot paths against a database filled by benchmarks.seed.
+
+    python -m benchmarks.run --config bench_db_config.json [--samples 30] [-o results.json]
+    python -m benchmarks.run --config bench_db_config.json --save-baseline
+    python -m benchmarks.run --config bench_db_config.json [--baseline PATH] [--tolerance 0.25]
+
+Every benchmark makes a few warm-up calls and then `samples` timed ones.
+The query cache is cleared before each call, so the numbers are database,
+driver and Python time. Results are written as JSON with p50/p95/p99 in
+milliseconds. When a baseline exists (benchmarks/baseline.json unless
+--baseline names another), a benchmark whose p50 or p95 grew by more than
+the tolerance, and by at least MIN_REGRESSION_MS, is reported as a
+regression and the run exits with status 1.
+
+Local files (the sleep event journal, the feedback index) go to a
+temporary directory, and the dashboard is drawn on Qt's offscreen platform.
+The sessions and events the write benchmarks create are deleted, and their
+rollups rebuilt, after each benchmark, so every run times the seeded data.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.seed import DEFAULT_SEED, WORDS, check_bench_database, use_config
+from database.db_connection import pooled_connection
+from database.event_queue import get_sleep_event_queue
+from database.queries import (
+    end_session, fetch_all_sessions, fetch_filtered_feedback, fetch_session_changes, fetch_sessions_snapshot,
+    insert_sleep_events, log_sleep_event, start_session
+)
+from database.query_cache import get_query_cache
+from database.rollups import rebuild_rollups
+from utils.session_manager import get_session_manager
+
+WARMUP = 2
+DEFAULT_SAMPLES = 30
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 1.0
+EVENTS_PER_FLUSH = 100
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class Skipped(Exception):
+    """The benchmark cannot run in this environment."""
+
+
+class Context:
+    """Seeded choices shared by the benchmarks."""
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.today = date.today()
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, username, role FROM accounts ORDER BY id")
+            accounts = cursor.fetchall()
+            cursor.execute("SELECT DISTINCT account_id FROM sessions WHERE clock_out IS NULL")
+            clocked_in = {row[0] for row in cursor.fetchall()}
+        self.admin_id = next(account_id for account_id, _, role in accounts if role == "admin")
+        self.employees = [(account_id, username) for account_id, username, role in accounts if role == "employee"]
+        # Clocking one of the others in would return its seeded open session.
+        self.idle_employees = [account_id for account_id, _ in self.employees if account_id not in clocked_in]
+        self.created_sessions = []
+
+    def employee(self):
+        return self.rng.choice(self.employees)
+
+    def idle_employee(self):
+        """An employee who was not clocked in, to clock in for a write benchmark."""
+        return self.rng.choice(self.idle_employees)
+
+    def open_session(self):
+        """A session clocked in eight hours ago for an idle employee; returns (account_id, id, clock_in)."""
+        account_id = self.idle_employee()
+        clock_in = datetime.now().replace(microsecond=0) - timedelta(hours=8)
+        session_id = start_session(account_id, clock_in)
+        self.created_sessions.append(session_id)
+        return account_id, session_id, clock_in
+
+    def remove_created(self):
+        """Delete the sessions the benchmarks opened, with their events, and rebuild their rollups."""
+        if not self.created_sessions:
+            return
+        get_sleep_event_queue().flush(timeout=60)
+        ids = ",".join(map(str, self.created_sessions))
+        selected = "SELECT CAST(value AS INT) FROM STRING_SPLIT(?, ',')"
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT MIN(session_date), MAX(session_date) FROM sessions WHERE id IN ({selected})", ids)
+            first_day, last_day = cursor.fetchone()
+            cursor.execute(f"DELETE FROM sleep_events WHERE session_id IN ({selected})", ids)
+            cursor.execute(f"DELETE FROM sessions WHERE id IN ({selected})", ids)
+            conn.commit()
+        if first_day is not None:
+            rebuild_rollups(first_day, last_day)
+        self.created_sessions.clear()
+        clear_cache()
+
+
+def clear_cache():
+    get_query_cache().clear()
+
+
+def timed(fn, samples, before=None):
+    """Seconds taken by each of `samples` calls of fn, after WARMUP untimed ones."""
+    timings = []
+    for call in range(WARMUP + samples):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if call >= WARMUP:
+            timings.append(elapsed)
+    return timings
+
+
+def bench_sessions_last_month(ctx, samples):
+    return timed(lambda: fetch_all_sessions(ctx.today - timedelta(days=30), ctx.today), samples, clear_cache)
+
+
+def bench_sessions_of_employee(ctx, samples):
+    return timed(lambda: fetch_all_sessions(employee=ctx.employee()[1]), samples, clear_cache)
+
+
+def bench_feedback_last_month(ctx, samples):
+    return timed(lambda: fetch_filtered_feedback(ctx.today - timedelta(days=30), ctx.today), samples, clear_cache)
+
+
+def bench_feedback_keyword(ctx, samples):
+    year_ago = ctx.today - timedelta(days=365)
+    return timed(lambda: fetch_filtered_feedback(year_ago, ctx.today, "All", ctx.rng.choice(WORDS)),
+                 samples, clear_cache)
+
+
+def bench_session_changes(ctx, samples):
+    """One auto-refresh poll of last month's sessions that finds nothing new."""
+    month_ago = ctx.today - timedelta(days=30)
+    _, watermark = fetch_sessions_snapshot.uncached(month_ago, ctx.today)
+    return timed(lambda: fetch_session_changes(watermark, month_ago, ctx.today), samples)
+
+
+def bench_end_session(ctx, samples):
+    timings = []
+    for call in range(WARMUP + samples):
+        account_id, session_id, clock_in = ctx.open_session()
+        insert_sleep_events([
+            (account_id, session_id, "sleep" if n % 2 == 0 else "resume",
+             clock_in + timedelta(minutes=30 * n + 5), "system")
+            for n in range(10)
+        ])
+        started = time.perf_counter()
+        end_session(session_id, datetime.now())
+        if call >= WARMUP:
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_session_manager_end(ctx, samples):
+    """Clock-out through the SessionManager, which already holds the session's events."""
+    manager = get_session_manager()
+    timings = []
+    for call in range(WARMUP + samples):
+        account_id = ctx.idle_employee()
+        clock_in = datetime.now() - timedelta(hours=8)
+        session_id, clock_in = manager.start(account_id, clock_in)
+        ctx.created_sessions.append(session_id)
+        for n in range(10):
+            manager.log_event(account_id, session_id, "sleep" if n % 2 == 0 else "resume",
+                              event_time=clock_in + timedelta(minutes=30 * n + 5))
+        get_sleep_event_queue().flush(timeout=60)
+        started = time.perf_counter()
+        manager.end(session_id, datetime.now())
+        if call >= WARMUP:
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_log_sleep_event(ctx, samples):
+    """Latency of one enqueue, journal fsync included."""
+    account_id, session_id, _ = ctx.open_session()
+    types = iter(["sleep", "resume"] * (WARMUP + samples))
+    timings = timed(lambda: log_sleep_event(account_id, session_id, next(types)), samples)
+    end_session(session_id, datetime.now())
+    return timings
+
+
+def bench_sleep_event_flush(ctx, samples):
+    """Time until EVENTS_PER_FLUSH queued events are in the database."""
+    account_id, session_id, clock_in = ctx.open_session()
+    queue = get_sleep_event_queue()
+    offset = iter(range(1 << 30))
+
+    def flush():
+        for n in range(EVENTS_PER_FLUSH):
+            at = clock_in + timedelta(seconds=next(offset))
+            log_sleep_event(account_id, session_id, "sleep" if n % 2 == 0 else "resume", event_time=at)
+        if not queue.flush(timeout=60):
+            raise RuntimeError("sleep event queue did not drain within 60s")
+
+    timings = timed(flush, samples)
+    end_session(session_id, datetime.now())
+    return timings
+
+
+def bench_populate_sessions_table(ctx, samples):
+    """AdminDashboard.populate_sessions_table with 90 days of sessions, painted offscreen."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from gui.admin_dashboard import AdminDashboard
+    except ImportError as e:
+        raise Skipped(f"cannot import the dashboard here: {e}")
+
+    app = QApplication.instance() or QApplication([])
+    dashboard = AdminDashboard(ctx.admin_id)
+    dashboard.show()
+    rows = fetch_all_sessions.uncached(ctx.today - timedelta(days=90), ctx.today)
+
+    def populate():
+        dashboard.populate_sessions_table(rows)
+        app.processEvents()
+
+    try:
+        return timed(populate, samples)
+    finally:
+        dashboard.hide()
+        dashboard.deleteLater()
+
+
+BENCHMARKS = {
+    "fetch_all_sessions.last_month": bench_sessions_last_month,
+    "fetch_all_sessions.employee": bench_sessions_of_employee,
+    "fetch_filtered_feedback.last_month": bench_feedback_last_month,
+    "fetch_filtered_feedback.keyword": bench_feedback_keyword,
+    "fetch_session_changes.idle": bench_session_changes,
+    "end_session": bench_end_session,
+    "session_manager.end": bench_session_manager_end,
+    "log_sleep_event": bench_log_sleep_event,
+    "sleep_event_flush": bench_sleep_event_flush,
+    "populate_sessions_table": bench_populate_sessions_table,
+}
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(timings):
+    ordered = sorted(seconds * 1000 for seconds in timings)
+    return {
+        "samples": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(percentile(ordered, 50), 3),
+        "p95": round(percentile(ordered, 95), 3),
+        "p99": round(percentile(ordered, 99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each regression of p50/p95 against the baseline's results."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for key in ("p50", "p95"):
+            before, now = previous[key], current[key]
+            if now > before * (1 + tolerance) and now - before >= MIN_REGRESSION_MS:
+                regressions.append(f"{name} {key}: {before:.1f} ms -> {now:.1f} ms "
+                                   f"(+{(now / before - 1) * 100 if before else math.inf:.0f}%)")
+    return regressions
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the queries and the admin dashboard.")
+    parser.add_argument("--config", help="db_config.json of a database filled by benchmarks.seed")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="Run just these")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help=f"Results to compare against (default {BASELINE_PATH} if present)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown as a fraction of the baseline")
+    args = parser.parse_args(argv)
+
+    use_config(args.config)
+    database = check_bench_database()
+    # Keep the journal and the feedback index away from the real client's files.
+    os.environ["LOCALAPPDATA"] = tempfile.mkdtemp(prefix="sleep_tracker_bench_")
+
+    ctx = Context(args.seed)
+    results = {}
+    for name in args.only or BENCHMARKS:
+        try:
+            timings = BENCHMARKS[name](ctx, args.samples)
+        except Skipped as e:
+            print(f"{name:<36} skipped: {e}")
+            continue
+        finally:
+            ctx.remove_created()
+        results[name] = summarize(timings)
+        summary = results[name]
+        print(f"{name:<36} p50 {summary['p50']:>10.2f} ms  p95 {summary['p95']:>10.2f} ms  "
+              f"p99 {summary['p99']:>10.2f} ms")
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "database": database,
+            "employees": len(ctx.employees),
+            "seed": args.seed,
+            "samples": args.samples,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    _write_json(args.output, report)
+
+    if args.save_baseline:
+        _write_json(BASELINE_PATH, report)
+        print(f"Saved baseline to {BASELINE_PATH}")
+        return 0
+
+    baseline_path = args.baseline or BASELINE_PATH
+    if not os.path.exists(baseline_path):
+        if args.baseline:
+            parser.error(f"baseline {baseline_path} does not exist")
+        return 0
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline["meta"]["employees"] != report["meta"]["employees"]:
+        print(f"warning: baseline was measured with {baseline['meta']['employees']} employees, "
+              f"this run with {report['meta']['employees']}", file=sys.stderr)
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION  {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
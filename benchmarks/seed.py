@@ -0,0 +1,200 @@
+# seed.py
+"""
+Fills an empty benchmark database with synthetic, reproducible data.
+
+    python -m benchmarks.seed --config bench_db_config.json [--scale 1.0] [--seed 1]
+
+At scale 1.0 that is 5,000 employees with one session per weekday over
+400 weekdays (2M sessions), ten sleep/resume events per session (20M) and
+40 feedback entries per employee. --scale changes the number of employees
+and keeps the per-employee shape, e.g. --scale 0.01 for a quick run. The
+same seed always produces the same rows; dates are laid out backwards from
+the day the seed runs.
+
+The target must be an empty database with all migrations applied, and its
+name must end in "_bench" so the production database can never be seeded
+by mistake. The queries are T-SQL, so the stand-in is a local SQL Server,
+e.g. the developer edition container:
+
+    docker run -e ACCEPT_EULA=Y -e MSSQL_SA_PASSWORD=... -p 1433:1433 \\
+        mcr.microsoft.com/mssql/server:2022-latest
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from database.db_connection import CONFIG_PATH_ENV, load_db_config, pooled_connection, set_query_timeout
+from database.rollups import rebuild_rollups
+from utils.sleep_intervals import sleep_minutes
+
+BENCH_SUFFIX = "_bench"
+DEFAULT_SEED = 1
+EMPLOYEES = 5000
+WORKDAYS = 400
+EVENTS_PER_SESSION = 10
+FEEDBACK_PER_EMPLOYEE = 40
+CHUNK_SIZE = 10000
+PASSWORD = "bench"
+
+MOODS = ["Terrible", "Poor", "Good", "Great", "Excellent"]
+WORDS = (
+    "meeting deadline printer coffee network slow laptop team manager project "
+    "overtime break lunch training vpn update crash schedule shift client "
+    "report review office noise chair screen keyboard deploy support ticket"
+).split()
+
+
+def username(number):
+    return f"bench_{number:05d}"
+
+
+def employee_count(scale):
+    return max(1, round(EMPLOYEES * scale))
+
+
+def workdays(today, count):
+    """The last `count` weekdays before today, oldest first."""
+    days = []
+    day = today - timedelta(days=1)
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def check_bench_database():
+    """Raise unless the configured database is a benchmark database."""
+    database = load_db_config()["database"]
+    if not database.endswith(BENCH_SUFFIX):
+        raise SystemExit(f"Refusing to use database {database!r}: its name must end in {BENCH_SUFFIX!r}")
+    return database
+
+
+def use_config(path):
+    """Point database.db_connection at the benchmark config before the first connection."""
+    if path:
+        os.environ[CONFIG_PATH_ENV] = os.path.abspath(path)
+
+
+def _session(rng, account_id, session_id, day):
+    clock_in = datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=rng.randrange(120))
+    length = rng.randrange(360, 600)
+    clock_out = clock_in + timedelta(minutes=length)
+    # Pairs of sorted offsets become sleep/resume spans, each from one source.
+    offsets = sorted(rng.randrange(1, length * 60) for _ in range(EVENTS_PER_SESSION))
+    events = []
+    for start, end in zip(offsets[::2], offsets[1::2]):
+        source = rng.choice(("system", "user"))
+        events.append((account_id, session_id, "sleep", clock_in + timedelta(seconds=start), source))
+        events.append((account_id, session_id, "resume", clock_in + timedelta(seconds=end), source))
+    slept = sleep_minutes([(event_type, at, source) for _, _, event_type, at, source in events],
+                          clock_in, clock_out)
+    session = (session_id, account_id, clock_in, clock_out, day, length - slept, slept)
+    return session, events
+
+
+def _feedback(rng, account_id, first_day, today):
+    span = (today - first_day).days * 86400
+    submitted_at = datetime.combine(first_day, datetime.min.time()) + timedelta(seconds=rng.randrange(span))
+    comment = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(5, 30)))
+    return account_id, rng.choice(MOODS), comment, int(rng.random() < 0.1), submitted_at
+
+
+def seed(scale=1.0, seed_value=DEFAULT_SEED, log=print):
+    """Write the synthetic data set; returns (employees, sessions, events, feedback) written."""
+    rng = random.Random(seed_value)
+    employees = employee_count(scale)
+    today = date.today()
+    days = workdays(today, WORKDAYS)
+    sessions = events = feedback = 0
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM accounts")
+        if cursor.fetchone()[0]:
+            raise SystemExit("The benchmark database must be empty; recreate it and run the migrations")
+        cursor.fast_executemany = True
+
+        # Account 1 is the admin the dashboard benchmark logs in as.
+        cursor.execute("SET IDENTITY_INSERT accounts ON")
+        cursor.executemany(
+            "INSERT INTO accounts (id, username, password, role, is_active) VALUES (?, ?, ?, ?, 1)",
+            [(1, "bench_admin", PASSWORD, "admin")]
+            + [(number + 2, username(number), PASSWORD, "employee") for number in range(employees)]
+        )
+        cursor.execute("SET IDENTITY_INSERT accounts OFF")
+        conn.commit()
+
+        # Session ids are assigned here so their events can refer to them.
+        cursor.execute("SET IDENTITY_INSERT sessions ON")
+        session_rows, event_rows, feedback_rows = [], [], []
+
+        def flush():
+            if not session_rows:
+                return
+            cursor.executemany("""
+                INSERT INTO sessions (id, account_id, clock_in, clock_out, session_date,
+                                      total_work_minutes, sleep_minutes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, session_rows)
+            cursor.executemany("""
+                INSERT INTO sleep_events (account_id, session_id, event_type, event_time, source)
+                VALUES (?, ?, ?, ?, ?)
+            """, event_rows)
+            if feedback_rows:
+                cursor.executemany("""
+                    INSERT INTO feedback (account_id, mood, comment, is_anonymous, submitted_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, feedback_rows)
+            conn.commit()
+            session_rows.clear()
+            event_rows.clear()
+            feedback_rows.clear()
+
+        for number in range(employees):
+            account_id = number + 2
+            for day in days:
+                sessions += 1
+                session, session_events = _session(rng, account_id, sessions, day)
+                session_rows.append(session)
+                event_rows.extend(session_events)
+            for _ in range(FEEDBACK_PER_EMPLOYEE):
+                feedback_rows.append(_feedback(rng, account_id, days[0], today))
+            events += len(days) * EVENTS_PER_SESSION
+            feedback += FEEDBACK_PER_EMPLOYEE
+            if len(session_rows) >= CHUNK_SIZE:
+                flush()
+                if log:
+                    log(f"{number + 1}/{employees} employees, {sessions} sessions, {events} events")
+        flush()
+        cursor.execute("SET IDENTITY_INSERT sessions OFF")
+        conn.commit()
+
+    rebuild_rollups(days[0], today)
+    return employees, sessions, events, feedback
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a benchmark database with synthetic data.")
+    parser.add_argument("--config", help="db_config.json of the benchmark database")
+    parser.add_argument("--scale", type=float, default=1.0, help="Fraction of the 5,000 employees")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report every chunk")
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    use_config(args.config)
+    database = check_bench_database()
+    started = time.perf_counter()
+    employees, sessions, events, feedback = seed(args.scale, args.seed, log=print if args.verbose else None)
+    print(f"Seeded {database}: {employees} employees, {sessions} sessions, {events} sleep events, "
+          f"{feedback} feedback in {time.perf_counter() - started:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# archive.py
+"""
+Moves closed sessions older than the hot horizon, with their sleep events,
+into sessions_archive / sleep_events_archive (migration 5).
+
+    python -m database.archive [--horizon-days N] [--batch-size N]
+    python -m database.archive status
+
+The archived session row keeps its id and its stored work and sleep
+minutes, so it serves as the session's summary in historical listings.
+The horizon is recorded in archive_state before anything moves. The
+session fetch functions read sessions_archive only when the requested date
+range starts before it. Each batch moves its sessions and events in one
+transaction with DELETE ... OUTPUT INTO, so a row is always in exactly one
+of the two tables.
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+
+from database.db_connection import load_db_config, pooled_connection, set_query_timeout
+from database.query_cache import invalidate
+
+DEFAULT_HORIZON_DAYS = 180
+DEFAULT_BATCH_SIZE = 200  # sessions per transaction; each brings its sleep events along
+
+SESSION_COLUMNS = "id, account_id, clock_in, clock_out, session_date, total_work_minutes, sleep_minutes"
+EVENT_COLUMNS = "id, account_id, session_id, event_type, event_time, source"
+
+# The sessions table as the listing queries see it once a date range goes
+# past the horizon. Columns are spelled out so the UNION ALL lines up
+# whatever columns later migrations add to the hot table.
+SESSIONS_WITH_ARCHIVE = f"""(
+        SELECT {SESSION_COLUMNS} FROM sessions
+        UNION ALL
+        SELECT {SESSION_COLUMNS} FROM sessions_archive
+    )"""
+
+ARCHIVE_BATCH_SQL = f"""
+SET NOCOUNT ON;
+DECLARE @batch TABLE (id INT PRIMARY KEY);
+
+INSERT INTO @batch (id)
+SELECT TOP (?) id FROM sessions
+WHERE session_date < ? AND clock_out IS NOT NULL
+ORDER BY session_date, id;
+
+DELETE e
+OUTPUT DELETED.id, DELETED.account_id, DELETED.session_id, DELETED.event_type,
+       DELETED.event_time, DELETED.source
+INTO sleep_events_archive ({EVENT_COLUMNS})
+FROM sleep_events e
+JOIN @batch b ON b.id = e.session_id;
+DECLARE @events INT = @@ROWCOUNT;
+
+DELETE s
+OUTPUT DELETED.id, DELETED.account_id, DELETED.clock_in, DELETED.clock_out,
+       DELETED.session_date, DELETED.total_work_minutes, DELETED.sleep_minutes
+INTO sessions_archive ({SESSION_COLUMNS})
+FROM sessions s
+JOIN @batch b ON b.id = s.id;
+
+SELECT @@ROWCOUNT, @events;
+"""
+
+
+def horizon_days():
+    return load_db_config().get("archive", {}).get("horizon_days", DEFAULT_HORIZON_DAYS)
+
+
+def archive_horizon():
+    """
+    First session_date still kept in the hot tables, or None if nothing was
+    ever archived. Read afresh every time (it is one row): a process holding
+    an older horizon would look for just-moved sessions in neither table.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT horizon FROM archive_state WHERE name = 'sessions'")
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def needs_archive(from_date):
+    """Whether a listing starting at from_date (None: all history) must include archived sessions."""
+    horizon = archive_horizon()
+    return horizon is not None and (from_date is None or from_date < horizon)
+
+
+def sessions_source(from_date):
+    """FROM-clause source for the sessions of a listing starting at from_date."""
+    return SESSIONS_WITH_ARCHIVE if needs_archive(from_date) else "sessions"
+
+
+def _raise_horizon(horizon):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            MERGE archive_state AS target
+            USING (SELECT 'sessions' AS name) AS source ON target.name = source.name
+            WHEN MATCHED AND target.horizon < ? THEN
+                UPDATE SET horizon = ?, updated_at = GETDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (name, horizon) VALUES ('sessions', ?);
+        """, (horizon, horizon, horizon))
+        conn.commit()
+
+
+def archive_sessions(horizon=None, batch_size=DEFAULT_BATCH_SIZE, log=None):
+    """
+    Move closed sessions dated before `horizon` (default: horizon_days ago)
+    and their events to the archive; returns (sessions, events) moved.
+    """
+    horizon = horizon or date.today() - timedelta(days=horizon_days())
+    # Readers must start looking in the archive before the first row moves.
+    _raise_horizon(horizon)
+
+    sessions = events = 0
+    while True:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(ARCHIVE_BATCH_SQL, (batch_size, horizon))
+                moved_sessions, moved_events = cursor.fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if not moved_sessions:
+            break
+        sessions += moved_sessions
+        events += moved_events
+        if log:
+            log(f"moved {sessions} sessions, {events} sleep events")
+    if sessions:
+        invalidate("sessions")
+    return sessions, events
+
+
+def archive_status():
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT (SELECT horizon FROM archive_state WHERE name = 'sessions'),
+                   (SELECT COUNT_BIG(*) FROM sessions),
+                   (SELECT COUNT_BIG(*) FROM sessions_archive),
+                   (SELECT COUNT_BIG(*) FROM sleep_events),
+                   (SELECT COUNT_BIG(*) FROM sleep_events_archive)
+        """)
+        return cursor.fetchone()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old sessions and their sleep events.")
+    parser.add_argument("command", nargs="?", choices=["run", "status"], default="run")
+    parser.add_argument("--horizon-days", type=int, help="Keep this many days hot (default from config)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report every batch")
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    if args.command == "status":
+        horizon, hot_sessions, cold_sessions, hot_events, cold_events = archive_status()
+        print(f"horizon: {horizon or 'never archived'}")
+        print(f"sessions: {hot_sessions} hot, {cold_sessions} archived")
+        print(f"sleep events: {hot_events} hot, {cold_events} archived")
+        return 0
+
+    started = time.perf_counter()
+    horizon = None
+    if args.horizon_days is not None:
+        horizon = date.today() - timedelta(days=args.horizon_days)
+    sessions, events = archive_sessions(horizon, args.batch_size, log=print if args.verbose else None)
+    print(f"Archived {sessions} sessions and {events} sleep events in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+# auth.py
+"""
+The login query, kept apart from database.queries so the login window
+imports only this and db_connection. database.queries pulls in the
+write-behind queue, the feedback index, purge, archive, rollups and the
+sleep-interval engine, none of which the login window needs; they load
+with the dashboard once a role is known. database.queries re-exports
+authenticate_user.
+"""
+from database.db_connection import pooled_connection
+
+
+def authenticate_user(username, password):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, role FROM accounts WHERE username = ? AND password = ? AND is_active = 1
+        """, (username, password))
+        row = cursor.fetchone()
+    if row:
+        return row.id, row.role
+    return None, None
@@ -0,0 +1,162 @@
+# auto_close.py
+"""
+Close sessions that were never clocked out, e.g. because the client
+crashed before its timeout fired.
+
+    python -m database.auto_close [--threshold-minutes N] [--chunk-size N] [--dry-run]
+
+Every session open longer than the threshold gets clock_out = clock_in +
+threshold, the same end the client-side timeout would have given it. Its
+sleep and work minutes are computed in SQL with the same rules as
+utils.sleep_intervals and added to the daily and weekly rollups. Sessions
+are closed in chunks, each one set-based statement batch in its own
+transaction, which keeps the locks per transaction well below the
+escalation threshold. Rows another connection has locked are skipped
+(READPAST) and picked up by the next run, so the job is safe to schedule
+from cron.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from database.db_connection import pooled_connection, set_query_timeout
+from database.query_cache import invalidate
+from database.rollups import DECLARE_DELTAS_SQL, MERGE_DELTAS_SQL
+from utils.session_timeout import DEFAULT_TIMEOUT_MINUTES
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Mirrors utils.sleep_intervals: per source, keep only real state changes
+# (LAG defaults to 'resume', sources start awake); count sleeping sources
+# per session in time order, falling asleep first on ties; sum the spans
+# while any source sleeps, clamped to [clock_in, clock_out], with a sleep
+# still open at the end running to clock_out; floor to minutes once.
+CLOSE_CHUNK_SQL = f"""
+SET NOCOUNT ON;
+DECLARE @threshold INT = ?;
+DECLARE @batch TABLE (id INT PRIMARY KEY, clock_in DATETIME NOT NULL, clock_out DATETIME NOT NULL);
+{DECLARE_DELTAS_SQL}
+DECLARE @closed INT;
+
+INSERT INTO @batch (id, clock_in, clock_out)
+SELECT TOP (?) id, clock_in, DATEADD(MINUTE, @threshold, clock_in)
+FROM sessions WITH (UPDLOCK, READPAST)
+WHERE clock_out IS NULL AND clock_in < ?
+ORDER BY clock_in;
+
+WITH marked AS (
+    SELECT e.session_id, e.id, e.event_time, e.event_type,
+           LAG(e.event_type, 1, 'resume') OVER (
+               PARTITION BY e.session_id, ISNULL(e.source, 'system')
+               ORDER BY e.event_time, e.id
+           ) AS previous_type
+    FROM sleep_events e
+    JOIN @batch b ON b.id = e.session_id
+    WHERE e.event_type IN ('sleep', 'resume')
+),
+changes AS (
+    SELECT session_id, id, event_time, CASE WHEN event_type = 'sleep' THEN 1 ELSE -1 END AS delta
+    FROM marked
+    WHERE event_type <> previous_type
+),
+running AS (
+    SELECT c.session_id, c.event_time, b.clock_in, b.clock_out,
+           SUM(c.delta) OVER (
+               PARTITION BY c.session_id ORDER BY c.event_time, c.delta DESC, c.id
+               ROWS UNBOUNDED PRECEDING
+           ) AS asleep,
+           LEAD(c.event_time, 1, b.clock_out) OVER (
+               PARTITION BY c.session_id ORDER BY c.event_time, c.delta DESC, c.id
+           ) AS next_time
+    FROM changes c
+    JOIN @batch b ON b.id = c.session_id
+),
+spans AS (
+    SELECT session_id,
+           CASE WHEN event_time < clock_in THEN clock_in
+                WHEN event_time > clock_out THEN clock_out ELSE event_time END AS span_start,
+           CASE WHEN next_time < clock_in THEN clock_in
+                WHEN next_time > clock_out THEN clock_out ELSE next_time END AS span_end
+    FROM running
+    WHERE asleep > 0
+),
+slept AS (
+    SELECT session_id, SUM(DATEDIFF_BIG(MILLISECOND, span_start, span_end)) / 60000 AS minutes
+    FROM spans
+    GROUP BY session_id
+)
+UPDATE s
+SET clock_out = b.clock_out,
+    sleep_minutes = ISNULL(slept.minutes, 0),
+    total_work_minutes = @threshold - ISNULL(slept.minutes, 0)
+OUTPUT INSERTED.account_id, INSERTED.session_date, 1,
+       INSERTED.total_work_minutes, INSERTED.sleep_minutes
+INTO @rollup_deltas
+FROM sessions s
+JOIN @batch b ON b.id = s.id
+LEFT JOIN slept ON slept.session_id = s.id
+WHERE s.clock_out IS NULL;
+
+SET @closed = @@ROWCOUNT;
+{MERGE_DELTAS_SQL}
+SELECT (SELECT COUNT(*) FROM @batch), @closed;
+"""
+
+
+def count_stale_sessions(cutoff):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM sessions WHERE clock_out IS NULL AND clock_in < ?", (cutoff,))
+        return cursor.fetchone()[0]
+
+
+def close_stale_sessions(threshold_minutes=DEFAULT_TIMEOUT_MINUTES, chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+    """Close every session open longer than threshold_minutes; returns (sessions closed, chunks)."""
+    cutoff = datetime.now() - timedelta(minutes=threshold_minutes)
+    closed = chunks = 0
+    while True:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(CLOSE_CHUNK_SQL, (threshold_minutes, chunk_size, cutoff))
+                selected, updated = cursor.fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if not selected:
+            break
+        closed += updated
+        chunks += 1
+        if log:
+            log(f"chunk {chunks}: closed {updated} sessions")
+    if closed:
+        invalidate("sessions")
+        invalidate("rollups")
+    return closed, chunks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Close sessions left open past the timeout.")
+    parser.add_argument("--threshold-minutes", type=int, default=DEFAULT_TIMEOUT_MINUTES)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the sessions that would be closed")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report every chunk")
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    started = time.perf_counter()
+    if args.dry_run:
+        stale = count_stale_sessions(datetime.now() - timedelta(minutes=args.threshold_minutes))
+        print(f"{stale} sessions open longer than {args.threshold_minutes} minutes")
+    else:
+        closed, chunks = close_stale_sessions(
+            args.threshold_minutes, args.chunk_size, log=print if args.verbose else None
+        )
+        print(f"Closed {closed} sessions in {chunks} chunks in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# backfill_sleep_minutes.py
+"""
+Populate sessions.sleep_minutes for rows recorded before the column was
+maintained by log_sleep_event / end_session.
+
+    python -m database.backfill_sleep_minutes [--batch-size N] [--recompute]
+
+--recompute also redoes sessions that already have a value, e.g. after the
+pairing rules in utils.sleep_intervals change. The schema must be current
+(python -m database.migrations upgrade); migration 2 adds the column.
+"""
+import argparse
+import time
+
+from database.db_connection import pooled_connection, set_query_timeout
+from database.migrations import pending_migrations
+from database.queries import refresh_sleep_minutes
+
+# refresh_sleep_minutes binds one parameter per session in an IN list, and
+# SQL Server accepts at most 2,100 parameters per statement.
+MAX_BATCH_SIZE = 2000
+
+
+def backfill_sleep_minutes(batch_size=1000, recompute=False):
+    """Fill sleep_minutes in batches of sessions; returns the number of sessions updated."""
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    updated = 0
+    last_id = 0
+    while True:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT TOP (?) id FROM sessions
+                WHERE (sleep_minutes IS NULL OR ? = 1) AND id > ?
+                ORDER BY id
+            """, (batch_size, int(recompute), last_id))
+            session_ids = [row[0] for row in cursor.fetchall()]
+            if not session_ids:
+                break
+            refresh_sleep_minutes(cursor, session_ids)
+            conn.commit()
+        updated += len(session_ids)
+        last_id = session_ids[-1]
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill sessions.sleep_minutes from sleep_events.")
+    parser.add_argument("--batch-size", type=int, default=1000, help=f"Sessions per batch, at most {MAX_BATCH_SIZE}")
+    parser.add_argument("--recompute", action="store_true", help="Also redo sessions that have a value")
+    args = parser.parse_args(argv)
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}")
+    set_query_timeout(0)  # a batch job; its statements may run long
+    if pending_migrations():
+        raise SystemExit("The schema is not current; run python -m database.migrations upgrade first")
+
+    started = time.perf_counter()
+    updated = backfill_sleep_minutes(args.batch_size, args.recompute)
+    print(f"Backfilled sleep_minutes for {updated} sessions in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
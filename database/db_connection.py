@@ -1,41 +1,349 @@
 import pyodbc
 import json
 import os
+import threading
+import time
+import atexit
+from collections import deque
+from contextlib import contextmanager
+
+_config = None
+_config_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_query_timeout = None  # set_query_timeout(); None means the configured query_timeout
+
+POOL_DEFAULTS = {
+    "min_size": 1,
+    "max_size": 10,
+    "idle_timeout": 300,     # seconds an idle connection may sit before eviction
+    "validate_after": 30,    # idle seconds after which a connection is pinged before handout
+    "acquire_timeout": 30,   # seconds to wait for a free slot when the pool is exhausted
+}
+
+# Seconds a single statement may run before the driver cancels it (0 = no
+# limit). Meant for the GUI, where a stuck query must not hang the window;
+# batch jobs lift it with set_query_timeout(0).
+QUERY_TIMEOUT = 30
+
+
+# Points the app (or the benchmarks) at another config file than config/db_config.json.
+CONFIG_PATH_ENV = "DB_CONFIG_PATH"
+
 
 def load_db_config():
-    config_path = os.path.join(os.path.dirname(__file__), "../config/db_config.json")
-    with open(config_path, "r") as file:
-        return json.load(file)
+    """Parse config/db_config.json (or $DB_CONFIG_PATH) once and return the cached dict."""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                config_path = os.environ.get(CONFIG_PATH_ENV) or os.path.join(
+                    os.path.dirname(__file__), "../config/db_config.json")
+                with open(config_path, "r") as file:
+                    _config = json.load(file)
+    return _config
+
 
-def get_connection():
-    config = load_db_config()
-    conn = pyodbc.connect(
+def build_connection_string(config):
+    return (
         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
         f"SERVER={config['server']};"
         f"DATABASE={config['database']};"
         f"UID={config['username']};"
         f"PWD={config['password']};"
     )
-    return conn
 
-# import pyodbc
-# import os
-# import json
 
-# def load_db_config():
-#     config_path = os.path.join(os.path.dirname(__file__), "../config/db_config.json")
-#     with open(config_path, "r") as file:
-#         return json.load(file)
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """
+    Proxy around a pyodbc connection borrowed from the pool.
+    close() hands the connection back instead of closing it.
+    """
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise pyodbc.ProgrammingError("Attempt to use a connection that was returned to the pool")
+        return getattr(raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, idle_timeout=300,
+                 validate_after=30, acquire_timeout=30):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size must be <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()   # (raw_connection, returned_at); newest on the right
+        self._size = 0         # idle + borrowed + being opened
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.evicted = 0
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        wait_started = None
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    if waited:
+                        self.wait_time += time.monotonic() - wait_started
+                    raise PoolTimeout("Connection pool is closed")
+                self._evict_idle_locked()
+
+                if self._idle:
+                    raw, returned_at = self._idle.pop()
+                    self.hits += 1
+                    reserved = False
+                elif self._size < self.max_size:
+                    self._size += 1
+                    self.misses += 1
+                    reserved = True
+                    raw = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if not waited:
+                        waited = True
+                        self.waits += 1
+                        wait_started = time.monotonic()
+                    if remaining <= 0:
+                        # A wait that ran out still counts: timeouts are what the stats are for.
+                        self.wait_time += time.monotonic() - wait_started
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection available after {timeout}s")
+                    self._cond.wait(remaining)
+                    continue
+
+                if waited:
+                    self.wait_time += time.monotonic() - wait_started
+
+            if reserved:
+                return PooledConnection(self, self._open_reserved())
+
+            if time.monotonic() - returned_at >= self.validate_after and not self._is_alive(raw):
+                self._discard(raw)
+                continue
+            return PooledConnection(self, raw)
+
+    def release(self, raw):
+        try:
+            # Ends the implicit transaction a plain SELECT opens, so pooled
+            # connections never sit on locks or an open transaction.
+            raw.rollback()
+        except pyodbc.Error:
+            self._discard(raw)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(raw)
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None, query_timeout=None):
+        conn = self.acquire(timeout)
+        if query_timeout is not None:
+            # Set on every borrow: the previous borrower may have used another limit.
+            conn._raw.timeout = query_timeout
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                pass
+            raise
+        finally:
+            conn.close()
+
+    def prefill(self, count=None):
+        """Open connections up to min_size (or count) ahead of demand."""
+        target = self.min_size if count is None else min(count, self.max_size)
+        while True:
+            with self._cond:
+                if self._closed or self._size >= target:
+                    return
+                self._size += 1
+            raw = self._open_reserved()
+            with self._cond:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for raw in idle:
+            self._close_quietly(raw)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "wait_time": round(self.wait_time, 6),
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "discarded": self.discarded,
+                "evicted": self.evicted,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+            }
+
+    def _open_reserved(self):
+        try:
+            raw = self._connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return raw
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size:
+            raw, returned_at = self._idle[0]
+            if now - returned_at < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self.evicted += 1
+            self._close_quietly(raw)
+
+    def _is_alive(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _discard(self, raw):
+        self._close_quietly(raw)
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except pyodbc.Error:
+            pass
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = load_db_config()
+                settings = dict(POOL_DEFAULTS)
+                settings.update(config.get("pool", {}))
+                connection_string = build_connection_string(config)
+                _pool = ConnectionPool(lambda: pyodbc.connect(connection_string), **settings)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(close_pool)
+
+
+def set_query_timeout(seconds):
+    """
+    Statement time limit for this process's later borrows, 0 for none.
+    The command-line jobs (migrations, archive, purge, export, ...) call
+    set_query_timeout(0): their statements are meant to run long.
+    """
+    global _query_timeout
+    _query_timeout = seconds
+
+
+def current_query_timeout():
+    if _query_timeout is not None:
+        return _query_timeout
+    return load_db_config().get("query_timeout", QUERY_TIMEOUT)
+
+
+# Set by database.instrumentation while it is enabled; wraps every borrow.
+_borrow_hook = None
+
+
+def pooled_connection(timeout=None, query_timeout=None):
+    """
+    Context manager: `with pooled_connection() as conn:` borrows and returns
+    a connection. timeout bounds the wait for one; query_timeout overrides
+    the process's statement time limit for this borrow.
+    """
+    limit = current_query_timeout() if query_timeout is None else query_timeout
+    hook = _borrow_hook
+    if hook is not None:
+        return hook(get_pool(), timeout, limit)
+    return get_pool().connection(timeout, limit)
+
 
-# def get_connection():
-#     config = load_db_config()
-#     conn = pyodbc.connect(
-#         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-#         f"SERVER={config['server']};"
-#         f"DATABASE={config['database']};"
-#         f"Trusted_Connection=yes;"
-#     )
-#     return conn
+def warm_up():
+    """Open the pool's first connections ahead of demand, e.g. while the login window waits."""
+    get_pool().prefill()
 
 
-#Paste it in db_config.json
\ No newline at end of file
+def pool_stats():
+    return get_pool().stats()
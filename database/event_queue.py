@@ -0,0 +1,278 @@
+# event_queue.py
+"""
+Write-behind queue for sleep/resume events.
+
+Events are appended to a local journal (fsync'd) before enqueue returns, so
+the caller never waits on the network. A background thread flushes them to
+the database in batches. Once a batch commits, an ack record is appended to
+the journal; on startup, journaled events without an ack are replayed.
+The batch insert is idempotent on the event's natural key, so an event that
+was committed but not yet acked when the process died is not written twice.
+
+Failures the database will never accept (permanent_errors, e.g. a foreign
+key violation because the session was purged or archived meanwhile) are not
+retried: the batch is split into single events, and an event that still
+fails is appended to a dead-letter journal and acked, so it cannot hold up
+the events behind it. Any other failure is retried with backoff.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from utils.local_storage import data_path
+
+JOURNAL_FILENAME = "sleep_events.journal"
+DEAD_LETTER_FILENAME = "sleep_events.dead"
+
+logger = logging.getLogger(__name__)
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class SleepEventQueue:
+    def __init__(self, journal_path, flush_batch, batch_size=500,
+                 min_backoff=1.0, max_backoff=60.0, compact_after=1 << 20,
+                 permanent_errors=(), dead_letter_path=None):
+        self.journal_path = journal_path
+        self.dead_letter_path = dead_letter_path or journal_path + ".dead"
+        self._flush_batch = flush_batch
+        self.permanent_errors = tuple(permanent_errors)
+        self.batch_size = batch_size
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.compact_after = compact_after
+
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._pending = OrderedDict()   # uid -> event dict, in enqueue order
+        self._flush_requested = False
+        self._stopped = False
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._singles = 0               # events left to send one at a time
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.last_error = None
+
+        self._replay()
+        self._journal = open(self.journal_path, "ab")
+
+        self._thread = threading.Thread(target=self._run, name="sleep-event-flusher", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, account_id, session_id, event_type, source='system', event_time=None):
+        # Whole seconds keep the natural key exact whatever the column's
+        # datetime precision, which the idempotent insert relies on.
+        event_time = (event_time or datetime.now()).replace(microsecond=0)
+        event = {
+            "uid": uuid.uuid4().hex,
+            "account_id": account_id,
+            "session_id": session_id,
+            "event_type": event_type,
+            "event_time": event_time.isoformat(),
+            "source": source,
+        }
+        with self._cond:
+            # Journaled under the queue lock so compaction can never truncate
+            # a line whose event is not yet in _pending.
+            self._append_journal(event)
+            self._pending[event["uid"]] = event
+            self.enqueued += 1
+            self._cond.notify()
+        return event["uid"]
+
+    def flush(self, timeout=None):
+        """Ask the flusher to write everything queued so far; True once it has."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._pending:
+                return True
+            target = next(reversed(self._pending))
+            self._flush_requested = True
+            self._cond.notify_all()
+            while target in self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "failures": self.failures,
+                "dead_lettered": self.dead_lettered,
+                "last_error": self.last_error,
+            }
+
+    def stop(self, timeout=5.0):
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._journal_lock:
+            self._journal.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._pending:
+                        if self._flush_requested:
+                            break
+                        wait = self._retry_at - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                # Events that arrive while a batch is in flight or while backing
+                # off after a failure accumulate into the next batch.
+                size = 1 if self._singles else self.batch_size
+                batch = [event for _, event in zip(range(size), self._pending.values())]
+                self._flush_requested = False
+
+            dead = False
+            try:
+                self._flush_batch([_event_row(event) for event in batch])
+            except self.permanent_errors as e:
+                if len(batch) > 1:
+                    # Find the event(s) at fault by sending this batch one by one.
+                    with self._cond:
+                        self.failures += 1
+                        self.last_error = str(e)
+                        self._singles = len(batch)
+                    continue
+                self._dead_letter(batch[0], e)
+                dead = True
+            except Exception as e:
+                with self._cond:
+                    self.failures += 1
+                    self.last_error = str(e)
+                    self._backoff = min(max(self._backoff * 2, self.min_backoff), self.max_backoff)
+                    self._retry_at = time.monotonic() + self._backoff
+                continue
+
+            uids = [event["uid"] for event in batch]
+            self._append_journal({"ack": uids})
+            with self._cond:
+                for uid in uids:
+                    self._pending.pop(uid, None)
+                if self._singles:
+                    self._singles -= 1
+                if dead:
+                    self.failures += 1
+                    self.dead_lettered += 1
+                else:
+                    self.flushed += len(uids)
+                    self.batches += 1
+                self._backoff = 0.0
+                self._retry_at = 0.0
+                self._cond.notify_all()
+                if not self._pending:
+                    self._compact_locked()
+
+    def _dead_letter(self, event, error):
+        logger.error("Sleep event %s rejected by the database, moved to %s: %s",
+                     event["uid"], self.dead_letter_path, error)
+        record = dict(event, error=str(error), failed_at=datetime.now().isoformat(timespec="seconds"))
+        with open(self.dead_letter_path, "ab") as dead_letter:
+            dead_letter.write((json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8"))
+            dead_letter.flush()
+            os.fsync(dead_letter.fileno())
+
+    def _append_journal(self, record):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._journal_lock:
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def _compact_locked(self):
+        with self._journal_lock:
+            if self._journal.tell() < self.compact_after:
+                return
+            self._journal.truncate(0)
+            self._journal.seek(0)
+            os.fsync(self._journal.fileno())
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return
+        events = OrderedDict()
+        with open(self.journal_path, "rb") as journal:
+            for raw_line in journal:
+                try:
+                    record = json.loads(raw_line)
+                except ValueError:
+                    continue  # torn write from a crash mid-append
+                if "ack" in record:
+                    for uid in record["ack"]:
+                        events.pop(uid, None)
+                elif "uid" in record:
+                    events[record["uid"]] = record
+        self._pending = events
+
+        # Rewrite the journal with only the unacknowledged events.
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "wb") as tmp:
+            for event in events.values():
+                tmp.write((json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8"))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+
+def _event_row(event):
+    return (
+        event["account_id"],
+        event["session_id"],
+        event["event_type"],
+        datetime.fromisoformat(event["event_time"]),
+        event["source"],
+    )
+
+
+def get_sleep_event_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                import pyodbc
+                from database.queries import insert_sleep_events
+                _queue = SleepEventQueue(
+                    data_path(JOURNAL_FILENAME), insert_sleep_events,
+                    permanent_errors=(pyodbc.IntegrityError, pyodbc.DataError),
+                    dead_letter_path=data_path(DEAD_LETTER_FILENAME),
+                )
+    return _queue
+
+
+def _stop_queue():
+    if _queue is not None:
+        _queue.stop(timeout=3.0)
+
+
+atexit.register(_stop_queue)
@@ -0,0 +1,176 @@
+# export.py
+"""
+Streaming export of sessions and feedback, e.g. for payroll.
+
+    python -m database.export sessions --from 2024-01-01 --to 2024-01-31 -o sessions.csv
+    python -m database.export sessions --employee alice --format jsonl --gzip -o alice.jsonl.gz
+    python -m database.export feedback --from 2024-01-01 --to 2024-03-31 -o -
+
+Rows are read with fetchmany in fixed-size chunks and written one at a time,
+so memory use does not depend on how many rows are exported.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import date, datetime
+
+from database.archive import sessions_source
+from database.db_connection import pooled_connection, set_query_timeout
+from database.queries import feedback_filters, session_filters
+
+DEFAULT_CHUNK_SIZE = 5000
+
+SESSION_COLUMNS = [
+    "session_id", "account_id", "username", "session_date", "clock_in", "clock_out",
+    "work_minutes", "sleep_minutes",
+]
+
+FEEDBACK_COLUMNS = ["feedback_id", "username", "mood", "comment", "anonymous", "submitted_at"]
+
+
+def stream_rows(query, params, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield rows of a query, fetching chunk_size rows per round trip."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def session_records(from_date=None, to_date=None, employee=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    clauses, params = session_filters(from_date, to_date, employee)
+    query = """
+        SELECT s.id, s.account_id, a.username, s.session_date, s.clock_in, s.clock_out,
+               ISNULL(s.total_work_minutes, 0), ISNULL(s.sleep_minutes, 0)
+        FROM """ + sessions_source(from_date) + """ s
+        JOIN accounts a ON s.account_id = a.id
+        WHERE 1=1
+    """ + clauses + " ORDER BY s.session_date, s.clock_in, s.id"
+    for row in stream_rows(query, params, chunk_size):
+        yield dict(zip(SESSION_COLUMNS, row))
+
+
+def feedback_records(from_date=None, to_date=None, mood="All", keyword="", chunk_size=DEFAULT_CHUNK_SIZE):
+    clauses, params = feedback_filters(from_date, to_date, mood, keyword)
+    query = """
+        SELECT f.id, a.username, f.mood, f.comment,
+               CASE WHEN f.is_anonymous = 1 THEN 'Yes' ELSE 'No' END,
+               f.submitted_at
+        FROM feedback f
+        LEFT JOIN accounts a ON f.account_id = a.id
+        WHERE 1=1
+    """ + clauses + " ORDER BY f.submitted_at, f.id"
+    for row in stream_rows(query, params, chunk_size):
+        record = dict(zip(FEEDBACK_COLUMNS, row))
+        if record["anonymous"] == "Yes":
+            record["username"] = None
+        yield record
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def write_csv(records, stream, columns):
+    writer = csv.DictWriter(stream, fieldnames=columns)
+    writer.writeheader()
+    for record in records:
+        writer.writerow({key: _plain(value) for key, value in record.items()})
+        yield record
+
+
+def write_jsonl(records, stream, columns):
+    for record in records:
+        stream.write(json.dumps({key: _plain(value) for key, value in record.items()}))
+        stream.write("\n")
+        yield record
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def open_output(path, compress):
+    if path == "-":
+        if compress:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"),
+                                    encoding="utf-8", newline="")
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="", write_through=True)
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def export(records, stream, columns, fmt="csv", progress=None, progress_every=5.0):
+    """Drain `records` into `stream`; returns (rows, seconds)."""
+    started = last_report = time.perf_counter()
+    rows = 0
+    for rows, _ in enumerate(WRITERS[fmt](records, stream, columns), 1):
+        now = time.perf_counter()
+        if progress and now - last_report >= progress_every:
+            progress(rows, now - started)
+            last_report = now
+    return rows, time.perf_counter() - started
+
+
+def _report(rows, seconds):
+    rate = rows / seconds if seconds else 0.0
+    print(f"{rows} rows in {seconds:.1f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+
+def _parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sessions or feedback as CSV or JSON Lines.")
+    parser.add_argument("dataset", choices=["sessions", "feedback"])
+    parser.add_argument("--from", dest="from_date", type=_parse_date, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_date", type=_parse_date, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--employee", help="Account id or username prefix (sessions only)")
+    parser.add_argument("--mood", default="All", help="Mood filter (feedback only)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output")
+    parser.add_argument("-o", "--output", default="-", help="Output file, or - for stdout")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    if bool(args.from_date) != bool(args.to_date):
+        parser.error("--from and --to must be given together")
+    # Not applied to the other dataset rather than silently ignored; feedback
+    # is not filtered by author because anonymous feedback must stay so.
+    if args.dataset == "feedback" and args.employee:
+        parser.error("--employee applies to sessions only")
+    if args.dataset == "sessions" and args.mood != "All":
+        parser.error("--mood applies to feedback only")
+
+    if args.dataset == "sessions":
+        employee = args.employee
+        if employee and employee.isdigit():
+            employee = int(employee)
+        records = session_records(args.from_date, args.to_date, employee, args.chunk_size)
+        columns = SESSION_COLUMNS
+    else:
+        records = feedback_records(args.from_date, args.to_date, args.mood, chunk_size=args.chunk_size)
+        columns = FEEDBACK_COLUMNS
+
+    stream = open_output(args.output, args.gzip)
+    try:
+        rows, seconds = export(records, stream, columns, args.format, progress=_report)
+    finally:
+        stream.close()
+    _report(rows, seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+# feedback_index.py
+"""
+Token-based inverted index over feedback comments and usernames.
+
+Keyword search used `LIKE '%kw%'` on both columns, which scans the whole
+feedback table. Instead, each feedback id is posted under the lowercase
+word tokens of its comment and of its author's username. A query matches
+feedback that has, for every query term, some token starting with that term
+(prefix match, multi-term AND). The resulting ids are then combined with
+the mood and date filters in SQL.
+
+The index catches up with the table by reading rows whose row_version is
+at or above its watermark, so feedback written by any client is picked up.
+The watermark is MIN_ACTIVE_ROWVERSION() (see WATERMARK_SQL in queries.py)
+rather than the highest id seen: identity values are handed out at insert
+but committed in any order, so a row with a lower id can appear after a
+higher one has been indexed. It is saved in a compact binary file (delta +
+varint encoded postings) and reloaded on start, so a restart only fetches
+what was added since the last save; a file that does not decode is ignored
+and the index rebuilt from the table.
+"""
+import atexit
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from database.db_connection import pooled_connection
+from utils.local_storage import data_path
+
+INDEX_FILENAME = "feedback_index.bin"
+MAGIC = b"FBIX"
+FORMAT_VERSION = 2
+HEADER = "<H8sI"   # version, row_version watermark, token count
+
+# Run behind WATERMARK_SQL, which sets @watermark.
+SYNC_SQL = """
+    SELECT f.id, a.username, f.comment
+    FROM feedback f
+    LEFT JOIN accounts a ON f.account_id = a.id
+    WHERE f.row_version >= ? AND f.row_version < @watermark
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+class FeedbackIndex:
+    def __init__(self, path, sync_interval=2.0, save_interval=30.0, fetch_size=5000):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.save_interval = save_interval
+        self.fetch_size = fetch_size
+
+        self._lock = threading.RLock()
+        self._postings = {}     # token -> array('I') of feedback ids, ascending
+        self._vocabulary = []   # sorted tokens, for prefix lookups
+        self.watermark = bytes(8)   # every feedback row_version below it has been indexed
+        self._last_sync = 0.0
+        self._last_save = time.monotonic()
+        self._dirty = False
+
+        self.load()
+
+    # --- Maintenance ---------------------------------------------------
+
+    def add(self, feedback_id, username, comment):
+        """Index one feedback row. Adding the same row again is a no-op."""
+        with self._lock:
+            for token in set(tokenize(username)) | set(tokenize(comment)):
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = array("I")
+                    insort(self._vocabulary, token)
+                if not posting or posting[-1] < feedback_id:
+                    posting.append(feedback_id)
+                else:
+                    position = bisect_left(posting, feedback_id)
+                    if position == len(posting) or posting[position] != feedback_id:
+                        posting.insert(position, feedback_id)
+            self._dirty = True
+
+    def sync(self, force=False):
+        """Index feedback rows written since the watermark. Throttled to once per sync_interval."""
+        from database.queries import WATERMARK_SQL
+
+        with self._lock:
+            if not force and time.monotonic() - self._last_sync < self.sync_interval:
+                return
+            with pooled_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(WATERMARK_SQL + SYNC_SQL, (self.watermark,))
+                watermark = cursor.fetchone()[0]
+                cursor.nextset()
+                while True:
+                    rows = cursor.fetchmany(self.fetch_size)
+                    if not rows:
+                        break
+                    for feedback_id, username, comment in rows:
+                        self.add(feedback_id, username, comment)
+            # Only once every row is in: an interrupted sync starts over from
+            # the old watermark, and add() ignores rows it already has.
+            self.watermark = bytes(watermark)
+            self._last_sync = time.monotonic()
+            if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+                self.save()
+
+    # --- Queries -------------------------------------------------------
+
+    def search(self, query):
+        """Ids matching every term of `query` as a token prefix, newest first."""
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return []
+        with self._lock:
+            result = None
+            for term in terms:
+                matches = self._prefix_matches(term)
+                result = matches if result is None else result & matches
+                if not result:
+                    return []
+        return sorted(result, reverse=True)
+
+    def _prefix_matches(self, term):
+        matches = set()
+        position = bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+            matches.update(self._postings[self._vocabulary[position]])
+            position += 1
+        return matches
+
+    # --- Persistence ---------------------------------------------------
+
+    def save(self):
+        with self._lock:
+            chunks = [MAGIC, struct.pack(HEADER, FORMAT_VERSION, self.watermark, len(self._vocabulary))]
+            for token in self._vocabulary:
+                encoded = token.encode("utf-8")
+                posting = self._postings[token]
+                chunks.append(_varint(len(encoded)))
+                chunks.append(encoded)
+                chunks.append(_varint(len(posting)))
+                previous = 0
+                buffer = bytearray()
+                for feedback_id in posting:
+                    buffer += _varint(feedback_id - previous)
+                    previous = feedback_id
+                chunks.append(bytes(buffer))
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(b"".join(chunks))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            data = file.read()
+        if data[:4] != MAGIC:
+            return
+        postings = {}
+        try:
+            version, watermark, token_count = struct.unpack_from(HEADER, data, 4)
+            if version != FORMAT_VERSION:
+                return
+            offset = 4 + struct.calcsize(HEADER)
+            for _ in range(token_count):
+                length, offset = _read_varint(data, offset)
+                token = data[offset:offset + length].decode("utf-8")
+                offset += length
+                count, offset = _read_varint(data, offset)
+                posting = array("I")
+                previous = 0
+                for _ in range(count):
+                    delta, offset = _read_varint(data, offset)
+                    previous += delta
+                    posting.append(previous)
+                postings[token] = posting
+            if offset != len(data):
+                return  # trailing bytes: not a file save() wrote
+        except (IndexError, UnicodeDecodeError, struct.error, OverflowError):
+            return  # damaged file: rebuild from the table
+
+        with self._lock:
+            self._postings = postings
+            self._vocabulary = sorted(postings)
+            self.watermark = watermark
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokens": len(self._vocabulary),
+                "postings": sum(len(posting) for posting in self._postings.values()),
+                "watermark": self.watermark.hex(),
+            }
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def get_feedback_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FeedbackIndex(data_path(INDEX_FILENAME))
+    return _index
+
+
+def loaded_feedback_index():
+    """The index if this process has opened it, else None (employee clients never build it)."""
+    return _index
+
+
+def search_feedback_ids(keyword):
+    """Matching feedback ids, or None if the index cannot be brought up to date."""
+    try:
+        index = get_feedback_index()
+        index.sync()
+    except Exception:
+        return None
+    return index.search(keyword)
+
+
+def _save_on_exit():
+    if _index is not None and _index._dirty:
+        _index.save()
+
+
+atexit.register(_save_on_exit)
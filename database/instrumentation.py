@@ -0,0 +1,400 @@
+# instrumentation.py
+"""
+Per-query latency histograms and a slow-query log.
+
+Off unless config/db_config.json enables it:
+
+    "instrumentation": {"enabled": true, "slow_query_ms": 500,
+                        "slow_log_max_bytes": 1048576, "slow_log_backups": 3}
+
+While enabled, every connection borrowed through pooled_connection() is
+wrapped. The time to get the connection is recorded as `connect`; each
+statement's `execute` and `fetch` time and its row count are recorded
+under the name of the function that issued it (e.g. fetch_all_sessions,
+refresh_sleep_minutes). A statement whose execute plus fetch time reaches
+slow_query_ms is written to slow_queries.log in the local data directory,
+with the shape of its parameters but never their values. The GUI adds the
+time its result callbacks take as `render`. snapshot() returns everything
+recorded so far; dump() writes it as JSON, and install_dump_signal() does
+so on SIGUSR1 (SIGBREAK, i.e. Ctrl+Break, on Windows).
+
+While disabled, pooled_connection() only checks one module attribute.
+"""
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from database import db_connection
+from utils.local_storage import data_path
+
+SLOW_LOG_FILENAME = "slow_queries.log"
+DEFAULTS = {
+    "enabled": False,
+    "slow_query_ms": 500,
+    "slow_log_max_bytes": 1 << 20,
+    "slow_log_backups": 3,
+}
+
+# Upper bounds of the histogram buckets: milliseconds from 0.1 ms to about
+# 100 s, rows from 1 to about a million, doubling each step.
+LATENCY_BOUNDS = [0.1 * 2 ** step for step in range(21)]
+ROW_BOUNDS = [2 ** step for step in range(21)]
+
+_WHITESPACE = re.compile(r"\s+")
+_SQL_PREVIEW = 500
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("database.slow_queries")
+
+_stats = {}
+_stats_lock = threading.Lock()
+_slow_query_ms = DEFAULTS["slow_query_ms"]
+_slow_queries = 0
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are reported as the bucket's upper bound."""
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[bucket] if bucket < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3),
+            "min": round(self.min, 3),
+            "max": round(self.max, 3),
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+        }
+
+
+class QueryStats:
+    __slots__ = ("connect", "execute", "fetch", "rows", "render", "errors")
+
+    def __init__(self):
+        self.connect = Histogram(LATENCY_BOUNDS)
+        self.execute = Histogram(LATENCY_BOUNDS)
+        self.fetch = Histogram(LATENCY_BOUNDS)
+        self.rows = Histogram(ROW_BOUNDS)
+        self.render = Histogram(LATENCY_BOUNDS)
+        self.errors = 0
+
+    def snapshot(self):
+        histograms = {
+            "connect_ms": self.connect, "execute_ms": self.execute, "fetch_ms": self.fetch,
+            "rows": self.rows, "render_ms": self.render,
+        }
+        result = {label: histogram.snapshot() for label, histogram in histograms.items() if histogram.count}
+        result["errors"] = self.errors
+        return result
+
+
+def _query_stats(name):
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = QueryStats()
+    return stats
+
+
+def param_shape(params):
+    """Types (and string lengths) of a statement's parameters, never their values."""
+    if not params:
+        return "()"
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        params = params[0]
+    shapes = []
+    for value in params:
+        if isinstance(value, str):
+            shapes.append(f"str[{len(value)}]")
+        elif isinstance(value, (list, tuple)):
+            shapes.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            shapes.append(type(value).__name__)
+    return f"({', '.join(shapes)})"
+
+
+class _Statement:
+    __slots__ = ("name", "sql", "shape", "execute", "fetch", "rows", "fetched")
+
+    def __init__(self, name, sql, shape, execute):
+        self.name = name
+        self.sql = sql
+        self.shape = shape
+        self.execute = execute
+        self.fetch = 0.0
+        self.rows = 0
+        self.fetched = False
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute and fetch calls and counts rows."""
+    def __init__(self, cursor, name):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_statement", None)
+
+    def __getattr__(self, attribute):
+        return getattr(self._cursor, attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._cursor, attribute, value)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def execute(self, sql, *params):
+        return self._run(self._cursor.execute, sql, params, param_shape(params))
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        shape = f"{len(rows)} x {param_shape(rows[0]) if rows else '()'}"
+        return self._run(self._cursor.executemany, sql, (rows,), shape)
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *size):
+        rows = self._fetch(self._cursor.fetchmany, *size)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._count(len(rows))
+        return rows
+
+    def close(self):
+        self.finish()
+        self._cursor.close()
+
+    def finish(self):
+        """Record the statement in flight, if any."""
+        statement = self._statement
+        if statement is None:
+            return
+        object.__setattr__(self, "_statement", None)
+        if not statement.fetched:
+            statement.rows = max(self._cursor.rowcount, 0)
+        _record_statement(statement)
+
+    def _run(self, method, sql, params, shape):
+        self.finish()
+        started = time.perf_counter()
+        try:
+            result = method(sql, *params)
+        except Exception:
+            with _stats_lock:
+                _query_stats(self._name).errors += 1
+            raise
+        statement = _Statement(self._name, sql, shape, time.perf_counter() - started)
+        object.__setattr__(self, "_statement", statement)
+        return self if result is self._cursor else result
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        statement = self._statement
+        if statement is not None:
+            statement.fetch += time.perf_counter() - started
+            statement.fetched = True
+        return result
+
+    def _count(self, rows):
+        if self._statement is not None:
+            self._statement.rows += rows
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are instrumented under the borrower's name."""
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+        self._cursors = []
+
+    def __getattr__(self, attribute):
+        return getattr(self._connection, attribute)
+
+    def cursor(self):
+        cursor = InstrumentedCursor(self._connection.cursor(), self._name)
+        self._cursors.append(cursor)
+        return cursor
+
+    def finish(self):
+        for cursor in self._cursors:
+            cursor.finish()
+        self._cursors.clear()
+
+
+def _record_statement(statement):
+    global _slow_queries
+    execute_ms = statement.execute * 1000
+    fetch_ms = statement.fetch * 1000
+    with _stats_lock:
+        stats = _query_stats(statement.name)
+        stats.execute.record(execute_ms)
+        stats.fetch.record(fetch_ms)
+        stats.rows.record(statement.rows)
+        slow = execute_ms + fetch_ms >= _slow_query_ms
+        if slow:
+            _slow_queries += 1
+    if slow:
+        sql = _WHITESPACE.sub(" ", statement.sql).strip()
+        if len(sql) > _SQL_PREVIEW:
+            sql = sql[:_SQL_PREVIEW] + "..."
+        slow_logger.warning(
+            "%.1f ms %s (execute %.1f ms, fetch %.1f ms, %d rows) params %s: %s",
+            execute_ms + fetch_ms, statement.name, execute_ms, fetch_ms, statement.rows, statement.shape, sql
+        )
+
+
+def _borrower_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module.rsplit('.', 1)[-1]}.{code.co_name}"
+
+
+def _instrumented_borrow(pool, timeout, query_timeout):
+    # Called from pooled_connection(), so two frames up is the query function.
+    return _borrow(pool, timeout, query_timeout, _borrower_name(sys._getframe(2)))
+
+
+@contextmanager
+def _borrow(pool, timeout, query_timeout, name):
+    started = time.perf_counter()
+    with pool.connection(timeout, query_timeout) as conn:
+        connect_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            _query_stats(name).connect.record(connect_ms)
+        wrapped = InstrumentedConnection(conn, name)
+        try:
+            yield wrapped
+        finally:
+            wrapped.finish()
+
+
+def record_render(name, seconds):
+    """Time the GUI spent putting a query's result on screen (see gui.workers)."""
+    with _stats_lock:
+        _query_stats(f"render.{name}").render.record(seconds * 1000)
+
+
+def is_enabled():
+    return db_connection._borrow_hook is not None
+
+
+def enable(slow_query_ms=None, log_path=None, max_bytes=None, backups=None):
+    """Start instrumenting borrowed connections; unset arguments come from the config."""
+    global _slow_query_ms
+    settings = dict(DEFAULTS)
+    settings.update(db_connection.load_db_config().get("instrumentation", {}))
+    _slow_query_ms = settings["slow_query_ms"] if slow_query_ms is None else slow_query_ms
+
+    if not slow_logger.handlers:
+        handler = logging.handlers.RotatingFileHandler(
+            log_path or data_path(SLOW_LOG_FILENAME),
+            maxBytes=settings["slow_log_max_bytes"] if max_bytes is None else max_bytes,
+            backupCount=settings["slow_log_backups"] if backups is None else backups,
+            encoding="utf-8", delay=True,
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_logger.addHandler(handler)
+        slow_logger.propagate = False
+    db_connection._borrow_hook = _instrumented_borrow
+
+
+def disable():
+    db_connection._borrow_hook = None
+
+
+def configure():
+    """Enable instrumentation if the config asks for it; returns whether it is on."""
+    if db_connection.load_db_config().get("instrumentation", {}).get("enabled", DEFAULTS["enabled"]):
+        enable()
+        install_dump_signal()
+    return is_enabled()
+
+
+def snapshot():
+    """Histograms per query name, plus the number of slow statements logged."""
+    with _stats_lock:
+        queries = {name: stats.snapshot() for name, stats in sorted(_stats.items())}
+        slow = _slow_queries
+    return {
+        "taken_at": datetime.now().isoformat(timespec="seconds"),
+        "enabled": is_enabled(),
+        "slow_query_ms": _slow_query_ms,
+        "slow_queries": slow,
+        "queries": queries,
+    }
+
+
+def reset():
+    global _slow_queries
+    with _stats_lock:
+        _stats.clear()
+        _slow_queries = 0
+
+
+def dump(path=None):
+    """Write snapshot() as JSON (default: query_stats_<pid>.json in the data directory); returns the path."""
+    path = path or data_path(f"query_stats_{os.getpid()}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(snapshot(), file, indent=2)
+        file.write("\n")
+    return path
+
+
+def install_dump_signal():
+    """dump() on SIGUSR1, or SIGBREAK on Windows; returns the signal, or None if there is none."""
+    signum = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return None
+
+    def handle(signum, frame):
+        try:
+            logger.info("Query statistics written to %s", dump())
+        except OSError:
+            logger.exception("Could not write query statistics")
+
+    signal.signal(signum, handle)
+    return signum
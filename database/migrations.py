@@ -0,0 +1,356 @@
+# migrations.py
+"""
+Versioned schema migrations.
+
+    python -m database.migrations status
+    python -m database.migrations upgrade [--target N]
+    python -m database.migrations check-plans
+
+Each migration runs in its own transaction together with the row that
+records it in schema_migrations, so a failed step leaves nothing half
+applied. Table and index creation is guarded, so the first migrations also
+apply cleanly to databases created by hand before this module existed.
+"""
+import argparse
+import sys
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timedelta
+
+from database.db_connection import pooled_connection, set_query_timeout
+
+
+def _create_table(name, body):
+    return f"IF OBJECT_ID(N'{name}', N'U') IS NULL CREATE TABLE {name} ({body})"
+
+
+def _create_index(name, table, definition):
+    return (
+        f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'{name}' "
+        f"AND object_id = OBJECT_ID(N'{table}')) "
+        f"CREATE INDEX {name} ON {table} {definition}"
+    )
+
+
+def _add_column(table, column, definition):
+    return f"IF COL_LENGTH(N'{table}', N'{column}') IS NULL ALTER TABLE {table} ADD {column} {definition}"
+
+
+MIGRATIONS = [
+    (1, "Base tables", [
+        _create_table("accounts", """
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            username NVARCHAR(100) NOT NULL,
+            password NVARCHAR(255) NOT NULL,
+            role NVARCHAR(20) NOT NULL,
+            is_active BIT NOT NULL DEFAULT 0
+        """),
+        _create_table("sessions", """
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            account_id INT NOT NULL REFERENCES accounts(id),
+            clock_in DATETIME NOT NULL,
+            clock_out DATETIME NULL,
+            session_date DATE NOT NULL,
+            total_work_minutes INT NULL
+        """),
+        _create_table("sleep_events", """
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            account_id INT NOT NULL REFERENCES accounts(id),
+            session_id INT NOT NULL REFERENCES sessions(id),
+            event_type NVARCHAR(10) NOT NULL,
+            event_time DATETIME NOT NULL,
+            source NVARCHAR(10) NOT NULL DEFAULT 'system'
+        """),
+        _create_table("feedback", """
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            account_id INT NULL REFERENCES accounts(id),
+            mood NVARCHAR(20) NOT NULL,
+            comment NVARCHAR(MAX) NULL,
+            is_anonymous BIT NOT NULL DEFAULT 0,
+            submitted_at DATETIME NOT NULL DEFAULT GETDATE()
+        """),
+    ]),
+    (2, "Stored sleep minutes per session", [
+        _add_column("sessions", "sleep_minutes", "INT NULL"),
+    ]),
+    (3, "Indexes for the hot queries", [
+        # end_session, refresh_sleep_minutes, insert_sleep_events' duplicate probe
+        _create_index("IX_sleep_events_session_time", "sleep_events",
+                      "(session_id, event_time) INCLUDE (event_type, source)"),
+        # Admin listing and its keyset pages
+        _create_index("IX_sessions_date_clock_in", "sessions",
+                      "(session_date DESC, clock_in DESC, id DESC) "
+                      "INCLUDE (account_id, clock_out, total_work_minutes, sleep_minutes)"),
+        # Employee filter by account id, delete_user
+        _create_index("IX_sessions_account_date", "sessions",
+                      "(account_id, session_date DESC, clock_in DESC) "
+                      "INCLUDE (clock_out, total_work_minutes, sleep_minutes)"),
+        # session_tracker.clock_out's open-session lookup
+        _create_index("IX_sessions_open", "sessions",
+                      "(account_id, clock_in DESC) WHERE clock_out IS NULL"),
+        # Feedback listing by date and its keyset pages
+        _create_index("IX_feedback_submitted_at", "feedback",
+                      "(submitted_at DESC, id DESC) INCLUDE (account_id, mood, is_anonymous)"),
+        _create_index("IX_feedback_account", "feedback", "(account_id)"),
+        # Login and the username-prefix employee filter
+        _create_index("IX_accounts_username", "accounts",
+                      "(username) INCLUDE (password, role, is_active)"),
+    ]),
+    (4, "Resumable user purge jobs", [
+        # No foreign key: the job row outlives the account it purged.
+        _create_table("user_purge_jobs", """
+            account_id INT PRIMARY KEY,
+            username NVARCHAR(100) NOT NULL,
+            stage NVARCHAR(20) NOT NULL,
+            deleted_rows BIGINT NOT NULL DEFAULT 0,
+            requested_at DATETIME NOT NULL DEFAULT GETDATE(),
+            updated_at DATETIME NOT NULL DEFAULT GETDATE(),
+            finished_at DATETIME NULL
+        """),
+    ]),
+    (5, "Archive tables for old sessions and sleep events", [
+        # No foreign keys: rows are moved in with DELETE ... OUTPUT INTO,
+        # which cannot target a table that takes part in one.
+        _create_table("sessions_archive", """
+            id INT PRIMARY KEY,
+            account_id INT NOT NULL,
+            clock_in DATETIME NOT NULL,
+            clock_out DATETIME NULL,
+            session_date DATE NOT NULL,
+            total_work_minutes INT NULL,
+            sleep_minutes INT NULL
+        """),
+        _create_table("sleep_events_archive", """
+            id INT PRIMARY KEY,
+            account_id INT NOT NULL,
+            session_id INT NOT NULL,
+            event_type NVARCHAR(10) NOT NULL,
+            event_time DATETIME NOT NULL,
+            source NVARCHAR(10) NOT NULL
+        """),
+        _create_table("archive_state", """
+            name NVARCHAR(50) PRIMARY KEY,
+            horizon DATE NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT GETDATE()
+        """),
+        # Same shapes as the hot table's listing indexes, so the UNION ALL
+        # the fetch functions use past the horizon seeks on both sides.
+        _create_index("IX_sessions_archive_date_clock_in", "sessions_archive",
+                      "(session_date DESC, clock_in DESC, id DESC) "
+                      "INCLUDE (account_id, clock_out, total_work_minutes, sleep_minutes)"),
+        _create_index("IX_sessions_archive_account_date", "sessions_archive",
+                      "(account_id, session_date DESC, clock_in DESC) "
+                      "INCLUDE (clock_out, total_work_minutes, sleep_minutes)"),
+        _create_index("IX_sleep_events_archive_session_time", "sleep_events_archive",
+                      "(session_id, event_time) INCLUDE (event_type, source)"),
+    ]),
+    (6, "Daily and weekly rollups per employee", [
+        # No foreign keys, like the archive: purging an account deletes its
+        # rollup rows in batches before the account row goes.
+        _create_table("daily_rollups", """
+            account_id INT NOT NULL,
+            day DATE NOT NULL,
+            sessions INT NOT NULL,
+            work_minutes INT NOT NULL,
+            sleep_minutes INT NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT GETDATE(),
+            PRIMARY KEY (account_id, day)
+        """),
+        _create_table("weekly_rollups", """
+            account_id INT NOT NULL,
+            iso_year SMALLINT NOT NULL,
+            iso_week TINYINT NOT NULL,
+            week_start DATE NOT NULL,
+            sessions INT NOT NULL,
+            work_minutes INT NOT NULL,
+            sleep_minutes INT NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT GETDATE(),
+            PRIMARY KEY (account_id, iso_year, iso_week)
+        """),
+        # The summary view's date range; the primary keys cover one employee.
+        _create_index("IX_daily_rollups_day", "daily_rollups",
+                      "(day) INCLUDE (sessions, work_minutes, sleep_minutes)"),
+        _create_index("IX_weekly_rollups_week_start", "weekly_rollups",
+                      "(week_start) INCLUDE (iso_year, iso_week, sessions, work_minutes, sleep_minutes)"),
+    ]),
+    (7, "Row versions for the dashboard's change queries", [
+        # Adding a ROWVERSION column writes every existing row once.
+        _add_column("sessions", "row_version", "ROWVERSION"),
+        _add_column("feedback", "row_version", "ROWVERSION"),
+        # fetch_session_changes, fetch_feedback_changes: a poll reads only
+        # the few rows past its watermark.
+        _create_index("IX_sessions_row_version", "sessions", "(row_version)"),
+        _create_index("IX_feedback_row_version", "feedback", "(row_version)"),
+    ]),
+]
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(_create_table("schema_migrations", """
+        version INT PRIMARY KEY,
+        description NVARCHAR(200) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT GETDATE()
+    """))
+
+
+def applied_versions():
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        _ensure_version_table(cursor)
+        conn.commit()
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(target=None):
+    applied = applied_versions()
+    return [
+        migration for migration in MIGRATIONS
+        if migration[0] not in applied and (target is None or migration[0] <= target)
+    ]
+
+
+def upgrade(target=None, log=print):
+    """Apply pending migrations in version order; returns the versions applied."""
+    applied = []
+    for version, description, statements in pending_migrations(target):
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        log(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+# --- Plan checks -----------------------------------------------------------
+
+SHOWPLAN_NS = {"p": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+SCAN_OPERATORS = {"Table Scan", "Clustered Index Scan", "Index Scan"}
+
+
+def hot_queries():
+    """(name, sql, params, table that must be reached by a seek) for each hot query."""
+    from database import queries
+    from database.feedback_index import SYNC_SQL
+
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+    now = datetime.now()
+
+    sessions_sql, sessions_params = queries.build_sessions_page_query(month_ago, today)
+    next_sql, next_params = queries.build_sessions_page_query(after=(today, now, 2 ** 31 - 1))
+    employee_sql, employee_params = queries.build_sessions_page_query(employee=1)
+    feedback_sql, feedback_params = queries.build_feedback_page_query(month_ago, today)
+    feedback_next_sql, feedback_next_params = queries.build_feedback_page_query(after=(now, 2 ** 31 - 1))
+    # A poll that finds nothing new, the usual case. The change queries
+    # read @watermark, so they run behind WATERMARK_SQL as they do live.
+    newest = b"\xff" * 8
+    session_changes_sql, session_changes_params = queries.build_session_changes_query(newest, month_ago, today)
+    feedback_changes_sql, feedback_changes_params = queries.build_feedback_changes_query(newest, month_ago, today)
+
+    return [
+        ("sessions by date range", sessions_sql, sessions_params, "sessions"),
+        ("sessions next page", next_sql, next_params, "sessions"),
+        ("sessions by account", employee_sql, employee_params, "sessions"),
+        ("sleep events of a session", queries.SESSION_EVENTS_SQL, [1], "sleep_events"),
+        # Clocks account 1 in if it has no open session; check_plans rolls it back.
+        ("open session of an account", queries.OPEN_SESSION_SQL, [1, now, today], "sessions"),
+        ("feedback by date range", feedback_sql, feedback_params, "feedback"),
+        ("feedback next page", feedback_next_sql, feedback_next_params, "feedback"),
+        ("sessions changed since a watermark", queries.WATERMARK_SQL + session_changes_sql,
+         session_changes_params, "sessions"),
+        ("feedback changed since a watermark", queries.WATERMARK_SQL + feedback_changes_sql,
+         feedback_changes_params, "feedback"),
+        ("feedback index sync", queries.WATERMARK_SQL + SYNC_SQL, [newest], "feedback"),
+        ("daily rollups by date range",
+         "SELECT account_id, sessions, work_minutes, sleep_minutes FROM daily_rollups "
+         "WHERE day >= ? AND day <= ?",
+         [month_ago, today], "daily_rollups"),
+    ]
+
+
+def scanned_tables(plan_xml):
+    """Tables read by a scan operator in an XML showplan."""
+    tables = set()
+    root = ET.fromstring(plan_xml)
+    for rel_op in root.iter(f"{{{SHOWPLAN_NS['p']}}}RelOp"):
+        if rel_op.get("PhysicalOp") not in SCAN_OPERATORS:
+            continue
+        for child in rel_op:
+            obj = child.find("p:Object", SHOWPLAN_NS)
+            if obj is not None and obj.get("Table"):
+                tables.add(obj.get("Table").strip("[]").lower())
+    return tables
+
+
+def _actual_plans(cursor, sql, params):
+    """The showplan of every statement in the batch, in order."""
+    plans = []
+    cursor.execute("SET STATISTICS XML ON")
+    try:
+        cursor.execute(sql, params)
+        while True:
+            if cursor.description and cursor.description[0][0].startswith("Microsoft SQL Server"):
+                plans.append(cursor.fetchone()[0])
+            if not cursor.nextset():
+                return plans
+    finally:
+        cursor.execute("SET STATISTICS XML OFF")
+
+
+def check_plans(log=print):
+    """Run every hot query with its actual plan captured; returns the names that regressed to a scan."""
+    failures = []
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for name, sql, params, table in hot_queries():
+            # A batch returns a plan per statement; the table may be read by any of them.
+            plans = _actual_plans(cursor, sql, params)
+            conn.rollback()
+            if not plans:
+                failures.append(name)
+                log(f"FAIL  {name}: no plan returned")
+            elif any(table in scanned_tables(plan) for plan in plans):
+                failures.append(name)
+                log(f"FAIL  {name}: scans {table}")
+            else:
+                log(f"ok    {name}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the database schema.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("status", help="List applied and pending migrations")
+    upgrade_parser = subcommands.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, help="Stop after this version")
+    subcommands.add_parser("check-plans", help="Fail if a hot query's plan scans its table")
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    if args.command == "status":
+        applied = applied_versions()
+        for version, description, _ in MIGRATIONS:
+            print(f"{'applied' if version in applied else 'pending'}  {version:>3}  {description}")
+    elif args.command == "upgrade":
+        if not upgrade(args.target):
+            print("Schema is up to date.")
+    elif args.command == "check-plans":
+        failures = check_plans()
+        if failures:
+            print(f"{len(failures)} hot quer{'y' if len(failures) == 1 else 'ies'} regressed to a scan")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+# purge.py
+"""
+Chunked, resumable removal of a user and everything they recorded.
+
+    python -m database.purge user ID [--batch-size N]
+    python -m database.purge resume
+    python -m database.purge status
+
+Purging first disables the account and records a job in user_purge_jobs
+(migration 4), which also hides the account from the user list. Sleep
+events, sessions, feedback, their archived copies and the account's
+rollups are then deleted in batches of batch_size rows. Each batch commits
+together with the job's progress, so no transaction holds many locks or
+much log, and a purge that is interrupted continues where it stopped the
+next time resume_purges() runs. The account row goes last.
+
+Writes for an account with an unfinished purge job are refused
+(open_session, insert_sleep_events, insert_feedback), but one that passed
+that check just before the job was recorded can still land after its stage
+finished.
+So the account row is only deleted once none of its rows are left; if
+some are, or the delete still hits a foreign key, the stages run again.
+
+A session-scoped application lock per account keeps two clients from
+working on the same purge at once.
+"""
+import argparse
+import sys
+import time
+
+import pyodbc
+
+from database.db_connection import pooled_connection, set_query_timeout
+from database.query_cache import invalidate
+
+# Below SQL Server's 5000-lock escalation threshold.
+DEFAULT_BATCH_SIZE = 4000
+
+# (stage, statement deleting one batch for an account)
+STAGES = [
+    ("sleep_events", """
+        DELETE TOP (?) FROM sleep_events
+        WHERE session_id IN (SELECT id FROM sessions WHERE account_id = ?)
+    """),
+    ("sessions", "DELETE TOP (?) FROM sessions WHERE account_id = ?"),
+    ("feedback", "DELETE TOP (?) FROM feedback WHERE account_id = ?"),
+    ("sleep_events_archive", """
+        DELETE TOP (?) FROM sleep_events_archive
+        WHERE session_id IN (SELECT id FROM sessions_archive WHERE account_id = ?)
+    """),
+    ("sessions_archive", "DELETE TOP (?) FROM sessions_archive WHERE account_id = ?"),
+    ("daily_rollups", "DELETE TOP (?) FROM daily_rollups WHERE account_id = ?"),
+    ("weekly_rollups", "DELETE TOP (?) FROM weekly_rollups WHERE account_id = ?"),
+]
+STAGE_NAMES = [name for name, _ in STAGES]
+# Data each stage removes from the cached query results.
+STAGE_TAGS = {"sleep_events": "sessions", "sessions": "sessions", "feedback": "feedback",
+              "sleep_events_archive": "sessions", "sessions_archive": "sessions",
+              "daily_rollups": "rollups", "weekly_rollups": "rollups"}
+
+DONE = "done"
+
+# Whether anything a stage deletes is still there. Every table the stages
+# touch has an index leading with account_id; sleep events only exist
+# with their session, so the session tables stand in for them.
+LEFTOVERS_SQL = "SELECT CASE WHEN " + " OR ".join(
+    f"EXISTS (SELECT 1 FROM {table} WHERE account_id = ?)"
+    for table in ("sessions", "feedback", "sessions_archive", "daily_rollups", "weekly_rollups")
+) + " THEN 1 ELSE 0 END"
+
+
+class PurgeBusy(Exception):
+    """Another connection is already running this purge."""
+
+
+def start_purges(user_ids):
+    """Disable the accounts and record their purge jobs in one transaction; returns jobs created."""
+    ids = ",".join(str(int(user_id)) for user_id in user_ids)
+    selected = "SELECT CAST(value AS INT) FROM STRING_SPLIT(?, ',')"
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"UPDATE accounts SET is_active = 0 WHERE id IN ({selected})", (ids,))
+            cursor.execute(f"""
+                INSERT INTO user_purge_jobs (account_id, username, stage)
+                SELECT a.id, a.username, ?
+                FROM accounts a
+                WHERE a.id IN ({selected})
+                  AND NOT EXISTS (SELECT 1 FROM user_purge_jobs p WHERE p.account_id = a.id)
+            """, (STAGE_NAMES[0], ids))
+            created = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    invalidate("users")
+    return created
+
+
+def run_purge(account_id, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Carry a recorded purge job to the end. progress(username, stage,
+    deleted_rows) is called after every batch. Returns the rows deleted in
+    total, or None if there is no unfinished job for the account.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DECLARE @result INT;
+            EXEC @result = sp_getapplock @Resource = ?, @LockMode = 'Exclusive',
+                                         @LockOwner = 'Session', @LockTimeout = 0;
+            SELECT @result;
+        """, (f"user_purge:{account_id}",))
+        if cursor.fetchone()[0] < 0:
+            raise PurgeBusy(f"Account {account_id} is already being purged")
+        try:
+            return _run_locked(conn, cursor, account_id, batch_size, progress)
+        finally:
+            cursor.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'",
+                           (f"user_purge:{account_id}",))
+            conn.commit()
+
+
+def _run_locked(conn, cursor, account_id, batch_size, progress):
+    cursor.execute("""
+        SELECT username, stage, deleted_rows FROM user_purge_jobs
+        WHERE account_id = ? AND finished_at IS NULL
+    """, (account_id,))
+    job = cursor.fetchone()
+    if job is None:
+        return None
+    username, stage, deleted = job
+
+    statements = dict(STAGES)
+    while stage != DONE:
+        try:
+            if stage in statements:
+                cursor.execute(statements[stage], (batch_size, account_id))
+                removed = cursor.rowcount
+                next_stage = stage if removed == batch_size else _after(stage)
+            else:  # "account"
+                removed, next_stage = _delete_account(conn, cursor, account_id)
+            cursor.execute("""
+                UPDATE user_purge_jobs
+                SET stage = ?, deleted_rows = deleted_rows + ?, updated_at = GETDATE(),
+                    finished_at = CASE WHEN ? = 'done' THEN GETDATE() END
+                WHERE account_id = ?
+            """, (next_stage, removed, next_stage, account_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        deleted += removed
+        if next_stage != stage and stage in STAGE_TAGS:
+            invalidate(STAGE_TAGS[stage])
+        stage = next_stage
+        if progress:
+            progress(username, stage, deleted)
+
+    invalidate("users")
+    return deleted
+
+
+def _delete_account(conn, cursor, account_id):
+    """Delete the account row if nothing of it is left; returns (rows deleted, next stage)."""
+    cursor.execute(LEFTOVERS_SQL, (account_id,) * LEFTOVERS_SQL.count("?"))
+    if not cursor.fetchone()[0]:
+        try:
+            cursor.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+            return cursor.rowcount, DONE
+        except pyodbc.IntegrityError:
+            conn.rollback()  # a row written after the check; go round again
+    return 0, STAGE_NAMES[0]
+
+
+def _after(stage):
+    position = STAGE_NAMES.index(stage)
+    return STAGE_NAMES[position + 1] if position + 1 < len(STAGE_NAMES) else "account"
+
+
+def purge_users(user_ids, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Disable the accounts at once, then purge them one after another; returns rows deleted."""
+    user_ids = list(user_ids)
+    start_purges(user_ids)
+    if progress:
+        progress(None, "disabled", 0)
+    total = 0
+    for user_id in user_ids:
+        total += run_purge(user_id, batch_size, progress) or 0
+    return total
+
+
+def purge_user(user_id, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    return purge_users([user_id], batch_size, progress)
+
+
+def unfinished_purges():
+    """(account_id, username, stage, deleted_rows) of every purge that has not finished."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT account_id, username, stage, deleted_rows FROM user_purge_jobs
+            WHERE finished_at IS NULL
+            ORDER BY requested_at
+        """)
+        return cursor.fetchall()
+
+
+def resume_purges(batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Finish purges left behind by a crash or a closed window; returns how many completed."""
+    completed = 0
+    for account_id, *_ in unfinished_purges():
+        try:
+            if run_purge(account_id, batch_size, progress) is not None:
+                completed += 1
+        except PurgeBusy:
+            continue  # someone else is on it
+    return completed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Purge users and their data in small batches.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    user_parser = subcommands.add_parser("user", help="Disable and purge one account")
+    user_parser.add_argument("account_id", type=int)
+    subcommands.add_parser("resume", help="Finish interrupted purges")
+    subcommands.add_parser("status", help="List unfinished purges")
+    for subparser in (user_parser, subcommands.choices["resume"]):
+        subparser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    def report(username, stage, deleted):
+        if username is not None:
+            print(f"{username}: {deleted} rows deleted, now at {stage}", file=sys.stderr)
+
+    started = time.perf_counter()
+    if args.command == "status":
+        for account_id, username, stage, deleted in unfinished_purges():
+            print(f"{account_id:>8}  {username:<30} {stage:<14} {deleted} rows deleted")
+    elif args.command == "user":
+        deleted = purge_user(args.account_id, args.batch_size, report)
+        print(f"Deleted {deleted} rows in {time.perf_counter() - started:.1f}s")
+    else:
+        completed = resume_purges(args.batch_size, report)
+        print(f"Completed {completed} purges in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,272 +1,789 @@
-from database.db_connection import get_connection
-from datetime import datetime
+from database.db_connection import pooled_connection
+from database.auth import authenticate_user  # re-exported; the login window imports database.auth
+from database.event_queue import get_sleep_event_queue
+from database.query_cache import cached, invalidate
+from database.feedback_index import search_feedback_ids, loaded_feedback_index
+from database.purge import purge_users
+from database.archive import sessions_source
+from database.rollups import DECLARE_DELTAS_SQL, MERGE_DELTAS_SQL, apply_rollup_deltas, week_start
+from utils.session_timeout import cancel_timeout
+from utils.sleep_intervals import batch_sleep_minutes, sleep_minutes as compute_sleep_minutes
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Writes on behalf of an account are refused while it has an unfinished
+# purge job, so a client still running for a purged user cannot add rows
+# behind the purge. An ordinary disable (is_active = 0) does not stop them:
+# the events and feedback of someone disabled mid-shift are still theirs.
+NOT_PURGING_SQL = "NOT EXISTS (SELECT 1 FROM user_purge_jobs WHERE account_id = ? AND finished_at IS NULL)"
+
+
+SESSION_EVENTS_SQL = (
+    "SELECT event_type, event_time, source FROM sleep_events "
+    "WHERE session_id = ? ORDER BY event_time, id"
+)
+
+
+# Clocks an account in unless it already has an open session, which is
+# returned instead: a clock-in retried after the UI gave up on the first
+# attempt (which may still have committed) must not open a second one.
+# UPDLOCK, HOLDLOCK on the open-session range serializes concurrent tries.
+OPEN_SESSION_SQL = f"""
+SET NOCOUNT ON;
+DECLARE @account INT = ?;
+DECLARE @opened TABLE (id INT NOT NULL, clock_in DATETIME NOT NULL, created BIT NOT NULL);
+IF {NOT_PURGING_SQL.replace("?", "@account")}
+BEGIN
+    INSERT INTO @opened
+    SELECT TOP 1 id, clock_in, 0 FROM sessions WITH (UPDLOCK, HOLDLOCK)
+    WHERE account_id = @account AND clock_out IS NULL
+    ORDER BY clock_in DESC;
+
+    IF NOT EXISTS (SELECT 1 FROM @opened)
+        INSERT INTO sessions (account_id, clock_in, session_date)
+        OUTPUT INSERTED.id, INSERTED.clock_in, 1 INTO @opened
+        VALUES (@account, ?, ?);
+END
+SELECT id, clock_in, created FROM @opened;
+"""
+
+
+def open_session(account_id, clock_in_time):
+    """
+    Clock in; returns (session_id, clock_in, created), where an account that
+    is already clocked in gets its open session back with created False.
+    Returns None if the account is being purged.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(OPEN_SESSION_SQL, (account_id, clock_in_time, clock_in_time.date()))
+        row = cursor.fetchone()
+        conn.commit()
+    if row is None:
+        return None
+    session_id, clock_in, created = row
+    if created:
+        invalidate("sessions", on_date=clock_in.date())
+    return session_id, clock_in, bool(created)
+
 
 def start_session(account_id, clock_in_time):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO sessions (account_id, clock_in, session_date)
-        OUTPUT INSERTED.id
-        VALUES (?, ?, ?)
-    """, (account_id, clock_in_time, clock_in_time.date()))
-    session_id = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
-    return session_id
+    """The id of open_session(), or None if the account is being purged."""
+    opened = open_session(account_id, clock_in_time)
+    return None if opened is None else opened[0]
 
 
 def end_session(session_id, clock_out_time):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT event_type, event_time FROM sleep_events
-        WHERE session_id = ? ORDER BY event_time
-    """, (session_id,))
-    rows = cursor.fetchall()
-
-    sleep_minutes = 0
-    sleep_start = None
-    for event_type, time in rows:
-        if event_type == 'sleep':
-            sleep_start = time
-        elif event_type == 'resume' and sleep_start:
-            sleep_minutes += int((time - sleep_start).total_seconds() / 60)
-            sleep_start = None
-
-    cursor.execute("SELECT clock_in FROM sessions WHERE id = ?", (session_id,))
-    clock_in = cursor.fetchone()[0]
-    total_minutes = int((clock_out_time - clock_in).total_seconds() / 60) - sleep_minutes
-
-    cursor.execute("""
-        UPDATE sessions
-        SET clock_out = ?, total_work_minutes = ?
-        WHERE id = ?
-    """, (clock_out_time, total_minutes, session_id))
-    conn.commit()
-    conn.close()
+    cancel_timeout(session_id)
+    # Make sure events still sitting in the write-behind queue are counted.
+    get_sleep_event_queue().flush(timeout=5)
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+
+        # UPDLOCK: the rollups get the difference to what is stored now, so
+        # nobody may change the row between this read and the update.
+        cursor.execute("""
+            SELECT account_id, clock_in, session_date, clock_out, total_work_minutes, sleep_minutes
+            FROM sessions WITH (UPDLOCK) WHERE id = ?
+        """, (session_id,))
+        account_id, clock_in, session_date, old_clock_out, old_total, old_sleep = cursor.fetchone()
+
+        cursor.execute(SESSION_EVENTS_SQL, (session_id,))
+        sleep_minutes = compute_sleep_minutes(cursor.fetchall(), clock_in, clock_out_time)
+        total_minutes = int((clock_out_time - clock_in).total_seconds() / 60) - sleep_minutes
+
+        cursor.execute("""
+            UPDATE sessions
+            SET clock_out = ?, total_work_minutes = ?, sleep_minutes = ?
+            WHERE id = ?
+        """, (clock_out_time, total_minutes, sleep_minutes, session_id))
+        # A session closed before (e.g. by auto_close) is already counted.
+        if old_clock_out is None:
+            delta = (account_id, session_date, 1, total_minutes, sleep_minutes)
+        else:
+            delta = (account_id, session_date, 0,
+                     total_minutes - (old_total or 0), sleep_minutes - (old_sleep or 0))
+        apply_rollup_deltas(cursor, [delta])
+        conn.commit()
+    invalidate("sessions", on_date=clock_in.date())
+    invalidate("rollups")
     return total_minutes
 
 
-def log_sleep_event(account_id, session_id, event_type, source='system'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO sleep_events (account_id, session_id, event_type, event_time, source)
-        VALUES (?, ?, ?, ?, ?)
-    """, (account_id, session_id, event_type, datetime.now(), source))
-    conn.commit()
-    conn.close()
-
-
-def fetch_all_sessions(from_date=None, to_date=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    base_query = """
-        SELECT 
-            a.username,
-            s.clock_in,
-            s.clock_out,
-            s.session_date,
-            ISNULL(s.total_work_minutes, 0),
-            (
-                SELECT 
-                    SUM(DATEDIFF(MINUTE, se1.event_time, se2.event_time))
-                FROM sleep_events se1
-                JOIN sleep_events se2 ON se1.session_id = se2.session_id
-                    AND se1.event_type = 'sleep' AND se2.event_type = 'resume'
-                    AND se2.event_time > se1.event_time
-                WHERE se1.session_id = s.id
-                    AND NOT EXISTS (
-                        SELECT 1 FROM sleep_events seX
-                        WHERE seX.session_id = se1.session_id 
-                          AND seX.event_time > se1.event_time 
-                          AND seX.event_time < se2.event_time 
-                          AND seX.event_type = 'sleep'
-                    )
-            ) AS sleep_minutes,
-            s.id
-        FROM sessions s
-        JOIN accounts a ON s.account_id = a.id
+# Closes one session with totals computed by the client and adds it to the
+# rollups, in one batch; returns the session's date, or no row if the
+# session was already closed.
+CLOSE_SESSION_SQL = f"""
+SET NOCOUNT ON;
+{DECLARE_DELTAS_SQL}
+
+UPDATE sessions
+SET clock_out = ?, total_work_minutes = ?, sleep_minutes = ?
+OUTPUT INSERTED.account_id, INSERTED.session_date, 1, INSERTED.total_work_minutes, INSERTED.sleep_minutes
+INTO @rollup_deltas
+WHERE id = ? AND clock_out IS NULL;
+
+{MERGE_DELTAS_SQL}
+SELECT day FROM @rollup_deltas;
+"""
+
+
+def close_session(session_id, clock_out_time, total_minutes, sleep_minutes):
     """
+    Clock out an open session whose totals the caller already knows (see
+    utils.session_manager) in a single round trip. Returns False, changing
+    nothing, if the session was closed already.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(CLOSE_SESSION_SQL, (clock_out_time, total_minutes, sleep_minutes, session_id))
+        row = cursor.fetchone()
+        conn.commit()
+    if row is None:
+        return False
+    invalidate("sessions", on_date=row[0])
+    invalidate("rollups")
+    return True
+
+
+def refresh_sleep_minutes(cursor, session_ids):
+    """
+    Recompute sleep_minutes for the given sessions from their events, and
+    total_work_minutes for those already clocked out. Changes to closed
+    sessions are carried into the rollups. Returns (the session_dates of the
+    sessions found, whether the rollups changed).
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return set(), False
+    placeholders = ", ".join("?" * len(session_ids))
+
+    # Times come back as milliseconds from clock_in so the batch engine can
+    # work on plain integer arrays.
+    cursor.execute(f"""
+        SELECT id, clock_in, clock_out, DATEDIFF_BIG(MILLISECOND, clock_in, clock_out),
+               account_id, session_date, total_work_minutes, sleep_minutes
+        FROM sessions WITH (UPDLOCK) WHERE id IN ({placeholders})
+    """, session_ids)
+    sessions = cursor.fetchall()
+    cursor.execute(f"""
+        SELECT e.session_id, e.event_type, DATEDIFF_BIG(MILLISECOND, s.clock_in, e.event_time), e.source
+        FROM sleep_events e
+        JOIN sessions s ON s.id = e.session_id
+        WHERE e.session_id IN ({placeholders})
+        ORDER BY e.session_id, e.event_time, e.id
+    """, session_ids)
+    minutes = batch_sleep_minutes(
+        cursor.fetchall(), {row[0]: (0, row[3]) for row in sessions}
+    )
+
+    updates = []
+    deltas = []
+    for session_id, clock_in, clock_out, _, account_id, session_date, old_total, old_sleep in sessions:
+        sleep = minutes[session_id]
+        total = None if clock_out is None else int((clock_out - clock_in).total_seconds() / 60) - sleep
+        updates.append((sleep, total, session_id))
+        if clock_out is not None:
+            deltas.append((account_id, session_date, 0, total - (old_total or 0), sleep - (old_sleep or 0)))
+    cursor.executemany(
+        "UPDATE sessions SET sleep_minutes = ?, total_work_minutes = ISNULL(?, total_work_minutes) WHERE id = ?",
+        updates
+    )
+    # Only closed sessions are in the rollups.
+    return {row[5] for row in sessions}, apply_rollup_deltas(cursor, deltas)
+
+
+def log_sleep_event(account_id, session_id, event_type, source='system', event_time=None):
+    """
+    Record a sleep/resume event. The event is journaled locally and written
+    by the background flusher, so this never waits on the network.
+    """
+    get_sleep_event_queue().enqueue(account_id, session_id, event_type, source, event_time)
+
+
+def insert_sleep_events(events):
+    """
+    Batch-insert (account_id, session_id, event_type, event_time, source) rows.
+    Rows already present (same session, type, time and source) are skipped,
+    which makes replaying a journaled batch safe, and so are rows of
+    accounts being purged.
+    """
+    if not events:
+        return
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(f"""
+            INSERT INTO sleep_events (account_id, session_id, event_type, event_time, source)
+            SELECT ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM sleep_events
+                WHERE session_id = ? AND event_type = ? AND event_time = ? AND source = ?
+            ) AND {NOT_PURGING_SQL}
+        """, [
+            (account_id, session_id, event_type, event_time, source,
+             session_id, event_type, event_time, source, account_id)
+            for account_id, session_id, event_type, event_time, source in events
+        ])
+
+        # New events can move a session's stored totals, including sessions
+        # already clocked out when a journaled batch is replayed late.
+        session_dates, rollups_changed = refresh_sleep_minutes(
+            cursor, {session_id for _, session_id, _, _, _ in events}
+        )
+        conn.commit()
+    # Only the days written to, so a flush leaves other cached listings alone.
+    for session_date in session_dates:
+        invalidate("sessions", on_date=session_date)
+    if rollups_changed:
+        invalidate("rollups")
+
+
+SESSION_PAGE_SIZE = 200
+FEEDBACK_PAGE_SIZE = 200
+
+SESSION_SELECT = """
+    SELECT
+        a.username,
+        s.clock_in,
+        s.clock_out,
+        s.session_date,
+        ISNULL(s.total_work_minutes, 0),
+        ISNULL(s.sleep_minutes, 0) AS sleep_minutes,
+        s.id
+    FROM {sessions} s
+    JOIN accounts a ON s.account_id = a.id
+    WHERE 1=1
+"""
+
 
+def session_select(from_date):
+    """SESSION_SELECT over the hot table, plus the archive if from_date is before its horizon."""
+    return SESSION_SELECT.format(sessions=sessions_source(from_date))
+
+
+def like_prefix(text):
+    """LIKE pattern matching values that start with `text` (wildcards escaped with \\)."""
+    for char in ("\\", "%", "_", "["):
+        text = text.replace(char, "\\" + char)
+    return text + "%"
+
+
+def session_filters(from_date, to_date, employee=None):
+    """
+    (" AND ..." clauses, params) over `s` (sessions) joined to `a` (accounts),
+    shared by the dashboard queries and database.export.
+    `employee` is either an account id (int) or a username prefix (str);
+    both are evaluated by the server so only matching rows are transferred.
+    """
+    clauses = ""
     params = []
     if from_date and to_date:
-        base_query += " WHERE s.session_date BETWEEN ? AND ?"
-        params.extend([from_date, to_date])
+        # Half-open range so the server can seek on session_date.
+        clauses += " AND s.session_date >= ? AND s.session_date < ?"
+        params.extend([from_date, to_date + timedelta(days=1)])
+    if isinstance(employee, int):
+        clauses += " AND s.account_id = ?"
+        params.append(employee)
+    elif employee:
+        clauses += " AND a.username LIKE ? ESCAPE '\\'"
+        params.append(like_prefix(employee))
+    return clauses, params
+
+
+@cached("sessions")
+def fetch_all_sessions(from_date=None, to_date=None, employee=None):
+    clauses, params = session_filters(from_date, to_date, employee)
+    query = session_select(from_date) + clauses + " ORDER BY s.session_date DESC, s.clock_in DESC, s.id DESC"
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+    return results
 
-    base_query += " ORDER BY s.session_date DESC, s.clock_in DESC"
 
-    cursor.execute(base_query, params)
-    results = cursor.fetchall()
-    conn.close()
+def fetch_sessions_by_date_range(from_date, to_date, employee=None):
+    return fetch_all_sessions(from_date, to_date, employee)
+
+
+def session_page_key(row):
+    """Seek key (session_date, clock_in, id) of a row returned by the session queries."""
+    return row[3], row[1], row[6]
+
+
+def build_sessions_page_query(from_date=None, to_date=None, employee=None, after=None, limit=SESSION_PAGE_SIZE):
+    clauses, params = session_filters(from_date, to_date, employee)
+    if after is not None:
+        session_date, clock_in, session_id = after
+        # The leading session_date <= ? is implied by the OR below; it is
+        # spelled out so the optimizer always has a range to seek on.
+        clauses += """
+            AND s.session_date <= ?
+            AND (s.session_date < ?
+                 OR (s.session_date = ? AND (s.clock_in < ?
+                     OR (s.clock_in = ? AND s.id < ?))))
+        """
+        params.extend([session_date, session_date, session_date, clock_in, clock_in, session_id])
+
+    query = session_select(from_date).replace("SELECT", "SELECT TOP (?)", 1) + clauses
+    query += " ORDER BY s.session_date DESC, s.clock_in DESC, s.id DESC"
+    return query, [limit] + params
+
+
+@cached("sessions")
+def fetch_sessions_page(from_date=None, to_date=None, employee=None, after=None, limit=SESSION_PAGE_SIZE):
+    """
+    One page of sessions, newest first. Pass the session_page_key() of the
+    last row of the previous page as `after` to get the next page.
+    """
+    query, params = build_sessions_page_query(from_date, to_date, employee, after, limit)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        results = cursor.fetchall()
     return results
 
 
-def fetch_sessions_by_date_range(from_date, to_date):
-    return fetch_all_sessions(from_date, to_date)
+# Reads MIN_ACTIVE_ROWVERSION() (migration 7) ahead of the query that
+# follows: every change below it is committed, so a reader that has seen
+# the rows as of this watermark and later asks for row_version >= it
+# misses nothing. Rows changed at or after it may come back twice, which
+# merging by id absorbs.
+WATERMARK_SQL = """
+SET NOCOUNT ON;
+DECLARE @watermark BINARY(8) = MIN_ACTIVE_ROWVERSION();
+SELECT @watermark;
+"""
 
 
-def authenticate_user(username, password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, role FROM accounts WHERE username = ? AND password = ? AND is_active = 1
-    """, (username, password))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return row.id, row.role
-    return None, None
+def _fetch_with_watermark(query, params):
+    """Run WATERMARK_SQL + query in one batch; returns (rows, watermark)."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(WATERMARK_SQL + query, params)
+        watermark = cursor.fetchone()[0]
+        cursor.nextset()
+        rows = cursor.fetchall()
+    return rows, watermark
 
 
-def fetch_all_users():
-    try:
-        conn = get_connection()
+@cached("sessions")
+def fetch_sessions_snapshot(from_date=None, to_date=None, employee=None, limit=SESSION_PAGE_SIZE):
+    """
+    The first fetch_sessions_page() plus the watermark it is current to, for
+    fetch_session_changes(). Cached together, so a cached page never comes
+    with a newer watermark than its rows.
+    """
+    query, params = build_sessions_page_query(from_date, to_date, employee, None, limit)
+    return _fetch_with_watermark(query, params)
+
+
+def build_session_changes_query(since, from_date=None, to_date=None, employee=None):
+    clauses, params = session_filters(from_date, to_date, employee)
+    # Bounded by the watermark so the seek stops short of uncommitted rows.
+    # Only the hot table: archived sessions no longer change.
+    query = SESSION_SELECT.format(sessions="sessions") + """
+        AND s.row_version >= ? AND s.row_version < @watermark
+    """ + clauses + " ORDER BY s.session_date DESC, s.clock_in DESC, s.id DESC"
+    return query, [since] + params
+
+
+def fetch_session_changes(since, from_date=None, to_date=None, employee=None):
+    """
+    Sessions matching the filters that were inserted or updated since the
+    watermark `since`; returns (rows, new watermark). Deleted rows (purged
+    accounts, archived sessions) are not reported.
+    """
+    query, params = build_session_changes_query(since, from_date, to_date, employee)
+    return _fetch_with_watermark(query, params)
+
+
+def _rollup_employee_filter(employee):
+    if isinstance(employee, int):
+        return " AND r.account_id = ?", [employee]
+    if employee:
+        return " AND a.username LIKE ? ESCAPE '\\'", [like_prefix(employee)]
+    return "", []
+
+
+@cached("rollups")
+def fetch_daily_rollups(from_date, to_date, employee=None):
+    """(username, day, sessions, work_minutes, sleep_minutes) per employee and day, newest first."""
+    clauses, params = _rollup_employee_filter(employee)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT a.username, r.day, r.sessions, r.work_minutes, r.sleep_minutes
+            FROM daily_rollups r
+            JOIN accounts a ON a.id = r.account_id
+            WHERE r.day >= ? AND r.day <= ?{clauses}
+            ORDER BY r.day DESC, a.username
+        """, [from_date, to_date] + params)
+        return cursor.fetchall()
+
+
+@cached("rollups")
+def fetch_weekly_rollups(from_date, to_date, employee=None):
+    """
+    (username, iso_year, iso_week, sessions, work_minutes, sleep_minutes)
+    per employee for every ISO week overlapping the range, newest first.
+    """
+    clauses, params = _rollup_employee_filter(employee)
+    with pooled_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT a.username, r.iso_year, r.iso_week, r.sessions, r.work_minutes, r.sleep_minutes
+            FROM weekly_rollups r
+            JOIN accounts a ON a.id = r.account_id
+            WHERE r.week_start >= ? AND r.week_start <= ?{clauses}
+            ORDER BY r.week_start DESC, a.username
+        """, [week_start(from_date), to_date] + params)
+        return cursor.fetchall()
+
+
+@cached("rollups")
+def fetch_rollup_totals(from_date, to_date, employee=None):
+    """(username, days worked, sessions, work_minutes, sleep_minutes) per employee over the range."""
+    clauses, params = _rollup_employee_filter(employee)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT a.username, COUNT(*), SUM(r.sessions), SUM(r.work_minutes), SUM(r.sleep_minutes)
+            FROM daily_rollups r
+            JOIN accounts a ON a.id = r.account_id
+            WHERE r.day >= ? AND r.day <= ?{clauses}
+            GROUP BY a.id, a.username
+            ORDER BY a.username
+        """, [from_date, to_date] + params)
+        return cursor.fetchall()
+
+
+@cached("users")
+def _query_all_users():
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        # Accounts with a purge under way are already gone as far as admins are concerned.
         cursor.execute("""
             SELECT id, username, role,
                 CASE WHEN is_active = 1 THEN 'Active' ELSE 'Disabled' END AS status
-            FROM accounts
+            FROM accounts a
+            WHERE NOT EXISTS (
+                SELECT 1 FROM user_purge_jobs p WHERE p.account_id = a.id AND p.finished_at IS NULL
+            )
         """)
         users = cursor.fetchall()
-        conn.close()
-        return users
-    
-    except Exception as e:
-        print(f"Error fetching users: {e}")
+    return users
+
+
+def fetch_all_users():
+    try:
+        return _query_all_users()
+
+    except Exception:
+        logger.exception("Error fetching users")
         return []
 
 
+USER_ROLES = ('employee', 'admin')
+
+
 def create_user(username, password, role):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO accounts (username, password, role, is_active)
-        VALUES (?, ?, ?, 0)
-    """, (username, password, role))
-    conn.commit()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO accounts (username, password, role, is_active)
+            VALUES (?, ?, ?, 0)
+        """, (username, password, role))
+        conn.commit()
+    invalidate("users")
+
+
+def create_users_bulk(users):
+    """
+    Create accounts from (line, username, password, role) tuples in one
+    transaction. Rows that cannot be created are reported instead of
+    failing the batch; returns (created count, [(line, username, reason)]).
+    """
+    conflicts = []
+    candidates = []
+    seen = set()
+    for line, username, password, role in users:
+        username, password, role = (username or '').strip(), (password or '').strip(), (role or '').strip().lower()
+        if not username or not password:
+            conflicts.append((line, username, "username and password are required"))
+        elif role not in USER_ROLES:
+            conflicts.append((line, username, f"unknown role '{role}'"))
+        elif username.lower() in seen:
+            conflicts.append((line, username, "duplicate username in file"))
+        else:
+            seen.add(username.lower())
+            candidates.append((line, username, password, role))
+    if not candidates:
+        return 0, conflicts
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # Key-range locks on the usernames keep another client from
+            # creating one of them between this check and the insert.
+            existing = set()
+            for start in range(0, len(candidates), 1000):
+                chunk = [username for _, username, _, _ in candidates[start:start + 1000]]
+                cursor.execute(f"""
+                    SELECT username FROM accounts WITH (UPDLOCK, HOLDLOCK)
+                    WHERE username IN ({", ".join("?" * len(chunk))})
+                """, chunk)
+                existing.update(row[0].lower() for row in cursor.fetchall())
+
+            rows = []
+            for line, username, password, role in candidates:
+                if username.lower() in existing:
+                    conflicts.append((line, username, "username already exists"))
+                else:
+                    rows.append((username, password, role, username))
+            if rows:
+                cursor.fast_executemany = True
+                cursor.executemany("""
+                    INSERT INTO accounts (username, password, role, is_active)
+                    SELECT ?, ?, ?, 0
+                    WHERE NOT EXISTS (SELECT 1 FROM accounts WHERE username = ?)
+                """, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    invalidate("users")
+    conflicts.sort()
+    return len(rows), conflicts
 
 
 def toggle_user_status(user_id, new_status):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE accounts 
-        SET is_active = ? 
-        WHERE id = ?
-    """, (1 if new_status == 'active' else 0, user_id))
-    conn.commit()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE accounts
+            SET is_active = ?
+            WHERE id = ?
+        """, (1 if new_status == 'active' else 0, user_id))
+        conn.commit()
+    invalidate("users")
     return True
 
 
+def set_users_status(user_ids, new_status):
+    """Enable ('active') or disable several accounts in one statement; returns rows changed."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE accounts
+            SET is_active = ?
+            WHERE id IN (SELECT CAST(value AS INT) FROM STRING_SPLIT(?, ','))
+        """, (1 if new_status == 'active' else 0, ",".join(str(int(user_id)) for user_id in user_ids)))
+        changed = cursor.rowcount
+        conn.commit()
+    invalidate("users")
+    return changed
+
+
 def delete_user(user_id):
     """
     Delete a user and all associated data.
     This includes sessions, sleep events, and feedback.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Delete sleep events for sessions belonging to this user
-        cursor.execute("""
-            DELETE FROM sleep_events 
-            WHERE session_id IN (
-                SELECT id FROM sessions WHERE account_id = ?
-            )
-        """, (user_id,))
-        
-        # Delete sessions belonging to this user
-        cursor.execute("DELETE FROM sessions WHERE account_id = ?", (user_id,))
-        
-        # Delete feedback from this user
-        cursor.execute("DELETE FROM feedback WHERE account_id = ?", (user_id,))
-        
-        # Finally, delete the user account
-        cursor.execute("DELETE FROM accounts WHERE id = ?", (user_id,))
-        
-        # Check if user was actually deleted
-        if cursor.rowcount == 0:
-            raise Exception("User not found or could not be deleted")
-        
-        # Commit all changes
-        conn.commit()
-        conn.close()
-        return True
-        
-    except Exception as e:
-        # Rollback on error
-        conn.rollback()
-        conn.close()
-        raise e
+    if delete_users([user_id]) == 0:
+        raise Exception("User not found or could not be deleted")
+    return True
+
+
+def delete_users(user_ids):
+    """
+    Delete several users and all their sessions, sleep events and feedback,
+    in small batches (see database.purge); returns the rows deleted.
+    """
+    return purge_users(user_ids)
 
 
 def insert_feedback(account_id, mood, comment, anonymous):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO feedback (account_id, mood, comment, is_anonymous)
-        VALUES (?, ?, ?, ?)
-    """, (account_id, mood, comment, anonymous))
-    conn.commit()
-    conn.close()
+    """Store feedback; returns its id, or None if the account is being purged."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO feedback (account_id, mood, comment, is_anonymous)
+            OUTPUT INSERTED.id, INSERTED.submitted_at
+            SELECT ?, ?, ?, ?
+            WHERE {NOT_PURGING_SQL}
+        """, (account_id, mood, comment, anonymous, account_id))
+        row = cursor.fetchone()
+        conn.commit()
+    if row is None:
+        return None
+    feedback_id, submitted_at = row
+    # submitted_at is the server's clock, which the cached ranges are in too.
+    invalidate("feedback", on_date=submitted_at.date())
+
+    index = loaded_feedback_index()
+    if index is not None:
+        # The username tokens are added when the index next syncs past this id.
+        index.add(feedback_id, None, comment)
+    return feedback_id
 
 
+@cached("feedback")
 def fetch_all_feedback():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT f.id, a.username, f.mood, f.comment, 
-               CASE WHEN f.is_anonymous = 1 THEN 'Yes' ELSE 'No' END as anonymous,
-               f.submitted_at
-        FROM feedback f
-        LEFT JOIN accounts a ON f.account_id = a.id
-        ORDER BY f.submitted_at DESC
-    """)
-    results = cursor.fetchall()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT f.id, a.username, f.mood, f.comment,
+                   CASE WHEN f.is_anonymous = 1 THEN 'Yes' ELSE 'No' END as anonymous,
+                   f.submitted_at
+            FROM feedback f
+            LEFT JOIN accounts a ON f.account_id = a.id
+            ORDER BY f.submitted_at DESC
+        """)
+        results = cursor.fetchall()
     return results
 
 
-def fetch_filtered_feedback(start_date=None, end_date=None, mood='All', keyword=''):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    query = """
-        SELECT f.id, a.username, f.mood, f.comment, 
-               CASE WHEN f.is_anonymous = 1 THEN 'Yes' ELSE 'No' END as anonymous,
-               f.submitted_at
-        FROM feedback f
-        LEFT JOIN accounts a ON f.account_id = a.id
-        WHERE 1=1
-    """
+FEEDBACK_SELECT = """
+    SELECT f.id, a.username, f.mood, f.comment,
+           CASE WHEN f.is_anonymous = 1 THEN 'Yes' ELSE 'No' END as anonymous,
+           f.submitted_at
+    FROM feedback f
+    LEFT JOIN accounts a ON f.account_id = a.id
+    WHERE 1=1
+"""
+
+
+def day_bounds(first_day, last_day):
+    """[first_day 00:00, day after last_day 00:00) as datetimes."""
+    midnight = datetime.min.time()
+    return datetime.combine(first_day, midnight), datetime.combine(last_day + timedelta(days=1), midnight)
+
+
+def feedback_filters(start_date, end_date, mood, keyword):
+    """(" AND ..." clauses, params) over `f` (feedback) left-joined to `a` (accounts)."""
+    clauses = ""
     params = []
 
     if start_date and end_date:
-        query += " AND CAST(f.submitted_at AS DATE) BETWEEN ? AND ?"
-        params.extend([start_date, end_date])
+        # Half-open datetime range rather than CAST(submitted_at AS DATE),
+        # which would hide the column from the submitted_at index.
+        clauses += " AND f.submitted_at >= ? AND f.submitted_at < ?"
+        params.extend(day_bounds(start_date, end_date))
 
     if mood != "All":
-        query += " AND f.mood = ?"
+        clauses += " AND f.mood = ?"
         params.append(mood)
-        
+
     if keyword and keyword.strip():
-        query += " AND (a.username LIKE ? OR f.comment LIKE ?)"
-        keyword_param = f"%{keyword.strip()}%"
-        params.extend([keyword_param, keyword_param])
+        matching_ids = search_feedback_ids(keyword)
+        if matching_ids is None:
+            # Index unavailable: fall back to the scanning search.
+            clauses += " AND (a.username LIKE ? OR f.comment LIKE ?)"
+            keyword_param = f"%{keyword.strip()}%"
+            params.extend([keyword_param, keyword_param])
+        elif not matching_ids:
+            clauses += " AND 1=0"
+        else:
+            clauses += " AND f.id IN (SELECT CAST(value AS INT) FROM STRING_SPLIT(?, ','))"
+            params.append(",".join(map(str, matching_ids)))
+
+    return clauses, params
+
+
+@cached("feedback")
+def _query_filtered_feedback(start_date, end_date, mood, keyword):
+    clauses, params = feedback_filters(start_date, end_date, mood, keyword)
+    query = FEEDBACK_SELECT + clauses + " ORDER BY f.submitted_at DESC, f.id DESC"
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+    return results
 
-    query += " ORDER BY f.submitted_at DESC"
 
+def fetch_filtered_feedback(start_date=None, end_date=None, mood='All', keyword=''):
     try:
+        return _query_filtered_feedback(start_date, end_date, mood, keyword)
+
+    except Exception:
+        logger.exception("Error fetching feedback")
+        return []
+
+
+def feedback_page_key(row):
+    """Seek key (submitted_at, id) of a row returned by the feedback queries."""
+    return row[5], row[0]
+
+
+def build_feedback_page_query(start_date=None, end_date=None, mood='All', keyword='',
+                              after=None, limit=FEEDBACK_PAGE_SIZE):
+    clauses, params = feedback_filters(start_date, end_date, mood, keyword)
+    if after is not None:
+        submitted_at, feedback_id = after
+        clauses += """
+            AND f.submitted_at <= ?
+            AND (f.submitted_at < ? OR (f.submitted_at = ? AND f.id < ?))
+        """
+        params.extend([submitted_at, submitted_at, submitted_at, feedback_id])
+
+    query = FEEDBACK_SELECT.replace("SELECT", "SELECT TOP (?)", 1) + clauses
+    query += " ORDER BY f.submitted_at DESC, f.id DESC"
+    return query, [limit] + params
+
+
+@cached("feedback")
+def _query_feedback_page(start_date, end_date, mood, keyword, after, limit):
+    query, params = build_feedback_page_query(start_date, end_date, mood, keyword, after, limit)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute(query, params)
         results = cursor.fetchall()
-        conn.close()
-        return results
-    
-    except Exception as e:
-        conn.close()
-        return []
\ No newline at end of file
+    return results
+
+
+def fetch_feedback_page(start_date=None, end_date=None, mood='All', keyword='',
+                        after=None, limit=FEEDBACK_PAGE_SIZE):
+    """One page of feedback, newest first; `after` is the feedback_page_key() of the previous page's last row."""
+    try:
+        return _query_feedback_page(start_date, end_date, mood, keyword, after, limit)
+
+    except Exception:
+        logger.exception("Error fetching a feedback page")
+        return []
+
+
+@cached("feedback")
+def _query_feedback_snapshot(start_date, end_date, mood, keyword, limit):
+    query, params = build_feedback_page_query(start_date, end_date, mood, keyword, None, limit)
+    return _fetch_with_watermark(query, params)
+
+
+def fetch_feedback_snapshot(start_date=None, end_date=None, mood='All', keyword='', limit=FEEDBACK_PAGE_SIZE):
+    """The first fetch_feedback_page() plus its watermark; see fetch_sessions_snapshot()."""
+    try:
+        return _query_feedback_snapshot(start_date, end_date, mood, keyword, limit)
+
+    except Exception:
+        logger.exception("Error fetching the first feedback page")
+        return [], None
+
+
+def build_feedback_changes_query(since, start_date=None, end_date=None, mood='All', keyword=''):
+    clauses, params = feedback_filters(start_date, end_date, mood, keyword)
+    query = FEEDBACK_SELECT + """
+        AND f.row_version >= ? AND f.row_version < @watermark
+    """ + clauses + " ORDER BY f.submitted_at DESC, f.id DESC"
+    return query, [since] + params
+
+
+def fetch_feedback_changes(since, start_date=None, end_date=None, mood='All', keyword=''):
+    """Feedback matching the filters added or changed since `since`; returns (rows, new watermark)."""
+    query, params = build_feedback_changes_query(since, start_date, end_date, mood, keyword)
+    return _fetch_with_watermark(query, params)
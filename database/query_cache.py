@@ -0,0 +1,199 @@
+# query_cache.py
+"""
+Read-through cache for the fetch_* functions in database.queries.
+
+Entries are keyed by the function name plus its normalized arguments, expire
+after a per-query TTL and are evicted least-recently-used beyond max_entries.
+Each entry carries tags (the tables it reads); write functions invalidate by
+tag, optionally only the entries whose date range covers the written day.
+"""
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from database.db_connection import load_db_config
+
+DEFAULT_MAX_ENTRIES = 256
+
+# Seconds a cached result is served before re-querying. This bounds how
+# stale another client's writes can look; this process's own writes
+# invalidate immediately.
+DEFAULT_TTLS = {
+    "sessions": 20,
+    "feedback": 60,
+    "users": 30,
+    "rollups": 60,
+}
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "tags", "params")
+
+    def __init__(self, value, expires_at, tags, params):
+        self.value = value
+        self.expires_at = expires_at
+        self.tags = tags
+        self.params = params
+
+
+class QueryCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so a load that started before a
+        # write does not put its now-stale result back into the cache.
+        self._generations = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, tags, ttl, params, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            generations = tuple(self._generations.get(tag, 0) for tag in tags)
+
+        value = loader()
+
+        with self._lock:
+            if generations == tuple(self._generations.get(tag, 0) for tag in tags):
+                self._entries[key] = _Entry(value, time.monotonic() + ttl, tags, params)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, tag, on_date=None):
+        """
+        Drop entries tagged `tag`. With on_date, only entries whose date
+        range covers that day (or that have no date range) are dropped.
+        """
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [
+                key for key, entry in self._entries.items()
+                if tag in entry.tags and (on_date is None or _covers(entry.params, on_date))
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for tag in self._generations:
+                self._generations[tag] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+_DATE_RANGES = (("from_date", "to_date"), ("start_date", "end_date"))
+
+
+def _covers(params, day):
+    for low_name, high_name in _DATE_RANGES:
+        if low_name in params:
+            low, high = params[low_name], params.get(high_name)
+            if not (low and high):
+                return True
+            if isinstance(day, datetime):
+                day = day.date()
+            return _as_date(low) <= day <= _as_date(high)
+    return True
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    return value
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = load_db_config().get("cache", {})
+                _cache = QueryCache(settings.get("max_entries", DEFAULT_MAX_ENTRIES))
+    return _cache
+
+
+def _ttl_for(tag):
+    settings = load_db_config().get("cache", {})
+    return settings.get("ttl", {}).get(tag, DEFAULT_TTLS[tag])
+
+
+def cached(tag, *extra_tags):
+    """
+    Cache a fetch function's result under its normalized arguments.
+    `tag` also selects the TTL; the undecorated function stays reachable
+    as `.uncached`.
+    """
+    tags = (tag,) + extra_tags
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            key = (fn.__name__,) + tuple(_normalize(value) for value in params.values())
+            result = get_query_cache().get_or_load(
+                key, tags, _ttl_for(tag), params, lambda: fn(*args, **kwargs)
+            )
+            # Callers get their own list, so one caller cannot change another's rows.
+            return list(result) if isinstance(result, list) else result
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
+
+
+def invalidate(tag, on_date=None):
+    get_query_cache().invalidate(tag, on_date)
+
+
+def cache_stats():
+    return get_query_cache().stats()
@@ -0,0 +1,192 @@
+# rollups.py
+"""
+Per-employee daily and ISO-week totals of closed sessions (migration 6).
+
+    python -m database.rollups rebuild FROM TO [-v]
+
+daily_rollups is keyed by (account_id, day) and weekly_rollups by
+(account_id, iso_year, iso_week); both hold the session count and the work
+and sleep minutes of the closed sessions whose session_date falls on that
+day or in that week. session_date is the clock-in day, so a session that
+runs past midnight counts on the day it started, however late it closed;
+the listings filter on the same column, and the two agree. Writers keep
+them current by adding the change they made to a session's stored totals:
+close_session and end_session when a session closes (end_session also when
+it is closed again), refresh_sleep_minutes when a late batch of events
+moves a closed session's minutes, and the auto_close job for the sessions
+it closes. Archiving leaves the rollups alone; purging an account deletes
+its rows.
+
+rebuild_rollups() recomputes whole weeks from the sessions and their
+archive, one week per transaction. Run it once over the existing history
+after migration 6, and again after a restore or a manual fix.
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+
+from database.db_connection import pooled_connection, set_query_timeout
+from database.query_cache import invalidate
+
+# Monday of the week containing `day` (1900-01-01 was a Monday), independent
+# of the connection's DATEFIRST setting.
+WEEK_START_SQL = "DATEADD(DAY, -(DATEDIFF(DAY, CAST('19000101' AS DATE), {day}) % 7), {day})"
+
+# The changes a batch makes to sessions' stored totals, collected for
+# MERGE_DELTAS_SQL.
+DECLARE_DELTAS_SQL = """DECLARE @rollup_deltas TABLE (
+    account_id INT NOT NULL, day DATE NOT NULL,
+    sessions INT NOT NULL, work_minutes INT NOT NULL, sleep_minutes INT NOT NULL
+);"""
+
+# Adds the rows of @rollup_deltas (account_id, day, sessions, work_minutes,
+# sleep_minutes) to both rollups. Meant to run inside a batch that declared
+# and filled the table variable; the ISO year is the year of the week's
+# Thursday.
+MERGE_DELTAS_SQL = f"""
+MERGE daily_rollups WITH (HOLDLOCK) AS target
+USING (
+    SELECT account_id, day, SUM(sessions) AS sessions,
+           SUM(work_minutes) AS work_minutes, SUM(sleep_minutes) AS sleep_minutes
+    FROM @rollup_deltas
+    GROUP BY account_id, day
+) AS source
+ON target.account_id = source.account_id AND target.day = source.day
+WHEN MATCHED THEN
+    UPDATE SET sessions = target.sessions + source.sessions,
+               work_minutes = target.work_minutes + source.work_minutes,
+               sleep_minutes = target.sleep_minutes + source.sleep_minutes,
+               updated_at = GETDATE()
+WHEN NOT MATCHED THEN
+    INSERT (account_id, day, sessions, work_minutes, sleep_minutes)
+    VALUES (source.account_id, source.day, source.sessions, source.work_minutes, source.sleep_minutes);
+
+MERGE weekly_rollups WITH (HOLDLOCK) AS target
+USING (
+    SELECT account_id, YEAR(DATEADD(DAY, 3, week_start)) AS iso_year,
+           DATEPART(ISO_WEEK, week_start) AS iso_week, week_start,
+           SUM(sessions) AS sessions, SUM(work_minutes) AS work_minutes, SUM(sleep_minutes) AS sleep_minutes
+    FROM @rollup_deltas
+    CROSS APPLY (SELECT {WEEK_START_SQL.format(day="day")} AS week_start) w
+    GROUP BY account_id, week_start
+) AS source
+ON target.account_id = source.account_id
+   AND target.iso_year = source.iso_year AND target.iso_week = source.iso_week
+WHEN MATCHED THEN
+    UPDATE SET sessions = target.sessions + source.sessions,
+               work_minutes = target.work_minutes + source.work_minutes,
+               sleep_minutes = target.sleep_minutes + source.sleep_minutes,
+               updated_at = GETDATE()
+WHEN NOT MATCHED THEN
+    INSERT (account_id, iso_year, iso_week, week_start, sessions, work_minutes, sleep_minutes)
+    VALUES (source.account_id, source.iso_year, source.iso_week, source.week_start,
+            source.sessions, source.work_minutes, source.sleep_minutes);
+"""
+
+APPLY_DELTA_SQL = f"""
+SET NOCOUNT ON;
+{DECLARE_DELTAS_SQL}
+INSERT INTO @rollup_deltas VALUES (?, ?, ?, ?, ?);
+{MERGE_DELTAS_SQL}
+"""
+
+# Recomputes the week starting on the given Monday from scratch. The
+# sessions are read first, under HOLDLOCK, so a session being closed
+# meanwhile is either counted here or adds its delta after this commits.
+REBUILD_WEEK_SQL = f"""
+SET NOCOUNT ON;
+DECLARE @from DATE = ?;
+DECLARE @to DATE = DATEADD(DAY, 7, @from);
+{DECLARE_DELTAS_SQL}
+
+INSERT INTO @rollup_deltas
+SELECT account_id, session_date, COUNT(*),
+       SUM(ISNULL(total_work_minutes, 0)), SUM(ISNULL(sleep_minutes, 0))
+FROM (
+    SELECT account_id, session_date, total_work_minutes, sleep_minutes
+    FROM sessions WITH (HOLDLOCK)
+    WHERE session_date >= @from AND session_date < @to AND clock_out IS NOT NULL
+    UNION ALL
+    SELECT account_id, session_date, total_work_minutes, sleep_minutes
+    FROM sessions_archive WITH (HOLDLOCK)
+    WHERE session_date >= @from AND session_date < @to AND clock_out IS NOT NULL
+) s
+GROUP BY account_id, session_date;
+
+DELETE FROM daily_rollups WHERE day >= @from AND day < @to;
+DELETE FROM weekly_rollups WHERE week_start = @from;
+{MERGE_DELTAS_SQL}
+SELECT COUNT(*), COUNT(DISTINCT account_id) FROM @rollup_deltas;
+"""
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def apply_rollup_deltas(cursor, deltas):
+    """
+    Add (account_id, day, sessions, work_minutes, sleep_minutes) changes to
+    the rollups, in the caller's transaction. Deltas for the same key are
+    summed first and applied in key order, so concurrent writers lock rollup
+    rows in the same order.
+    """
+    totals = {}
+    for account_id, day, sessions, work, sleep in deltas:
+        total = totals.setdefault((account_id, day), [0, 0, 0])
+        total[0] += sessions
+        total[1] += work
+        total[2] += sleep
+    changed = [(key[0], key[1], *total) for key, total in sorted(totals.items()) if any(total)]
+    if changed:
+        cursor.executemany(APPLY_DELTA_SQL, changed)
+    return bool(changed)
+
+
+def rebuild_rollups(from_date, to_date, log=None):
+    """
+    Recompute the rollups of every ISO week overlapping [from_date, to_date],
+    one week per transaction; returns the number of day rows written.
+    """
+    days = 0
+    week = week_start(from_date)
+    while week <= to_date:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(REBUILD_WEEK_SQL, (week,))
+                rows, accounts = cursor.fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        days += rows
+        if log:
+            year, number, _ = week.isocalendar()
+            log(f"{year}-W{number:02d}: {rows} day rows for {accounts} employees")
+        week += timedelta(days=7)
+    invalidate("rollups")
+    return days
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the daily and weekly session rollups.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="Recompute the weeks overlapping a date range")
+    rebuild_parser.add_argument("from_date", type=date.fromisoformat, metavar="FROM")
+    rebuild_parser.add_argument("to_date", type=date.fromisoformat, metavar="TO")
+    rebuild_parser.add_argument("-v", "--verbose", action="store_true", help="Report every week")
+    args = parser.parse_args(argv)
+    set_query_timeout(0)  # a batch job; its statements may run long
+
+    if args.to_date < args.from_date:
+        parser.error("TO must not be before FROM")
+    started = time.perf_counter()
+    days = rebuild_rollups(args.from_date, args.to_date, log=print if args.verbose else None)
+    print(f"Rebuilt {days} day rows in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
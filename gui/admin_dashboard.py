@@ -1,21 +1,45 @@
 # gui/admin_dashboard.py
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QPushButton, QTableWidget,
-    QTableWidgetItem, QHeaderView, QHBoxLayout, QMessageBox,
+    QWidget, QVBoxLayout, QLabel, QPushButton, QTableView,
+    QHeaderView, QHBoxLayout, QMessageBox,
     QGroupBox, QDateEdit, QLineEdit, QComboBox, QDialog,
-    QTextEdit, QDialogButtonBox, QAbstractItemView
+    QTextEdit, QDialogButtonBox, QAbstractItemView, QCheckBox
 )
 from PyQt5.QtCore import QTimer, QDate, Qt
 from datetime import datetime, date, timedelta
-from gui.manage_users import ManageUsers
+from database.db_connection import load_db_config
 from database.queries import (
-    fetch_all_sessions, fetch_sessions_by_date_range, fetch_filtered_feedback, 
-    insert_feedback, fetch_all_users
+    insert_feedback, fetch_all_users, fetch_sessions_page, fetch_feedback_page,
+    session_page_key, feedback_page_key, SESSION_PAGE_SIZE, FEEDBACK_PAGE_SIZE,
+    fetch_daily_rollups, fetch_weekly_rollups, fetch_rollup_totals,
+    fetch_sessions_snapshot, fetch_session_changes, fetch_feedback_snapshot, fetch_feedback_changes
 )
+from gui.paging import KeysetPager
+from gui.table_models import SessionTableModel, FeedbackTableModel, RollupTableModel
+from gui.workers import QueryRunner
+import logging
 import threading
-from utils.activity_monitor import start_activity_monitor
+from utils.session_manager import get_session_manager
 from utils.session_timeout import start_timeout_monitor
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTO_REFRESH_SECONDS = 5
+
+
+def _auto_refresh_settings():
+    """(on at start, seconds between polls) from the "dashboard" config section."""
+    settings = load_db_config().get("dashboard", {})
+    return settings.get("auto_refresh", False), settings.get("auto_refresh_seconds", DEFAULT_AUTO_REFRESH_SECONDS)
+
+
+def run_activity_monitor(account_id, session_id):
+    # Imported on the monitor's own thread, on first clock-in: pywin32, wmi
+    # and pythoncom take a while to load and are not needed before that.
+    from utils.activity_monitor import start_activity_monitor
+    start_activity_monitor(account_id, session_id)
+
+
 class CommentViewDialog(QDialog):
     """Dialog to view full comment text"""
     def __init__(self, comment, parent=None):
@@ -51,6 +75,17 @@ class AdminDashboard(QWidget):
         self.current_session_id = None
         self.clock_in_time = None
         self.manage_window = None
+        # The first page of each list comes with a change watermark; Refresh
+        # All and the auto-refresh then fetch only the rows changed since.
+        self.session_pager = KeysetPager(fetch_sessions_page, session_page_key, SESSION_PAGE_SIZE,
+                                         fetch_first=fetch_sessions_snapshot, fetch_changes=fetch_session_changes)
+        self.feedback_pager = KeysetPager(fetch_feedback_page, feedback_page_key, FEEDBACK_PAGE_SIZE,
+                                          fetch_first=fetch_feedback_snapshot, fetch_changes=fetch_feedback_changes)
+        self.runner = QueryRunner(self)
+        self.runner.busy_changed.connect(self.on_busy_changed)
+        # Change fetches run here, off the loading indicator, so polling
+        # does not make it flicker.
+        self.change_runner = QueryRunner(self)
 
         self.setWindowTitle("Admin Dashboard")
         self.resize(1100, 900)
@@ -62,7 +97,7 @@ class AdminDashboard(QWidget):
             }
             QPushButton:hover { background-color: #0056b3; }
             QPushButton:disabled { background-color: #cccccc; color: #555555; }
-            QTableWidget { background-color: #ffffff; font-size: 13px; }
+            QTableView { background-color: #ffffff; font-size: 13px; }
             QGroupBox { 
                 background-color: #e9eff5; 
                 border-radius: 6px; 
@@ -81,9 +116,15 @@ class AdminDashboard(QWidget):
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_timer)
 
+        auto_refresh, auto_refresh_seconds = _auto_refresh_settings()
+        self.auto_refresh_timer = QTimer(self)
+        self.auto_refresh_timer.setInterval(int(auto_refresh_seconds * 1000))
+        self.auto_refresh_timer.timeout.connect(self.refresh_changes)
+
         self.header = QLabel("📊 Admin - Employee Sessions")
         self.status_label = QLabel("Status: Not Clocked In")
         self.timer_label = QLabel("")
+        self.loading_label = QLabel("")
 
         self.clock_in_button = QPushButton("🟢 Clock In")
         self.clock_out_button = QPushButton("🔴 Clock Out")
@@ -91,12 +132,15 @@ class AdminDashboard(QWidget):
         self.refresh_button = QPushButton("🔄 Refresh All")
         self.manage_users_button = QPushButton("👥 Manage Users")
         self.logout_button = QPushButton("🚪 Logout")
+        self.auto_refresh_check = QCheckBox("Auto-refresh")
+        self.auto_refresh_check.setChecked(auto_refresh)
 
         self.clock_in_button.clicked.connect(self.handle_clock_in)
         self.clock_out_button.clicked.connect(self.handle_clock_out)
         self.refresh_button.clicked.connect(self.refresh_all)
         self.manage_users_button.clicked.connect(self.open_manage_users)
         self.logout_button.clicked.connect(self.handle_logout)
+        self.auto_refresh_check.toggled.connect(self.set_auto_refresh)
 
         session_filter_box = QGroupBox("🗓️ Filter Sessions")
         session_filter_layout = QHBoxLayout()
@@ -175,30 +219,72 @@ class AdminDashboard(QWidget):
         feedback_filter_box.setLayout(feedback_filter_layout)
         feedback_filter_box.setMaximumHeight(70)
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels([
-            "Employee Name", "Clock In", "Clock Out", "Date",
-            "Work Time (min)", "Sleep Time (min)", "Session ID"
-        ])
+        summary_filter_box = QGroupBox("📈 Summary")
+        summary_filter_layout = QHBoxLayout()
+
+        summary_filter_layout.addWidget(QLabel("From:"))
+        self.summary_from_date = QDateEdit(calendarPopup=True)
+        self.summary_from_date.setDate(QDate(QDate.currentDate().year(), QDate.currentDate().month(), 1))
+        summary_filter_layout.addWidget(self.summary_from_date)
+
+        summary_filter_layout.addWidget(QLabel("To:"))
+        self.summary_to_date = QDateEdit(calendarPopup=True)
+        self.summary_to_date.setDate(QDate.currentDate())
+        summary_filter_layout.addWidget(self.summary_to_date)
+
+        summary_filter_layout.addWidget(QLabel("Per:"))
+        self.summary_period = QComboBox()
+        self.summary_period.addItems(["Employee", "Week", "Day"])
+        summary_filter_layout.addWidget(self.summary_period)
+
+        summary_filter_layout.addWidget(QLabel("Employee:"))
+        self.summary_employee = QLineEdit()
+        self.summary_employee.setPlaceholderText("Search employee name...")
+        summary_filter_layout.addWidget(self.summary_employee)
+
+        self.apply_summary_btn = QPushButton("Show Summary")
+        self.apply_summary_btn.clicked.connect(self.load_summary)
+        summary_filter_layout.addWidget(self.apply_summary_btn)
+        summary_filter_layout.addStretch()
+
+        summary_filter_box.setLayout(summary_filter_layout)
+        summary_filter_box.setMaximumHeight(70)
+
+        # The models pull further pages through the pagers when the view
+        # scrolls to the end (canFetchMore/fetchMore).
+        self.session_model = SessionTableModel(self.session_pager, self, request_more=self.request_sessions_page)
+        self.table = QTableView()
+        self.table.setModel(self.session_model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
 
-        self.feedback_table = QTableWidget()
-        self.feedback_table.setColumnCount(5)
-        self.feedback_table.setHorizontalHeaderLabels([
-            "Employee Name", "Mood", "Comment", "Anonymous", "Submitted At"
-        ])
+        self.feedback_model = FeedbackTableModel(self.feedback_pager, self, request_more=self.request_feedback_page)
+        self.feedback_table = QTableView()
+        self.feedback_table.setModel(self.feedback_model)
         self.feedback_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.feedback_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.feedback_table.setSortingEnabled(True)
         
         self.feedback_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.feedback_table.cellDoubleClicked.connect(self.show_full_comment)
+        self.feedback_table.doubleClicked.connect(self.show_full_comment)
+
+        self.summary_model = RollupTableModel(parent=self)
+        self.summary_table = QTableView()
+        self.summary_table.setModel(self.summary_model)
+        self.summary_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.summary_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.summary_table.setSortingEnabled(True)
+        self.summary_table.setMaximumHeight(200)
 
         top_layout = QHBoxLayout()
         top_layout.addWidget(self.clock_in_button)
         top_layout.addWidget(self.clock_out_button)
         top_layout.addWidget(self.refresh_button)
+        top_layout.addWidget(self.auto_refresh_check)
         top_layout.addWidget(self.manage_users_button)
         top_layout.addWidget(self.logout_button)
+        top_layout.addWidget(self.loading_label)
 
         layout = QVBoxLayout()
         layout.setContentsMargins(20, 20, 20, 20)
@@ -207,6 +293,9 @@ class AdminDashboard(QWidget):
         layout.addWidget(self.timer_label)
         layout.addLayout(top_layout)
 
+        layout.addWidget(summary_filter_box)
+        layout.addWidget(self.summary_table)
+
         layout.addWidget(session_filter_box)
         layout.addWidget(QLabel("📅 Sessions:"))
         layout.addWidget(self.table)
@@ -219,8 +308,10 @@ class AdminDashboard(QWidget):
         self.feedback_shown = False
         
         self.setLayout(layout)
+        self.load_summary()
         self.load_sessions()
         self.load_feedback()
+        self.set_auto_refresh(auto_refresh)
 
     def clear_session_filters(self):
         self.employee_search.clear()
@@ -233,7 +324,7 @@ class AdminDashboard(QWidget):
         day = self.day_combo.currentText()
         month = self.month_combo.currentText()
         year = self.year_combo.currentText()
-        employee_search = self.employee_search.text().strip().lower()
+        employee_search = self.employee_search.text().strip()
         
         start_date = None
         end_date = None
@@ -260,28 +351,20 @@ class AdminDashboard(QWidget):
                     start_date = date(year_int, 1, 1)
                     end_date = date(year_int, 12, 31)
 
-            if start_date and end_date:
-                sessions = fetch_sessions_by_date_range(start_date, end_date)
-            else:
-                sessions = fetch_all_sessions()
-            
-            if employee_search:
-                sessions = [session for session in sessions 
-                        if employee_search in session[0].lower()]
-                
-            self.populate_sessions_table(sessions)
+            # The username prefix is matched by the server, against the
+            # accounts.username index, page by page.
+            self.session_pager.reset(start_date, end_date, employee=employee_search or None)
+            self.request_sessions_page(replace=True)
         
         except (ValueError, TypeError) as e:
             QMessageBox.warning(self, "Invalid Date", "Please select a valid date combination.")
             self.load_sessions()
 
-    def show_full_comment(self, row, column):
-        if column == 2:
-            comment_item = self.feedback_table.item(row, 2)
-            if comment_item:
-                comment = comment_item.text()
-                dialog = CommentViewDialog(comment, self)
-                dialog.exec_()
+    def show_full_comment(self, index):
+        if index.column() == 2:
+            comment = self.feedback_model.value(index.row(), FeedbackTableModel.COMMENT)
+            dialog = CommentViewDialog(comment, self)
+            dialog.exec_()
 
     def clear_feedback_filters(self):
         self.feedback_from_date.setDate(QDate.currentDate().addMonths(-1))
@@ -291,42 +374,79 @@ class AdminDashboard(QWidget):
         self.load_feedback()
 
     def handle_clock_in(self):
-        from database.queries import start_session
         if self.current_session_id:
             QMessageBox.warning(self, "Already Clocked In", "You are already clocked in.")
             return
 
-        self.clock_in_time = datetime.now()
-        self.current_session_id = start_session(self.account_id, self.clock_in_time)
-
-        if self.current_session_id:
-            self.status_label.setText(f"Clocked in at {self.clock_in_time.strftime('%H:%M:%S')}")
-            self.clock_in_button.setEnabled(False)
-            self.clock_out_button.setEnabled(True)
-            self.timer.start(1000)
-            start_timeout_monitor(self.account_id, self.current_session_id, self.clock_in_time)
-            threading.Thread(
-                target=start_activity_monitor,
-                args=(self.account_id, self.current_session_id),
-                daemon=True
-            ).start()
-            self.load_sessions()
-        else:
-            QMessageBox.critical(self, "Error", "Failed to clock in.")
+        self.clock_in_button.setEnabled(False)
+        clock_in_time = datetime.now()
+        self.runner.submit(
+            "clock", get_session_manager().start, self.account_id, clock_in_time,
+            on_result=self.on_clocked_in,
+            on_error=self.on_clock_in_failed
+        )
+
+    def on_clocked_in(self, opened):
+        # A retry after a timed-out attempt gets that attempt's session back.
+        if not opened:
+            self.on_clock_in_failed(None)
+            return
+        session_id, clock_in_time = opened
+
+        self.clock_in_time = clock_in_time
+        self.current_session_id = session_id
+        self.status_label.setText(f"Clocked in at {self.clock_in_time.strftime('%H:%M:%S')}")
+        self.clock_out_button.setEnabled(True)
+        self.timer.start(1000)
+        start_timeout_monitor(self.account_id, self.current_session_id, self.clock_in_time)
+        threading.Thread(
+            target=run_activity_monitor,
+            args=(self.account_id, self.current_session_id),
+            daemon=True
+        ).start()
+        self.refresh_sessions()
+
+    def on_clock_in_failed(self, error):
+        self.clock_in_button.setEnabled(True)
+        QMessageBox.critical(self, "Error", "Failed to clock in.")
 
     def handle_clock_out(self):
-        from database.queries import end_session
+        if not self.current_session_id:
+            return
+        self.clock_out_button.setEnabled(False)
+        clock_out_time = datetime.now()
+        self.runner.submit(
+            "clock", get_session_manager().end, self.current_session_id, clock_out_time,
+            on_result=lambda total_minutes: self.on_clocked_out(total_minutes, clock_out_time),
+            on_error=self.on_clock_out_failed
+        )
+
+    def clock_out_now(self):
+        """Blocking clock-out for logout and close, where no callback would be around to finish it."""
+        self.runner.wait("clock")
         if not self.current_session_id:
             return
         clock_out_time = datetime.now()
-        total_minutes = end_session(self.current_session_id, clock_out_time)
+        total_minutes = get_session_manager().end(self.current_session_id, clock_out_time)
+        self.on_clocked_out(total_minutes, clock_out_time, reload=False)
+
+    def on_clocked_out(self, total_minutes, clock_out_time, reload=True):
         self.status_label.setText(f"Clocked out at {clock_out_time.strftime('%H:%M:%S')} | Total: {total_minutes} min")
         self.timer.stop()
         self.timer_label.setText("")
         self.clock_in_button.setEnabled(True)
         self.clock_out_button.setEnabled(False)
         self.current_session_id = None
-        self.load_sessions()
+        if reload:
+            self.refresh_sessions()
+            self.load_summary()
+
+    def on_clock_out_failed(self, error):
+        self.clock_out_button.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Failed to clock out: {error}")
+
+    def on_busy_changed(self, busy):
+        self.loading_label.setText("⏳ Loading..." if busy else "")
 
     def update_timer(self):
         if self.clock_in_time:
@@ -336,24 +456,39 @@ class AdminDashboard(QWidget):
             self.timer_label.setText(f"⏱ Elapsed Time: {hours:02d}:{minutes:02d}:{seconds:02d}")
 
     def load_sessions(self):
-        sessions = fetch_all_sessions()
-        self.populate_sessions_table(sessions)
+        self.session_pager.reset()
+        self.request_sessions_page(replace=True)
+
+    def request_sessions_page(self, replace=False):
+        # A new request under the same key supersedes one still in flight,
+        # so only the latest filter's rows reach the table. A change fetch
+        # in flight belongs to the old position and is dropped too.
+        self.change_runner.cancel("sessions")
+        self.session_model.fetching = True
+        self.runner.submit(
+            "sessions", self.session_pager.page_query(),
+            on_result=lambda rows: self.on_sessions_page(rows, replace),
+            on_error=self.on_sessions_failed
+        )
+
+    def on_sessions_page(self, rows, replace):
+        self.session_model.fetching = False
+        rows = self.session_pager.accept(rows)
+        if replace:
+            self.populate_sessions_table(rows)
+        else:
+            self.session_model.append_rows(rows)
+
+    def on_sessions_failed(self, error):
+        self.session_model.fetching = False
+        QMessageBox.warning(self, "Error", f"Failed to load sessions: {error}")
 
     def populate_sessions_table(self, sessions):
-        self.table.setRowCount(len(sessions))
-        for row_idx, session in enumerate(sessions):
-            username, clock_in, clock_out, session_date, work_minutes, sleep_minutes, session_id = session
-            self.table.setItem(row_idx, 0, QTableWidgetItem(str(username)))
-            self.table.setItem(row_idx, 1, QTableWidgetItem(str(clock_in)))
-            self.table.setItem(row_idx, 2, QTableWidgetItem(str(clock_out)))
-            self.table.setItem(row_idx, 3, QTableWidgetItem(str(session_date)))
-            self.table.setItem(row_idx, 4, QTableWidgetItem(str(work_minutes)))
-            self.table.setItem(row_idx, 5, QTableWidgetItem(str(sleep_minutes or 0)))
-            self.table.setItem(row_idx, 6, QTableWidgetItem(str(session_id)))
+        self.session_model.set_rows(sessions)
 
     def load_feedback(self):
-        feedbacks = fetch_filtered_feedback()
-        self.populate_feedback_table(feedbacks)
+        self.feedback_pager.reset()
+        self.request_feedback_page(replace=True)
 
     def load_feedback_filtered(self):
         start_date = self.feedback_from_date.date().toPyDate()
@@ -361,31 +496,116 @@ class AdminDashboard(QWidget):
         mood = self.mood_filter.currentText()
         keyword = self.keyword_input.text()
         
-        feedbacks = fetch_filtered_feedback(start_date, end_date, mood, keyword)
-        self.populate_feedback_table(feedbacks)
+        self.feedback_pager.reset(start_date, end_date, mood, keyword)
+        self.request_feedback_page(replace=True)
+
+    def request_feedback_page(self, replace=False):
+        self.change_runner.cancel("feedback")
+        self.feedback_model.fetching = True
+        self.runner.submit(
+            "feedback", self.feedback_pager.page_query(),
+            on_result=lambda rows: self.on_feedback_page(rows, replace),
+            on_error=self.on_feedback_failed
+        )
+
+    def on_feedback_page(self, rows, replace):
+        self.feedback_model.fetching = False
+        rows = self.feedback_pager.accept(rows)
+        if replace:
+            self.populate_feedback_table(rows)
+        else:
+            self.feedback_model.append_rows(rows)
+
+    def on_feedback_failed(self, error):
+        self.feedback_model.fetching = False
+        QMessageBox.warning(self, "Error", f"Failed to load feedback: {error}")
 
     def populate_feedback_table(self, feedbacks):
-        self.feedback_table.setRowCount(len(feedbacks))
-        for row_idx, feedback in enumerate(feedbacks):
-            feedback_id, username, mood, comment, anonymous, submitted_at = feedback
-            display_name = username if username else "Anonymous"
-            self.feedback_table.setItem(row_idx, 0, QTableWidgetItem(display_name))
-            self.feedback_table.setItem(row_idx, 1, QTableWidgetItem(mood))
-            
-            truncated_comment = ""
-            if comment:
-                truncated_comment = comment[:50] + "..." if len(comment) > 50 else comment
-            
-            self.feedback_table.setItem(row_idx, 2, QTableWidgetItem(truncated_comment))
-            self.feedback_table.setItem(row_idx, 3, QTableWidgetItem(anonymous))
-            self.feedback_table.setItem(row_idx, 4, QTableWidgetItem(submitted_at.strftime("%Y-%m-%d %H:%M:%S")))
+        self.feedback_model.set_rows(feedbacks)
+
+    def load_summary(self):
+        # Reads only the rollup tables, so the cost does not grow with history.
+        from_date = self.summary_from_date.date().toPyDate()
+        to_date = self.summary_to_date.date().toPyDate()
+        employee = self.summary_employee.text().strip() or None
+        period = self.summary_period.currentText()
+        fetch = {"Employee": fetch_rollup_totals, "Week": fetch_weekly_rollups, "Day": fetch_daily_rollups}[period]
+        self.runner.submit(
+            "summary", fetch, from_date, to_date, employee,
+            on_result=lambda rows: self.on_summary_loaded(rows, period, from_date, to_date),
+            on_error=self.on_summary_failed
+        )
+
+    def on_summary_loaded(self, rows, period, from_date, to_date):
+        summary = []
+        for row in rows:
+            if period == "Employee":
+                username, _, sessions, work, sleep = row
+                label = f"{from_date} – {to_date}"
+            elif period == "Week":
+                username, iso_year, iso_week, sessions, work, sleep = row
+                label = f"{iso_year}-W{iso_week:02d}"
+            else:
+                username, day, sessions, work, sleep = row
+                label = str(day)
+            clocked = work + sleep
+            summary.append((username, label, sessions, work, sleep,
+                            work / sessions if sessions else 0,
+                            100 * sleep / clocked if clocked else 0))
+        self.summary_model.set_rows(summary)
+
+    def on_summary_failed(self, error):
+        QMessageBox.warning(self, "Error", f"Failed to load summary: {error}")
+
+    def refresh_sessions(self):
+        """Merge the sessions changed since the last fetch into the table, keeping the filter."""
+        if self.runner.is_busy("sessions"):
+            return  # a page on its way will be at least as new
+        query = self.session_pager.changes_query()
+        if query is None:
+            self.load_sessions()
+            return
+        self.change_runner.submit(
+            "sessions", query,
+            on_result=lambda result: self.session_model.merge_rows(self.session_pager.accept_changes(result)),
+            on_error=self.on_changes_failed
+        )
+
+    def refresh_feedback(self):
+        """Merge the feedback added since the last fetch into the table, keeping the filter."""
+        if self.runner.is_busy("feedback"):
+            return
+        query = self.feedback_pager.changes_query()
+        if query is None:
+            self.load_feedback()
+            return
+        self.change_runner.submit(
+            "feedback", query,
+            on_result=lambda result: self.feedback_model.merge_rows(self.feedback_pager.accept_changes(result)),
+            on_error=self.on_changes_failed
+        )
+
+    def on_changes_failed(self, error):
+        # Polled, so no dialog; the next refresh asks again from the same watermark.
+        logger.warning("Fetching changes failed: %s", error)
+
+    def refresh_changes(self):
+        self.refresh_sessions()
+        self.refresh_feedback()
+
+    def set_auto_refresh(self, enabled):
+        if enabled:
+            self.auto_refresh_timer.start()
+        else:
+            self.auto_refresh_timer.stop()
 
     def refresh_all(self):
-        self.load_sessions()
-        self.load_feedback()
+        self.load_summary()
+        self.refresh_changes()
 
     def open_manage_users(self):
         if self.manage_window is None or not self.manage_window.isVisible():
+            from gui.manage_users import ManageUsers
             self.manage_window = ManageUsers()
             self.manage_window.show()
         else:
@@ -395,8 +615,7 @@ class AdminDashboard(QWidget):
     def handle_logout(self):
         self.show_feedback_dialog()
         
-        if self.current_session_id and self.clock_out_button.isEnabled():
-            self.handle_clock_out()
+        self.clock_out_now()
             
         from gui.login_window import LoginWindow
         self.login_window = LoginWindow()
@@ -408,13 +627,13 @@ class AdminDashboard(QWidget):
         QTimer.singleShot(100, self.close)
 
     def closeEvent(self, event):
+        self.auto_refresh_timer.stop()
         self.show_feedback_dialog()
         
         if self.manage_window and self.manage_window.isVisible():
             self.manage_window.close()
 
-        if self.current_session_id:
-            self.handle_clock_out()
+        self.clock_out_now()
 
         event.accept()
     
@@ -424,8 +643,10 @@ class AdminDashboard(QWidget):
             from gui.feedback_dialog import FeedbackDialog
             
             def submit_callback(account_id, mood, comment, anonymous):
-                insert_feedback(account_id, mood, comment, anonymous)
-                self.feedback_given = True
+                feedback_id = insert_feedback(account_id, mood, comment, anonymous)
+                if feedback_id is not None:
+                    self.feedback_given = True
+                return feedback_id
             
             feedback_dialog = FeedbackDialog(self.account_id, submit_callback)
             feedback_dialog.exec_()
\ No newline at end of file
@@ -5,11 +5,20 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import QTimer
 from datetime import datetime
-from database.queries import start_session, end_session, insert_feedback
-from utils.activity_monitor import start_activity_monitor
+from database.queries import insert_feedback
+from utils.session_manager import get_session_manager
 from utils.session_timeout import start_timeout_monitor
+from gui.workers import QueryRunner
 import threading
 
+
+def run_activity_monitor(account_id, session_id):
+    # Imported on the monitor's own thread, on first clock-in: pywin32, wmi
+    # and pythoncom take a while to load and are not needed before that.
+    from utils.activity_monitor import start_activity_monitor
+    start_activity_monitor(account_id, session_id)
+
+
 class EmployeeDashboard(QWidget):
     def __init__(self, account_id):
         super().__init__()
@@ -19,6 +28,7 @@ class EmployeeDashboard(QWidget):
         self.session_id = None
         self.clock_in_time = None
         self.feedback_given = False
+        self.runner = QueryRunner(self)
 
         self.setStyleSheet("""
             QWidget {
@@ -80,32 +90,68 @@ class EmployeeDashboard(QWidget):
         self.timer.timeout.connect(self.update_timer)
 
     def handle_clock_in(self):
-        self.clock_in_time = datetime.now()
-        self.session_id = start_session(self.account_id, self.clock_in_time)
-
-        if self.session_id:
-            self.status_label.setText(f"Clocked in at {self.clock_in_time.strftime('%H:%M:%S')}")
-            self.clock_in_button.setEnabled(False)
-            self.clock_out_button.setEnabled(True)
-            self.timer.start(1000)
-            start_timeout_monitor(self.account_id, self.session_id, self.clock_in_time)
-            threading.Thread(
-                target=start_activity_monitor,
-                args=(self.account_id, self.session_id),
-                daemon=True
-            ).start()
-        else:
-            QMessageBox.critical(self, "Error", "Failed to clock in.")
+        self.clock_in_button.setEnabled(False)
+        self.status_label.setText("Clocking in...")
+        clock_in_time = datetime.now()
+        self.runner.submit(
+            "clock", get_session_manager().start, self.account_id, clock_in_time,
+            on_result=self.on_clocked_in,
+            on_error=self.on_clock_in_failed
+        )
+
+    def on_clocked_in(self, opened):
+        # A retry after a timed-out attempt gets that attempt's session back.
+        if not opened:
+            self.on_clock_in_failed(None)
+            return
+        session_id, clock_in_time = opened
+
+        self.clock_in_time = clock_in_time
+        self.session_id = session_id
+        self.status_label.setText(f"Clocked in at {self.clock_in_time.strftime('%H:%M:%S')}")
+        self.clock_out_button.setEnabled(True)
+        self.timer.start(1000)
+        start_timeout_monitor(self.account_id, self.session_id, self.clock_in_time)
+        threading.Thread(
+            target=run_activity_monitor,
+            args=(self.account_id, self.session_id),
+            daemon=True
+        ).start()
+
+    def on_clock_in_failed(self, error):
+        self.clock_in_button.setEnabled(True)
+        self.status_label.setText("Status: Not Clocked In")
+        QMessageBox.critical(self, "Error", "Failed to clock in.")
 
     def handle_clock_out(self):
+        self.clock_out_button.setEnabled(False)
+        self.status_label.setText("Clocking out...")
         clock_out_time = datetime.now()
-        total_minutes = end_session(self.session_id, clock_out_time)
+        self.runner.submit(
+            "clock", get_session_manager().end, self.session_id, clock_out_time,
+            on_result=lambda total_minutes: self.on_clocked_out(total_minutes, clock_out_time),
+            on_error=self.on_clock_out_failed
+        )
+
+    def clock_out_now(self):
+        """Blocking clock-out for logout and close, where no callback would be around to finish it."""
+        self.runner.wait("clock")
+        if self.session_id and self.clock_out_button.isEnabled():
+            clock_out_time = datetime.now()
+            self.on_clocked_out(get_session_manager().end(self.session_id, clock_out_time), clock_out_time)
+
+    def on_clocked_out(self, total_minutes, clock_out_time):
         self.status_label.setText(f"Clocked out at {clock_out_time.strftime('%H:%M:%S')}\nTotal: {total_minutes} min")
         self.timer.stop()
         self.timer_label.setText("")
         self.clock_in_button.setEnabled(True)
         self.clock_out_button.setEnabled(False)
 
+    def on_clock_out_failed(self, error):
+        self.clock_out_button.setEnabled(True)
+        self.status_label.setText(f"Clocked in at {self.clock_in_time.strftime('%H:%M:%S')}")
+        QMessageBox.critical(self, "Error", f"Failed to clock out: {error}")
+
     def update_timer(self):
         if self.clock_in_time:
             elapsed = datetime.now() - self.clock_in_time
@@ -117,24 +163,20 @@ class EmployeeDashboard(QWidget):
         if not self.feedback_given:
             from gui.feedback_dialog import FeedbackDialog
             def submit_callback(account_id, mood, comment, anonymous):
-                insert_feedback(account_id, mood, comment, anonymous)
+                return insert_feedback(account_id, mood, comment, anonymous)
             feedback_dialog = FeedbackDialog(self.account_id, submit_callback)
             feedback_dialog.exec_()
             self.feedback_given = True
 
     def closeEvent(self, event):
         self.show_feedback_dialog()
-
-        if self.session_id and self.clock_out_button.isEnabled():
-            self.handle_clock_out()
+        self.clock_out_now()
 
         event.accept()
 
     def handle_logout(self):
         self.show_feedback_dialog()
-
-        if self.session_id and self.clock_out_button.isEnabled():
-            self.handle_clock_out()
+        self.clock_out_now()
 
         from gui.login_window import LoginWindow
         self.login_window = LoginWindow()
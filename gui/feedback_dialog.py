@@ -71,5 +71,11 @@ class FeedbackDialog(QDialog):
             QMessageBox.warning(self, "Validation Error", "Please select your mood before submitting.")
             return
 
-        self.submit_callback(self.account_id, mood, comment, anonymous)
+        # submit_callback returns the stored feedback's id, or None if the
+        # account no longer accepts entries (it is being removed).
+        if self.submit_callback(self.account_id, mood, comment, anonymous) is None:
+            QMessageBox.warning(self, "Feedback Not Saved",
+                                "Your feedback could not be saved because this account is being removed.")
+            self.reject()
+            return
         self.accept()
@@ -3,15 +3,33 @@ from PyQt5.QtWidgets import (
     QMessageBox, QCheckBox, QSpacerItem, QSizePolicy
 )
 from PyQt5.QtCore import Qt
-from database.queries import authenticate_user
-from gui.admin_dashboard import AdminDashboard
-from gui.employee_dashboard import EmployeeDashboard
+import logging
+import threading
+from database.db_connection import warm_up
+from database.auth import authenticate_user
+from gui.workers import QueryRunner
+from utils import startup_timing
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_connection():
+    # Runs while the user types, so authenticate_user finds an open
+    # connection instead of paying for the ODBC connect.
+    with startup_timing.measure("database connection warm-up"):
+        try:
+            warm_up()
+        except Exception:
+            logger.warning("Could not open a database connection ahead of login", exc_info=True)
+
 
 class LoginWindow(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Login")
         self.setFixedSize(400, 320)
+        self.runner = QueryRunner(self)
+        threading.Thread(target=warm_up_connection, name="db-warm-up", daemon=True).start()
 
         self.setStyleSheet("""
             QWidget {
@@ -88,20 +106,52 @@ class LoginWindow(QWidget):
         self.password_input.setEchoMode(QLineEdit.Normal if state == Qt.Checked else QLineEdit.Password)
 
     def handle_login(self):
+        if self.runner.is_busy("login"):
+            return
         username = self.username_input.text()
         password = self.password_input.text()
+        startup_timing.skip("waiting for credentials")
+
+        self.login_button.setEnabled(False)
+        self.login_button.setText("⏳ Signing in...")
+        self.runner.submit(
+            "login", authenticate_user, username, password,
+            on_result=self.on_authenticated,
+            on_error=self.on_login_failed
+        )
+
+    def on_login_failed(self, error):
+        self.reset_login_button()
+        QMessageBox.critical(self, "Login Failed", f"Could not reach the database: {error}")
+
+    def reset_login_button(self):
+        self.login_button.setEnabled(True)
+        self.login_button.setText("🔓 Login")
 
-        account_id, role = authenticate_user(username, password)
+    def on_authenticated(self, result):
+        self.reset_login_button()
+        account_id, role = result
+        startup_timing.mark("authenticate")
 
+        # The dashboards are imported only now, so the login window does not
+        # wait for their modules (and whatever they import) to load.
         if account_id is None:
             QMessageBox.warning(self, "Login Failed", "User is not enabled or invalid credentials.")
         elif role == 'admin':
+            from gui.admin_dashboard import AdminDashboard
+            startup_timing.mark("import admin dashboard")
             self.admin = AdminDashboard(account_id)
             self.admin.show()
+            startup_timing.mark("build admin dashboard")
             self.close()
+            startup_timing.finish()
         elif role == 'employee':
+            from gui.employee_dashboard import EmployeeDashboard
+            startup_timing.mark("import employee dashboard")
             self.emp = EmployeeDashboard(account_id)
             self.emp.show()
+            startup_timing.mark("build employee dashboard")
             self.close()
+            startup_timing.finish()
         else:
             QMessageBox.warning(self, "Login Failed", "Invalid username or password.")
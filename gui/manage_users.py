@@ -1,18 +1,103 @@
 # gui/manage_users.py
+import csv
+
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem,
-    QPushButton, QHBoxLayout, QLineEdit, QComboBox, QMessageBox, QHeaderView
+    QWidget, QVBoxLayout, QLabel, QTableView, QStyledItemDelegate, QStyleOptionViewItem,
+    QStyle, QApplication, QPushButton, QHBoxLayout, QLineEdit, QComboBox, QMessageBox,
+    QHeaderView, QFileDialog, QAbstractItemView
+)
+from PyQt5.QtCore import Qt, QEvent, QModelIndex, QPersistentModelIndex, QRect, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QPainter
+
+from database.queries import (
+    fetch_all_users, create_user, toggle_user_status, create_users_bulk, set_users_status
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor, QFont
+from database.purge import purge_users, resume_purges
+from gui.table_models import UserTableModel
+from gui.workers import QueryRunner
+
+# A purge keeps going in the background however long it takes; past this the
+# window just stops reporting on it, and the next open resumes it if needed.
+PURGE_TIMEOUT = 24 * 3600
+
+
+def read_users_csv(path):
+    """(line, username, password, role) for each row of a username,password,role CSV."""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        rows = []
+        for line, record in enumerate(csv.reader(file), 1):
+            if not record or (line == 1 and [field.strip().lower() for field in record[:3]] == ["username", "password", "role"]):
+                continue
+            record = (record + ["", "", ""])[:3]
+            rows.append((line, *record))
+    return rows
+
+
+class ActionButtonDelegate(QStyledItemDelegate):
+    """
+    Paints a column's text as a button and reports clicks on it, so action
+    columns need no widget per row. color_of(index) picks the button color.
+    """
+    clicked = pyqtSignal(QModelIndex)
+
+    def __init__(self, color_of, parent=None):
+        super().__init__(parent)
+        self.color_of = color_of
+        self._pressed = None
+
+    @staticmethod
+    def button_rect(rect):
+        width = min(100, rect.width() - 10)
+        height = min(26, rect.height() - 4)
+        return QRect(rect.center().x() - width // 2, rect.center().y() - height // 2, width, height)
+
+    def paint(self, painter, option, index):
+        # Cell background (alternating rows, selection) as usual, minus the text.
+        cell = QStyleOptionViewItem(option)
+        self.initStyleOption(cell, index)
+        cell.text = ""
+        style = cell.widget.style() if cell.widget else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, cell, painter, cell.widget)
+
+        color = QColor(self.color_of(index))
+        if self._pressed is not None and QModelIndex(self._pressed) == index:
+            color = color.darker(125)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(color)
+        rect = self.button_rect(option.rect)
+        painter.drawRoundedRect(rect, 4, 4)
+        font = QFont(option.font)
+        font.setBold(True)
+        font.setPointSize(9)
+        painter.setFont(font)
+        painter.setPen(QColor("white"))
+        painter.drawText(rect, Qt.AlignCenter, index.data())
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() not in (QEvent.MouseButtonPress, QEvent.MouseButtonRelease) \
+                or event.button() != Qt.LeftButton:
+            return False
+        inside = self.button_rect(option.rect).contains(event.pos())
+        if event.type() == QEvent.MouseButtonPress:
+            self._pressed = QPersistentModelIndex(index) if inside else None
+            return inside
+        pressed, self._pressed = self._pressed, None
+        if pressed is not None and QModelIndex(pressed) == index and inside:
+            self.clicked.emit(index)
+            return True
+        return False
 
-from database.queries import fetch_all_users, create_user, toggle_user_status, delete_user
 
 class ManageUsers(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("User Management")
         self.resize(900, 500)  # Increased width to accommodate delete button
+        self.runner = QueryRunner(self)
 
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
@@ -22,6 +107,12 @@ class ManageUsers(QWidget):
         header.setStyleSheet("font-size: 22px; font-weight: bold; margin-bottom: 12px;")
         self.layout.addWidget(header, alignment=Qt.AlignLeft)
 
+        self.loading_label = QLabel("")
+        self.layout.addWidget(self.loading_label)
+        self.runner.busy_changed.connect(
+            lambda busy: self.loading_label.setText("⏳ Working..." if busy else "")
+        )
+
         # Input Form Layout
         form_layout = QHBoxLayout()
         self.username_input = QLineEdit()
@@ -45,15 +136,49 @@ class ManageUsers(QWidget):
         form_layout.addWidget(self.password_input)
         form_layout.addWidget(self.role_combo)
         form_layout.addWidget(self.add_user_btn)
+
+        self.import_btn = QPushButton("📄 Import CSV")
+        self.import_btn.clicked.connect(self.import_users)
+        self.import_btn.setStyleSheet(self.button_style("#5C2D91"))
+        form_layout.addWidget(self.import_btn)
         form_layout.setSpacing(15)
 
         self.layout.addLayout(form_layout)
 
+        # Actions on the selected rows
+        bulk_layout = QHBoxLayout()
+        self.enable_selected_btn = QPushButton("Enable Selected")
+        self.enable_selected_btn.setStyleSheet(self.button_style("#107C10"))
+        self.enable_selected_btn.clicked.connect(lambda: self.set_selected_status("Active"))
+        self.disable_selected_btn = QPushButton("Disable Selected")
+        self.disable_selected_btn.setStyleSheet(self.button_style("#F7630C"))
+        self.disable_selected_btn.clicked.connect(lambda: self.set_selected_status("Disabled"))
+        self.delete_selected_btn = QPushButton("Delete Selected")
+        self.delete_selected_btn.setStyleSheet(self.button_style("#D13438"))
+        self.delete_selected_btn.clicked.connect(self.delete_selected)
+        for button in (self.enable_selected_btn, self.disable_selected_btn, self.delete_selected_btn):
+            button.setMaximumWidth(140)
+            bulk_layout.addWidget(button)
+        bulk_layout.addStretch()
+        self.layout.addLayout(bulk_layout)
+
         # Table Setup
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)  # Increased columns for delete button
-        self.table.setHorizontalHeaderLabels(["ID", "Username", "Role", "Status", "Toggle", "Delete"])
-        
+        self.model = UserTableModel(parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+
+        # Action columns are painted by delegates; clicks come back as signals.
+        self.toggle_delegate = ActionButtonDelegate(
+            lambda index: "#F7630C" if self.model.value(index.row(), UserTableModel.STATUS) == "Active"
+            else "#107C10",
+            self.table
+        )
+        self.toggle_delegate.clicked.connect(self.on_toggle_clicked)
+        self.delete_delegate = ActionButtonDelegate(lambda index: "#D13438", self.table)
+        self.delete_delegate.clicked.connect(self.on_delete_clicked)
+        self.table.setItemDelegateForColumn(UserTableModel.TOGGLE_COLUMN, self.toggle_delegate)
+        self.table.setItemDelegateForColumn(UserTableModel.DELETE_COLUMN, self.delete_delegate)
+
         # Set specific column widths to ensure buttons fit properly
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.Fixed)  # ID column
@@ -62,27 +187,33 @@ class ManageUsers(QWidget):
         header.setSectionResizeMode(3, QHeaderView.Fixed)  # Status column
         header.setSectionResizeMode(4, QHeaderView.Fixed)  # Toggle column
         header.setSectionResizeMode(5, QHeaderView.Fixed)  # Delete column
-        
+
         self.table.setColumnWidth(0, 60)   # ID
         self.table.setColumnWidth(2, 100)  # Role
         self.table.setColumnWidth(3, 100)  # Status
         self.table.setColumnWidth(4, 110)  # Toggle (wider for button)
         self.table.setColumnWidth(5, 110)  # Delete (wider for button)
-        
+        self.table.verticalHeader().setDefaultSectionSize(40)  # Slightly taller rows for better button fit
+
         self.table.setStyleSheet("""
-            QTableWidget { 
+            QTableView { 
                 font-size: 14px; 
                 gridline-color: #e0e0e0;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
             }
         """)
         self.table.setAlternatingRowColors(True)
-        self.table.setSelectionBehavior(self.table.SelectRows)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.layout.addWidget(self.table)
 
+        self.purge_label = QLabel("")
+        self.layout.addWidget(self.purge_label)
+
         self.load_users()
+        self.resume_purges()
 
     def button_style(self, color="#0078D7"):
         return f"""
@@ -107,52 +238,18 @@ class ManageUsers(QWidget):
         """
 
     def load_users(self):
-        users = fetch_all_users()
-        self.table.setRowCount(len(users))
-
-        for row, (user_id, username, role, status) in enumerate(users):
-            self.table.setItem(row, 0, QTableWidgetItem(str(user_id)))
-            self.table.setItem(row, 1, QTableWidgetItem(username))
-            self.table.setItem(row, 2, QTableWidgetItem(role))
-
-            status_item = QTableWidgetItem(status)
-            status_color = QColor("green") if status == "Active" else QColor("red")
-            status_item.setForeground(status_color)
-            self.table.setItem(row, 3, status_item)
-
-            # Toggle button - properly sized to fit in cell
-            toggle_btn = QPushButton("Disable" if status == "Active" else "Enable")
-            toggle_btn.setStyleSheet(self.button_style("#F7630C" if status == "Active" else "#107C10"))
-            toggle_btn.setMaximumSize(100, 26)  # Constrain button size
-            toggle_btn.clicked.connect(
-                lambda checked, uid=user_id, stat=status: self.toggle_user(uid, stat)
-            )
-            
-            # Create a container widget to center the button
-            toggle_container = QWidget()
-            toggle_layout = QHBoxLayout(toggle_container)
-            toggle_layout.addWidget(toggle_btn)
-            toggle_layout.setContentsMargins(5, 2, 5, 2)
-            toggle_layout.setAlignment(Qt.AlignCenter)
-            self.table.setCellWidget(row, 4, toggle_container)
-
-            # Delete button - properly sized to fit in cell
-            delete_btn = QPushButton("Delete")
-            delete_btn.setStyleSheet(self.button_style("#D13438"))  # Red color for delete
-            delete_btn.setMaximumSize(100, 26)  # Constrain button size
-            delete_btn.clicked.connect(
-                lambda checked, uid=user_id, uname=username: self.delete_user(uid, uname)
-            )
-            
-            # Create a container widget to center the button
-            delete_container = QWidget()
-            delete_layout = QHBoxLayout(delete_container)
-            delete_layout.addWidget(delete_btn)
-            delete_layout.setContentsMargins(5, 2, 5, 2)
-            delete_layout.setAlignment(Qt.AlignCenter)
-            self.table.setCellWidget(row, 5, delete_container)
-
-            self.table.setRowHeight(row, 40)  # Slightly taller rows for better button fit
+        self.runner.submit("users", fetch_all_users, on_result=self.populate_users)
+
+    def populate_users(self, users):
+        self.model.set_rows(users)
+
+    def on_toggle_clicked(self, index):
+        self.toggle_user(self.model.value(index.row(), UserTableModel.ID),
+                         self.model.value(index.row(), UserTableModel.STATUS))
+
+    def on_delete_clicked(self, index):
+        self.delete_user(self.model.value(index.row(), UserTableModel.ID),
+                         self.model.value(index.row(), UserTableModel.USERNAME))
 
     def create_user(self):
         username = self.username_input.text().strip()
@@ -163,23 +260,39 @@ class ManageUsers(QWidget):
             QMessageBox.warning(self, "Input Error", "Username and password are required.")
             return
 
-        try:
-            create_user(username, password, role)
-            QMessageBox.information(self, "Success", "User created successfully.")
-            self.username_input.clear()
-            self.password_input.clear()
-            self.load_users()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to create user: {e}")
+        self.add_user_btn.setEnabled(False)
+        self.runner.submit(
+            "create", create_user, username, password, role,
+            on_result=self.on_user_created,
+            on_error=self.on_create_failed
+        )
+
+    def on_user_created(self, _):
+        self.add_user_btn.setEnabled(True)
+        QMessageBox.information(self, "Success", "User created successfully.")
+        self.username_input.clear()
+        self.password_input.clear()
+        self.load_users()
+
+    def on_create_failed(self, e):
+        self.add_user_btn.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Failed to create user: {e}")
 
     def toggle_user(self, user_id, current_status):
         new_status = "Disabled" if current_status == "Active" else "Active"
-        try:
-            toggle_user_status(user_id, 'inactive' if new_status == "Disabled" else 'active')
-            self.load_users()
-            QMessageBox.information(self, "Success", f"User status updated to {new_status}.")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to update user status: {e}")
+        self.runner.submit(
+            ("toggle", user_id), toggle_user_status, user_id,
+            'inactive' if new_status == "Disabled" else 'active',
+            on_result=lambda _: self.on_user_toggled(user_id, new_status),
+            on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to update user status: {e}")
+        )
+
+    def on_user_toggled(self, user_id, new_status):
+        # Only this row changes; no need to reload the list.
+        row = self.model.find_row(UserTableModel.ID, user_id)
+        if row >= 0:
+            self.model.set_value(row, UserTableModel.STATUS, new_status)
+        QMessageBox.information(self, "Success", f"User status updated to {new_status}.")
 
     def delete_user(self, user_id, username):
         # Confirmation dialog
@@ -197,9 +310,128 @@ class ManageUsers(QWidget):
         )
 
         if reply == QMessageBox.Yes:
-            try:
-                delete_user(user_id)
-                QMessageBox.information(self, "Success", f"User '{username}' deleted successfully.")
-                self.load_users()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to delete user: {e}")
\ No newline at end of file
+            self.purge([(user_id, username)])
+
+    def purge(self, users):
+        """
+        Disable the accounts right away, then delete their data in small
+        batches in the background, showing progress as it goes.
+        """
+        user_ids = [user_id for user_id, _ in users]
+        self.runner.submit(
+            ("purge", tuple(user_ids)), purge_users, user_ids,
+            timeout=PURGE_TIMEOUT,
+            on_progress=lambda username, stage, deleted: self.on_purge_progress(user_ids, username, stage, deleted),
+            on_result=lambda _: self.on_users_deleted(users),
+            on_error=lambda e: self.on_purge_failed(e)
+        )
+
+    def resume_purges(self):
+        self.runner.submit(
+            ("purge", "resume"), resume_purges,
+            timeout=PURGE_TIMEOUT,
+            on_progress=lambda username, stage, deleted: self.on_purge_progress([], username, stage, deleted),
+            on_result=lambda completed: self.purge_label.setText(""),
+            on_error=lambda e: self.on_purge_failed(e)
+        )
+
+    def on_purge_progress(self, user_ids, username, stage, deleted):
+        if stage == "disabled":
+            # The accounts are disabled and hidden; drop their rows now.
+            for user_id in user_ids:
+                row = self.model.find_row(UserTableModel.ID, user_id)
+                if row >= 0:
+                    self.model.remove_row(row)
+        else:
+            self.purge_label.setText(f"🗑 Deleting '{username}': {deleted:,} rows removed ({stage})")
+
+    def on_users_deleted(self, users):
+        self.purge_label.setText("")
+        if len(users) == 1:
+            QMessageBox.information(self, "Success", f"User '{users[0][1]}' deleted successfully.")
+        else:
+            QMessageBox.information(self, "Success", f"{len(users)} user(s) deleted.")
+
+    def on_purge_failed(self, e):
+        self.purge_label.setText("")
+        QMessageBox.critical(self, "Error", f"Failed to delete user data: {e}\n\n"
+                                            "The deletion will continue the next time this window opens.")
+
+    def selected_users(self):
+        """(id, username) of every selected row."""
+        rows = sorted(index.row() for index in self.table.selectionModel().selectedRows())
+        return [(self.model.value(row, UserTableModel.ID), self.model.value(row, UserTableModel.USERNAME))
+                for row in rows]
+
+    def set_selected_status(self, new_status):
+        users = self.selected_users()
+        if not users:
+            QMessageBox.information(self, "No Selection", "Select one or more users first.")
+            return
+        self.runner.submit(
+            "bulk", set_users_status, [user_id for user_id, _ in users],
+            'active' if new_status == "Active" else 'inactive',
+            on_result=lambda count: self.on_bulk_done(f"{count} user(s) set to {new_status}."),
+            on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to update users: {e}")
+        )
+
+    def delete_selected(self):
+        users = self.selected_users()
+        if not users:
+            QMessageBox.information(self, "No Selection", "Select one or more users first.")
+            return
+        names = ", ".join(username for _, username in users[:10]) + (" …" if len(users) > 10 else "")
+        reply = QMessageBox.question(
+            self,
+            "Confirm Delete",
+            f"Are you sure you want to delete {len(users)} user(s)?\n\n{names}\n\n"
+            "⚠️ This action cannot be undone and will remove their accounts, "
+            "sessions and all related data.\n\n"
+            "Continue with deletion?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            self.purge(users)
+
+    def on_bulk_done(self, message):
+        self.load_users()
+        QMessageBox.information(self, "Success", message)
+
+    def import_users(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Import Users", "", "CSV Files (*.csv);;All Files (*)"
+        )
+        if not path:
+            return
+        try:
+            rows = read_users_csv(path)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            QMessageBox.critical(self, "Error", f"Could not read {path}: {e}")
+            return
+
+        self.import_btn.setEnabled(False)
+        self.runner.submit(
+            "import", create_users_bulk, rows,
+            timeout=600,
+            on_result=self.on_users_imported,
+            on_error=self.on_import_failed
+        )
+
+    def on_users_imported(self, result):
+        self.import_btn.setEnabled(True)
+        created, conflicts = result
+        self.load_users()
+        message = f"{created} user(s) created."
+        if conflicts:
+            shown = "\n".join(f"Line {line}: {username or '(blank)'} – {reason}"
+                               for line, username, reason in conflicts[:20])
+            more = f"\n… and {len(conflicts) - 20} more" if len(conflicts) > 20 else ""
+            QMessageBox.warning(self, "Import Finished",
+                                f"{message}\n{len(conflicts)} row(s) skipped:\n\n{shown}{more}")
+        else:
+            QMessageBox.information(self, "Import Finished", message)
+
+    def on_import_failed(self, e):
+        self.import_btn.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Failed to import users: {e}")
@@ -0,0 +1,68 @@
+# gui/paging.py
+
+class KeysetPager:
+    """
+    Walks a keyset-paginated query one page at a time.
+    fetch_page(*args, after=key, limit=n) returns rows; key_of(row) gives the seek key.
+
+    page_query() snapshots the current position into a callable that can run
+    on a worker thread; accept(rows) then advances the pager on the GUI thread.
+
+    With fetch_first(*args, limit=n) returning (rows, watermark), the first
+    page also records a change watermark. changes_query() then snapshots a
+    fetch_changes(watermark, *args) call returning (rows, watermark), and
+    accept_changes() advances the watermark and keeps the changed rows that
+    fall within the pages loaded so far.
+    """
+    def __init__(self, fetch_page, key_of, page_size, fetch_first=None, fetch_changes=None):
+        self.fetch_page = fetch_page
+        self.key_of = key_of
+        self.page_size = page_size
+        self.fetch_first = fetch_first
+        self.fetch_changes = fetch_changes
+        self.reset()
+
+    def reset(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.after = None
+        self.has_more = True
+        self.watermark = None
+
+    def page_query(self):
+        fetch_page, args, kwargs = self.fetch_page, self.args, dict(self.kwargs)
+        after, limit = self.after, self.page_size
+        if after is None and self.fetch_first is not None:
+            fetch_first = self.fetch_first
+            return lambda: fetch_first(*args, limit=limit, **kwargs)
+        return lambda: fetch_page(*args, after=after, limit=limit, **kwargs)
+
+    def accept(self, rows):
+        if isinstance(rows, tuple):
+            rows, self.watermark = rows
+        if len(rows) < self.page_size:
+            self.has_more = False
+        if rows:
+            self.after = self.key_of(rows[-1])
+        return rows
+
+    def next_page(self):
+        if not self.has_more:
+            return []
+        return self.accept(self.page_query()())
+
+    def changes_query(self):
+        """A fetch_changes call from the current watermark, or None before there is one."""
+        if self.fetch_changes is None or self.watermark is None:
+            return None
+        fetch_changes, watermark, args, kwargs = self.fetch_changes, self.watermark, self.args, dict(self.kwargs)
+        return lambda: fetch_changes(watermark, *args, **kwargs)
+
+    def accept_changes(self, result):
+        rows, watermark = result
+        if watermark is not None:
+            self.watermark = watermark
+        # Rows past the last loaded page arrive with the next page instead.
+        if self.has_more and self.after is not None:
+            rows = [row for row in rows if self.key_of(row) >= self.after]
+        return rows
@@ -0,0 +1,252 @@
+# gui/table_models.py
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtGui import QColor
+
+
+def _sort_key(value):
+    # None sorts after every real value instead of raising on comparison.
+    return (value is None, value)
+
+
+class ColumnarTableModel(QAbstractTableModel):
+    """
+    Read-only table model that keeps query rows as one list per source column
+    and only formats the cells Qt asks to paint.
+
+    Subclasses define COLUMNS as (header, source column index, formatter).
+    An optional KeysetPager lets the view pull further pages via fetchMore().
+    When request_more is given, fetchMore() calls it instead of querying
+    inline; the owner loads the page in the background, then clears
+    `fetching` and calls append_rows().
+    """
+    COLUMNS = ()
+    SOURCE_WIDTH = 0
+
+    def __init__(self, pager=None, parent=None, request_more=None):
+        super().__init__(parent)
+        self.pager = pager
+        self.request_more = request_more
+        self.fetching = False
+        self._columns = [[] for _ in range(self.SOURCE_WIDTH)]
+        self._row_count = 0
+        self._sort_column = -1
+        self._sort_order = Qt.AscendingOrder
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        _, source, formatter = self.COLUMNS[index.column()]
+        return formatter(self._columns[source][index.row()])
+
+    def value(self, row, source_column):
+        """Unformatted value of a source column for the given row."""
+        return self._columns[source_column][row]
+
+    def set_value(self, row, source_column, value):
+        """Change one stored value and repaint just that row."""
+        self._columns[source_column][row] = value
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        for column in self._columns:
+            del column[row]
+        self._row_count -= 1
+        self.endRemoveRows()
+
+    def find_row(self, source_column, value):
+        """First row whose source column equals value, or -1."""
+        try:
+            return self._columns[source_column].index(value)
+        except ValueError:
+            return -1
+
+    def set_rows(self, rows):
+        """Replace the contents with a single model reset."""
+        self.beginResetModel()
+        self._columns = [[] for _ in range(self.SOURCE_WIDTH)]
+        self._row_count = 0
+        self._extend(rows)
+        self._apply_sort()
+        self.endResetModel()
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        first = self._row_count
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._extend(rows)
+        self.endInsertRows()
+        if self._sort_column >= 0:
+            self._resort()
+
+    def merge_rows(self, rows):
+        """
+        Apply changed rows by id (the ID source column, which subclasses
+        that merge must define): a known row is overwritten in place and
+        repainted only if a value differs, an unknown one is inserted at
+        the top in the order given.
+        """
+        if not rows:
+            return
+        ids = self._columns[self.ID]
+        row_of = {value: row for row, value in enumerate(ids)}
+        new_rows = []
+        changed = False
+        for source in rows:
+            row = row_of.get(source[self.ID])
+            if row is None:
+                new_rows.append(source)
+            elif any(column[row] != value for column, value in zip(self._columns, source)):
+                for column, value in zip(self._columns, source):
+                    column[row] = value
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+                changed = True
+        if new_rows:
+            self.beginInsertRows(QModelIndex(), 0, len(new_rows) - 1)
+            for column, values in zip(self._columns, zip(*new_rows)):
+                column[0:0] = values
+            self._row_count += len(new_rows)
+            self.endInsertRows()
+        if (changed or new_rows) and self._sort_column >= 0:
+            self._resort()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return (not parent.isValid() and self.pager is not None
+                and self.pager.has_more and not self.fetching)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        if self.request_more is not None:
+            self.fetching = True
+            self.request_more()
+        else:
+            self.append_rows(self.pager.next_page())
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        if column >= 0:
+            self._resort()
+
+    def _resort(self):
+        self.layoutAboutToBeChanged.emit()
+        permutation = self._apply_sort()
+        old_to_new = {old: new for new, old in enumerate(permutation)}
+        for index in self.persistentIndexList():
+            new_row = old_to_new[index.row()]
+            self.changePersistentIndex(index, self.index(new_row, index.column()))
+        self.layoutChanged.emit()
+
+    def _extend(self, rows):
+        for column, values in zip(self._columns, zip(*rows)):
+            column.extend(values)
+        self._row_count += len(rows)
+
+    def _apply_sort(self):
+        if self._sort_column < 0 or not self._row_count:
+            return range(self._row_count)
+        keys = self._columns[self.COLUMNS[self._sort_column][1]]
+        permutation = sorted(range(self._row_count), key=lambda row: _sort_key(keys[row]),
+                             reverse=self._sort_order == Qt.DescendingOrder)
+        self._columns = [[column[row] for row in permutation] for column in self._columns]
+        return permutation
+
+
+def _text(value):
+    return str(value)
+
+
+def _timestamp(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+def _truncated(value):
+    if not value:
+        return ""
+    return value[:50] + "..." if len(value) > 50 else value
+
+
+class SessionTableModel(ColumnarTableModel):
+    # Source rows: (username, clock_in, clock_out, session_date, work_minutes, sleep_minutes, id)
+    SOURCE_WIDTH = 7
+    ID = 6
+    COLUMNS = (
+        ("Employee Name", 0, _text),
+        ("Clock In", 1, _text),
+        ("Clock Out", 2, _text),
+        ("Date", 3, _text),
+        ("Work Time (min)", 4, _text),
+        ("Sleep Time (min)", 5, lambda value: str(value or 0)),
+        ("Session ID", 6, _text),
+    )
+
+
+class FeedbackTableModel(ColumnarTableModel):
+    # Source rows: (id, username, mood, comment, anonymous, submitted_at)
+    SOURCE_WIDTH = 6
+    ID = 0
+    COMMENT = 3
+    COLUMNS = (
+        ("Employee Name", 1, lambda value: value if value else "Anonymous"),
+        ("Mood", 2, _text),
+        ("Comment", COMMENT, _truncated),
+        ("Anonymous", 4, _text),
+        ("Submitted At", 5, _timestamp),
+    )
+
+
+class UserTableModel(ColumnarTableModel):
+    # Source rows: (id, username, role, status)
+    SOURCE_WIDTH = 4
+    ID = 0
+    USERNAME = 1
+    STATUS = 3
+    STATUS_COLUMN = 3
+    TOGGLE_COLUMN = 4
+    DELETE_COLUMN = 5
+    COLUMNS = (
+        ("ID", ID, _text),
+        ("Username", USERNAME, _text),
+        ("Role", 2, _text),
+        ("Status", STATUS, _text),
+        # Action columns, painted as buttons by ActionButtonDelegate
+        ("Toggle", STATUS, lambda status: "Disable" if status == "Active" else "Enable"),
+        ("Delete", ID, lambda _: "Delete"),
+    )
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.ForegroundRole and index.isValid() and index.column() == self.STATUS_COLUMN:
+            return QColor("green") if self._columns[self.STATUS][index.row()] == "Active" else QColor("red")
+        return super().data(index, role)
+
+
+def _percent(value):
+    return f"{value:.1f}%"
+
+
+class RollupTableModel(ColumnarTableModel):
+    # Source rows: (username, period, sessions, work_minutes, sleep_minutes,
+    #               work minutes per session, sleep share of clocked time in %)
+    SOURCE_WIDTH = 7
+    COLUMNS = (
+        ("Employee Name", 0, _text),
+        ("Period", 1, _text),
+        ("Sessions", 2, _text),
+        ("Work Time (min)", 3, _text),
+        ("Sleep Time (min)", 4, _text),
+        ("Avg Work / Session (min)", 5, lambda value: f"{value:.0f}"),
+        ("Sleep Ratio", 6, _percent),
+    )
@@ -0,0 +1,170 @@
+# gui/workers.py
+import itertools
+import time
+
+from PyQt5.QtCore import QEventLoop, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from database import instrumentation
+
+# A little longer than the server-side query timeout (db_connection), so a
+# stuck statement normally fails on its own before the UI gives up on it.
+DEFAULT_TIMEOUT = 35.0
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class _Signals(QObject):
+    finished = pyqtSignal(int, object, object)  # token, result, error
+    progress = pyqtSignal(int, object)          # token, value
+
+
+class _Job(QRunnable):
+    def __init__(self, token, signals, fn, args, kwargs):
+        super().__init__()
+        self.token = token
+        self.signals = signals
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result, error = self.fn(*self.args, **self.kwargs), None
+        except Exception as e:
+            result, error = None, e
+        self.signals.finished.emit(self.token, result, error)
+
+
+class QueryRunner(QObject):
+    """
+    Runs blocking database calls on a QThreadPool and delivers the outcome on
+    the GUI thread.
+
+    Every call is submitted under a key. Submitting again with the same key
+    supersedes the call in flight: its result is dropped when it arrives, so
+    rapid filter changes only ever paint the latest answer. cancel(key) drops
+    the in-flight call the same way; a call that has not finished after its
+    timeout is reported to on_error as QueryTimeout and its late result is
+    dropped too. The statement itself is bounded by the connection's query
+    timeout.
+
+    With on_progress, fn receives a `progress` keyword argument; each value
+    it is called with reaches on_progress on the GUI thread while the call
+    is still wanted.
+    """
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None, timeout=DEFAULT_TIMEOUT, pool=None):
+        super().__init__(parent)
+        self.timeout = timeout
+        self.pool = pool or QThreadPool.globalInstance()
+        self._tokens = itertools.count(1)
+        self._latest = {}     # key -> token of the call whose result is wanted
+        self._pending = {}    # token -> (key, on_result, on_error, timer, on_progress)
+        # Parentless so a job finishing after this runner is gone still has
+        # a live object to emit from; the connection just goes away.
+        self._signals = _Signals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.progress.connect(self._on_progress)
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None, on_progress=None, timeout=None,
+               **kwargs):
+        token = next(self._tokens)
+        if on_progress is not None:
+            signals = self._signals
+            kwargs["progress"] = lambda *value: signals.progress.emit(token, value)
+        was_busy = self.is_busy()
+        self._drop(self._latest.get(key))
+        self._latest[key] = token
+
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: self._expire(token))
+        timer.start(int((self.timeout if timeout is None else timeout) * 1000))
+        self._pending[token] = (key, on_result, on_error, timer, on_progress)
+
+        self.pool.start(_Job(token, self._signals, fn, args, kwargs))
+        if not was_busy:
+            self.busy_changed.emit(True)
+        return token
+
+    def cancel(self, key):
+        was_busy = self.is_busy()
+        self._drop(self._latest.pop(key, None))
+        self._notify_idle(was_busy)
+
+    def wait(self, key, timeout=None):
+        """
+        Block until the call under `key` has been delivered (or timed out),
+        processing events meanwhile so its callback runs. For shutdown paths
+        that must not leave work behind.
+        """
+        if not self.is_busy(key):
+            return
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        loop = QEventLoop()
+        poll = QTimer()
+        poll.timeout.connect(
+            lambda: loop.quit() if not self.is_busy(key) or time.monotonic() >= deadline else None
+        )
+        poll.start(20)
+        loop.exec_()
+        poll.stop()
+
+    def is_busy(self, key=None):
+        if key is None:
+            return bool(self._latest)
+        return key in self._latest
+
+    def _on_finished(self, token, result, error):
+        entry = self._pending.pop(token, None)
+        if entry is None:
+            return  # superseded, cancelled or timed out
+        key, on_result, on_error, timer, _ = entry
+        timer.stop()
+        timer.deleteLater()
+        was_busy = self.is_busy()
+        if self._latest.get(key) == token:
+            del self._latest[key]
+        self._notify_idle(was_busy)
+
+        if error is not None:
+            if on_error:
+                on_error(error)
+        elif on_result:
+            if instrumentation.is_enabled():
+                started = time.perf_counter()
+                on_result(result)
+                instrumentation.record_render(key, time.perf_counter() - started)
+            else:
+                on_result(result)
+
+    def _on_progress(self, token, value):
+        entry = self._pending.get(token)
+        if entry is not None and entry[4] is not None:
+            entry[4](*value)
+
+    def _expire(self, token):
+        entry = self._pending.get(token)
+        if entry is None:
+            return
+        key, _, on_error, _, _ = entry
+        was_busy = self.is_busy()
+        self._drop(token)
+        if self._latest.get(key) == token:
+            del self._latest[key]
+        self._notify_idle(was_busy)
+        if on_error:
+            on_error(QueryTimeout("The database did not respond in time."))
+
+    def _drop(self, token):
+        entry = self._pending.pop(token, None)
+        if entry is not None:
+            entry[3].stop()
+            entry[3].deleteLater()
+
+    def _notify_idle(self, was_busy):
+        if was_busy and not self.is_busy():
+            self.busy_changed.emit(False)
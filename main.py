@@ -1,9 +1,28 @@
 import sys
+from utils import startup_timing  # first, so the clock covers the imports below
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication
 from gui.login_window import LoginWindow
+from database.event_queue import get_sleep_event_queue
+from database import instrumentation
+
+
+def after_login_window_shown():
+    startup_timing.mark("login window painted")
+    # Replays any sleep events journaled but not yet written before the last exit.
+    get_sleep_event_queue()
+    startup_timing.mark("sleep event journal replay")
+
 
 if __name__ == "__main__":
+    startup_timing.mark("imports")
+    startup_timing.report_requested = "--startup-timing" in sys.argv
     app = QApplication(sys.argv)
+    startup_timing.mark("QApplication")
+    # Query timings and the slow-query log, if db_config.json turns them on.
+    instrumentation.configure()
     login = LoginWindow()
     login.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    startup_timing.mark("login window")
+    QTimer.singleShot(0, after_login_window_shown)
+    sys.exit(app.exec_())
@@ -0,0 +1,195 @@
+import threading
+import time
+
+import pyodbc
+import pytest
+
+from database.db_connection import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.rollback_fails = False
+        self.closed = False
+        self.rollbacks = 0
+        self.timeout = None
+
+    def rollback(self):
+        if self.rollback_fails:
+            raise pyodbc.OperationalError("communication link failure")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, *params):
+        if not self.connection.alive:
+            raise pyodbc.OperationalError("communication link failure")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnect:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        connection = FakeConnection(len(self.opened) + 1)
+        self.opened.append(connection)
+        return connection
+
+
+@pytest.fixture
+def connect():
+    return FakeConnect()
+
+
+def pool_of(connect, **settings):
+    settings = dict({"min_size": 1, "max_size": 2, "idle_timeout": 300, "validate_after": 30,
+                     "acquire_timeout": 1}, **settings)
+    return ConnectionPool(connect, **settings)
+
+
+def test_opens_on_a_miss_and_reuses_on_a_hit(connect):
+    pool = pool_of(connect)
+    first = pool.acquire()
+    assert first.number == 1
+    first.close()
+    again = pool.acquire()
+    assert again.number == 1
+    assert connect.opened[0].rollbacks == 1  # released connections end their transaction
+    stats = pool.stats()
+    assert (stats["misses"], stats["hits"], stats["created"], stats["in_use"]) == (1, 1, 1, 1)
+
+
+def test_returned_connection_cannot_be_used(connect):
+    pool = pool_of(connect)
+    conn = pool.acquire()
+    conn.close()
+    with pytest.raises(pyodbc.ProgrammingError):
+        conn.cursor()
+
+
+def test_connection_context_sets_the_query_timeout_and_rolls_back_on_error(connect):
+    pool = pool_of(connect)
+    with pytest.raises(RuntimeError):
+        with pool.connection(query_timeout=12) as conn:
+            raw = conn._raw
+            raise RuntimeError("boom")
+    assert raw.timeout == 12
+    assert raw.rollbacks == 2  # the failed block's, then the release's
+    assert pool.stats()["idle"] == 1
+
+
+def test_max_size_makes_callers_wait(connect):
+    pool = pool_of(connect, max_size=1)
+    held = pool.acquire()
+    threading.Timer(0.1, held.close).start()
+    conn = pool.acquire(timeout=5)
+    assert conn.number == 1
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["wait_time"] >= 0.05
+    assert stats["timeouts"] == 0
+
+
+def test_wait_ending_in_timeout_is_counted(connect):
+    pool = pool_of(connect, max_size=1)
+    pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+    stats = pool.stats()
+    assert (stats["waits"], stats["timeouts"]) == (1, 1)
+    assert stats["wait_time"] >= 0.1
+
+
+def test_idle_connections_are_evicted_down_to_min_size(connect):
+    pool = pool_of(connect, min_size=1, max_size=3, idle_timeout=0)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        conn.close()
+    pool.acquire()
+    stats = pool.stats()
+    assert stats["evicted"] == 2
+    assert stats["size"] == 1
+    assert [c.closed for c in connect.opened] == [True, True, False]
+
+
+def test_idle_connection_is_validated_before_handout(connect):
+    pool = pool_of(connect, validate_after=0)
+    pool.acquire().close()
+    connect.opened[0].alive = False
+    conn = pool.acquire()
+    assert conn.number == 2
+    assert connect.opened[0].closed
+    assert pool.stats()["discarded"] == 1
+
+
+def test_failing_rollback_discards_the_connection(connect):
+    pool = pool_of(connect)
+    conn = pool.acquire()
+    connect.opened[0].rollback_fails = True
+    conn.close()
+    stats = pool.stats()
+    assert (stats["discarded"], stats["size"], stats["idle"]) == (1, 0, 0)
+    assert connect.opened[0].closed
+    assert pool.acquire().number == 2
+
+
+def test_failing_connect_frees_its_slot():
+    def refuse():
+        raise pyodbc.InterfaceError("login failed")
+
+    pool = pool_of(refuse, max_size=1)
+    for _ in range(2):
+        with pytest.raises(pyodbc.InterfaceError):
+            pool.acquire()
+    assert pool.stats()["size"] == 0
+
+
+def test_close_while_connections_are_borrowed(connect):
+    pool = pool_of(connect, max_size=2)
+    borrowed = pool.acquire()
+    pool.acquire().close()
+    pool.close()
+
+    assert connect.opened[1].closed  # idle ones at once
+    assert not connect.opened[0].closed
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    borrowed.close()  # borrowed ones when they come back
+    assert connect.opened[0].closed
+    assert pool.stats()["size"] == 0
+
+
+def test_close_wakes_a_waiting_caller(connect):
+    pool = pool_of(connect, max_size=1)
+    pool.acquire()
+    threading.Timer(0.1, pool.close).start()
+    with pytest.raises(PoolTimeout, match="closed"):
+        pool.acquire(timeout=5)
+    assert pool.stats()["wait_time"] >= 0.05
+
+
+def test_prefill_opens_min_size(connect):
+    pool = pool_of(connect, min_size=2, max_size=3)
+    pool.prefill()
+    assert pool.stats()["idle"] == 2
+    assert pool.stats()["created"] == 2
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.event_coalescer import EventCoalescer
+
+START = datetime(2024, 3, 4, 9, 0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def written():
+    return []
+
+
+@pytest.fixture
+def coalescer(clock, written):
+    return EventCoalescer(lambda *event: written.append(event), window=5.0, clock=clock)
+
+
+def at(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+def test_lock_unlock_lock_inside_the_window_is_kept(coalescer, clock, written):
+    for offset, event_type in enumerate(["sleep", "resume", "sleep", "resume"]):
+        clock.now += 1
+        assert coalescer.submit(event_type, "wts", at(offset))
+    assert [event[0] for event in written] == ["sleep", "resume", "sleep", "resume"]
+    assert coalescer.stats()["suppressed"] == 0
+
+
+def test_second_listener_reporting_the_same_suspend_is_a_duplicate(coalescer, clock, written):
+    assert coalescer.submit("sleep", "power", at(0))
+    clock.now += 1
+    assert not coalescer.submit("sleep", "wmi", at(0))
+    assert coalescer.stats()["duplicates"] == 1
+    assert written == [("sleep", "system", at(0))]
+
+
+def test_late_echo_after_the_resume_is_dropped(coalescer, clock, written):
+    assert coalescer.submit("sleep", "power", at(0))
+    clock.now += 1
+    assert coalescer.submit("resume", "power", at(60))
+    clock.now += 1
+    # WMI delivers its copy of the suspend after the resume, without a usable time.
+    assert not coalescer.submit("sleep", "wmi")
+    assert coalescer.submit("resume", "wmi") is False
+    assert [event[0] for event in written] == ["sleep", "resume"]
+
+
+def test_late_echo_with_its_original_time_is_stale(coalescer, clock):
+    coalescer.submit("sleep", "power", at(0))
+    coalescer.submit("resume", "power", at(60))
+    clock.now += 10  # past the window
+    assert not coalescer.submit("sleep", "wmi", at(0))
+    assert coalescer.stats()["stale"] == 1
+
+
+def test_repeated_state_outside_the_window_is_a_noop(coalescer, clock):
+    assert not coalescer.submit("resume", "wts", at(0))
+    coalescer.submit("sleep", "wts", at(1))
+    clock.now += 10
+    assert not coalescer.submit("sleep", "wts", at(20))
+    stats = coalescer.stats()
+    assert (stats["noops"], stats["duplicates"]) == (2, 0)
+
+
+def test_sources_are_independent(coalescer, written):
+    assert coalescer.submit("sleep", "wts", at(0))
+    assert coalescer.submit("sleep", "power", at(1))
+    assert coalescer.submit("resume", "power", at(2))
+    assert coalescer.submit("resume", "wts", at(3))
+    assert [(event[0], event[1]) for event in written] == [
+        ("sleep", "user"), ("sleep", "system"), ("resume", "system"), ("resume", "user"),
+    ]
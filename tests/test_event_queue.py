@@ -0,0 +1,158 @@
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+from database.event_queue import SleepEventQueue
+
+EVENT_TIME = datetime(2024, 3, 4, 10, 30, 15, 123456)
+
+
+class Rejected(Exception):
+    """Stands in for a permanent database error such as an FK violation."""
+
+
+class FlushRecorder:
+    """flush_batch stand-in: records the batches, or raises `error` for those `rejects` picks."""
+    def __init__(self, error=None, rejects=lambda rows: True):
+        self.batches = []
+        self.error = error
+        self.rejects = rejects
+        self.lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self.lock:
+            if self.error is not None and self.rejects(rows):
+                raise self.error
+            self.batches.append(rows)
+
+    @property
+    def rows(self):
+        with self.lock:
+            return [row for batch in self.batches for row in batch]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "sleep_events.journal")
+
+
+def journal_records(path):
+    with open(path, "rb") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_flushes_enqueued_events(journal):
+    flush = FlushRecorder()
+    queue = SleepEventQueue(journal, flush)
+    queue.enqueue(1, 7, "sleep", event_time=EVENT_TIME)
+    queue.enqueue(1, 7, "resume", "user", event_time=EVENT_TIME)
+    assert queue.flush(timeout=5)
+    queue.stop()
+
+    assert flush.rows == [
+        (1, 7, "sleep", EVENT_TIME.replace(microsecond=0), "system"),
+        (1, 7, "resume", EVENT_TIME.replace(microsecond=0), "user"),
+    ]
+    assert queue.stats()["flushed"] == 2
+
+
+def test_unacked_events_are_replayed(journal):
+    down = FlushRecorder(ConnectionError("database unreachable"))
+    queue = SleepEventQueue(journal, down, min_backoff=60)
+    queue.enqueue(1, 7, "sleep", event_time=EVENT_TIME)
+    queue.enqueue(1, 7, "resume", event_time=EVENT_TIME)
+    queue.stop(timeout=0.1)
+    assert queue.pending_count() == 2
+
+    flush = FlushRecorder()
+    restarted = SleepEventQueue(journal, flush)
+    assert restarted.flush(timeout=5)
+    restarted.stop()
+    assert [row[2] for row in flush.rows] == ["sleep", "resume"]
+
+
+def test_acked_events_are_not_replayed(journal):
+    queue = SleepEventQueue(journal, FlushRecorder())
+    queue.enqueue(1, 7, "sleep")
+    assert queue.flush(timeout=5)
+    queue.stop()
+
+    flush = FlushRecorder()
+    restarted = SleepEventQueue(journal, flush)
+    assert restarted.pending_count() == 0
+    restarted.stop()
+    assert flush.rows == []
+    # Replay rewrote the journal with only the unacknowledged events.
+    assert journal_records(journal) == []
+
+
+def test_torn_last_line_is_skipped(journal):
+    queue = SleepEventQueue(journal, FlushRecorder(ConnectionError()), min_backoff=60)
+    queue.enqueue(1, 7, "sleep")
+    queue.stop(timeout=0.1)
+    with open(journal, "ab") as file:
+        file.write(b'{"uid":"abc","account_id":1,"sess')
+
+    flush = FlushRecorder()
+    restarted = SleepEventQueue(journal, flush)
+    assert restarted.flush(timeout=5)
+    restarted.stop()
+    assert len(flush.rows) == 1
+
+
+def test_journal_is_compacted_once_drained(journal):
+    queue = SleepEventQueue(journal, FlushRecorder(), compact_after=1)
+    for _ in range(5):
+        queue.enqueue(1, 7, "sleep")
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert journal_records(journal) == []
+
+
+def test_journal_below_the_threshold_is_kept(journal):
+    queue = SleepEventQueue(journal, FlushRecorder())
+    uid = queue.enqueue(1, 7, "sleep")
+    assert queue.flush(timeout=5)
+    queue.stop()
+    records = journal_records(journal)
+    assert records[0]["uid"] == uid
+    assert {"ack": [uid]} in records
+
+
+def test_permanent_failure_is_dead_lettered(journal):
+    flush = FlushRecorder(Rejected("FK violation"), lambda rows: any(row[1] == 99 for row in rows))
+    queue = SleepEventQueue(journal, flush, permanent_errors=(Rejected,), min_backoff=60)
+    queue.enqueue(1, 7, "sleep")
+    dead_uid = queue.enqueue(1, 99, "sleep")
+    queue.enqueue(1, 7, "resume")
+    assert queue.flush(timeout=5)
+    queue.stop()
+
+    assert [(row[1], row[2]) for row in flush.rows] == [(7, "sleep"), (7, "resume")]
+    assert queue.stats()["dead_lettered"] == 1
+    [dead] = journal_records(journal + ".dead")
+    assert dead["uid"] == dead_uid
+    assert dead["error"] == "FK violation"
+
+    restarted = SleepEventQueue(journal, FlushRecorder())
+    assert restarted.pending_count() == 0
+    restarted.stop()
+
+
+def test_transient_failure_is_retried(journal):
+    attempts = []
+
+    def flaky(rows):
+        attempts.append(rows)
+        if len(attempts) == 1:
+            raise ConnectionError("timeout")
+
+    queue = SleepEventQueue(journal, flaky, permanent_errors=(Rejected,), min_backoff=0.01)
+    queue.enqueue(1, 7, "sleep")
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert len(attempts) == 2
+    assert queue.stats()["failures"] == 1
+    assert queue.stats()["dead_lettered"] == 0
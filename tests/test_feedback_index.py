@@ -0,0 +1,72 @@
+import struct
+
+import pytest
+
+from database.feedback_index import FORMAT_VERSION, MAGIC, FeedbackIndex, tokenize
+
+WATERMARK = bytes.fromhex("00000000000007d1")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "feedback_index.bin")
+
+
+def build(path):
+    index = FeedbackIndex(path)
+    index.add(3, "alice", "Printer is broken again")
+    index.add(70000, "bob", "Coffee machine fixed, printer still slow")
+    index.add(12, "Émilie", "Réseau lent aujourd'hui")
+    index.add(12, "Émilie", "Réseau lent aujourd'hui")  # a re-read row
+    index.watermark = WATERMARK
+    return index
+
+
+def test_tokenize():
+    assert tokenize("Printer is BROKEN, again!") == ["printer", "is", "broken", "again"]
+    assert tokenize(None) == []
+
+
+def test_search_is_prefix_and_all_terms(path):
+    index = build(path)
+    assert index.search("print") == [70000, 3]
+    assert index.search("printer slow") == [70000]
+    assert index.search("ali") == [3]
+    assert index.search("rés") == [12]
+    assert index.search("printer réseau") == []
+    assert index.search("  ") == []
+
+
+def test_round_trip(path):
+    index = build(path)
+    index.save()
+    loaded = FeedbackIndex(path)
+    assert loaded.stats() == index.stats()
+    assert loaded.watermark == WATERMARK
+    for query in ("print", "coffee", "émilie", "again broken"):
+        assert loaded.search(query) == index.search(query)
+
+
+@pytest.mark.parametrize("keep", [2, 9, 16, -1, -7])
+def test_truncated_file_is_ignored(path, keep):
+    build(path).save()
+    with open(path, "rb") as file:
+        data = file.read()
+    with open(path, "wb") as file:
+        file.write(data[:keep])
+
+    loaded = FeedbackIndex(path)
+    assert loaded.stats() == {"tokens": 0, "postings": 0, "watermark": "00" * 8}
+
+
+def test_trailing_bytes_are_rejected(path):
+    build(path).save()
+    with open(path, "ab") as file:
+        file.write(b"\x00")
+    assert FeedbackIndex(path).stats()["tokens"] == 0
+
+
+def test_older_format_is_ignored(path):
+    with open(path, "wb") as file:
+        file.write(MAGIC + struct.pack("<HII", FORMAT_VERSION - 1, 500, 0))
+    assert FeedbackIndex(path).watermark == bytes(8)
@@ -0,0 +1,92 @@
+from gui.paging import KeysetPager
+
+ROWS = [(n, f"row {n}") for n in range(10, 0, -1)]  # newest first, like the dashboards
+
+
+def fetch_page(after=None, limit=None):
+    return [row for row in ROWS if after is None or row[0] < after][:limit]
+
+
+def key_of(row):
+    return row[0]
+
+
+def test_walks_every_page_once():
+    pager = KeysetPager(fetch_page, key_of, page_size=4)
+    pages = []
+    while pager.has_more:
+        pages.append(pager.next_page())
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [row for page in pages for row in page] == ROWS
+    assert pager.next_page() == []
+
+
+def test_exact_multiple_ends_with_an_empty_page():
+    pager = KeysetPager(fetch_page, key_of, page_size=5)
+    assert len(pager.next_page()) == 5
+    assert len(pager.next_page()) == 5
+    assert pager.has_more
+    assert pager.next_page() == []
+    assert not pager.has_more
+
+
+def test_page_query_snapshots_the_position():
+    pager = KeysetPager(fetch_page, key_of, page_size=3)
+    first = pager.page_query()
+    pager.accept(first())
+    second = pager.page_query()
+    pager.accept(second())
+    assert first() == ROWS[:3]
+    assert second() == ROWS[3:6]
+
+
+def test_reset_passes_filters_and_starts_over():
+    calls = []
+
+    def fetch(employee, after=None, limit=None):
+        calls.append((employee, after, limit))
+        return fetch_page(after=after, limit=limit)
+
+    pager = KeysetPager(fetch, key_of, page_size=4)
+    pager.reset("alice")
+    pager.next_page()
+    pager.next_page()
+    pager.reset("bob")
+    pager.next_page()
+    assert calls == [("alice", None, 4), ("alice", 7, 4), ("bob", None, 4)]
+
+
+def test_first_page_records_a_watermark_and_changes_follow_it():
+    seen = []
+
+    def fetch_first(limit=None):
+        return fetch_page(limit=limit), b"w1"
+
+    def fetch_changes(watermark):
+        seen.append(watermark)
+        return [(10, "edited"), (5, "edited"), (1, "edited")], b"w2"
+
+    pager = KeysetPager(fetch_page, key_of, page_size=4, fetch_first=fetch_first, fetch_changes=fetch_changes)
+    assert pager.changes_query() is None
+    assert pager.next_page() == ROWS[:4]
+    assert pager.watermark == b"w1"
+
+    # Only rows within the loaded pages; the rest come with their page.
+    assert pager.accept_changes(pager.changes_query()()) == [(10, "edited")]
+    assert pager.watermark == b"w2"
+    pager.next_page()
+    assert pager.accept_changes(pager.changes_query()()) == [(10, "edited"), (5, "edited")]
+    assert seen == [b"w1", b"w2"]
+
+    pager.next_page()
+    assert not pager.has_more
+    assert len(pager.accept_changes(fetch_changes(b"w2"))) == 3
+
+
+def test_changes_without_a_new_watermark_keep_the_old_one():
+    pager = KeysetPager(fetch_page, key_of, page_size=4,
+                        fetch_first=lambda limit=None: (fetch_page(limit=limit), b"w1"),
+                        fetch_changes=lambda watermark: ([], None))
+    pager.next_page()
+    assert pager.accept_changes(pager.changes_query()()) == []
+    assert pager.watermark == b"w1"
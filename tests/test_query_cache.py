@@ -0,0 +1,103 @@
+from datetime import date
+
+import pytest
+
+from database import query_cache
+from database.query_cache import QueryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache.time, "monotonic", clock)
+    return clock
+
+
+def loader(value, calls):
+    def load():
+        calls.append(value)
+        return value
+    return load
+
+
+def march(from_date=date(2024, 3, 1), to_date=date(2024, 3, 31)):
+    return {"from_date": from_date, "to_date": to_date}
+
+
+def test_serves_from_cache_until_the_ttl(clock):
+    cache = QueryCache()
+    calls = []
+    assert cache.get_or_load("k", ("sessions",), 20, {}, loader("a", calls)) == "a"
+    clock.now += 19
+    assert cache.get_or_load("k", ("sessions",), 20, {}, loader("b", calls)) == "a"
+    clock.now += 2
+    assert cache.get_or_load("k", ("sessions",), 20, {}, loader("c", calls)) == "c"
+    assert calls == ["a", "c"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+def test_invalidate_drops_only_the_tag(clock):
+    cache = QueryCache()
+    cache.get_or_load("sessions", ("sessions",), 60, {}, lambda: "s")
+    cache.get_or_load("feedback", ("feedback",), 60, {}, lambda: "f")
+    cache.get_or_load("both", ("sessions", "rollups"), 60, {}, lambda: "b")
+    cache.invalidate("sessions")
+    assert cache.get_or_load("sessions", ("sessions",), 60, {}, lambda: "s2") == "s2"
+    assert cache.get_or_load("both", ("sessions", "rollups"), 60, {}, lambda: "b2") == "b2"
+    assert cache.get_or_load("feedback", ("feedback",), 60, {}, lambda: "f2") == "f"
+
+
+def test_invalidate_on_a_date_keeps_other_ranges(clock):
+    cache = QueryCache()
+    cache.get_or_load("march", ("sessions",), 60, march(), lambda: "march")
+    cache.get_or_load("april", ("sessions",), 60, march(date(2024, 4, 1), date(2024, 4, 30)), lambda: "april")
+    cache.get_or_load("all", ("sessions",), 60, march(None, None), lambda: "all")
+    cache.invalidate("sessions", on_date=date(2024, 3, 15))
+    assert cache.get_or_load("march", ("sessions",), 60, march(), lambda: "new") == "new"
+    assert cache.get_or_load("all", ("sessions",), 60, march(None, None), lambda: "new") == "new"
+    assert cache.get_or_load("april", ("sessions",), 60, {}, lambda: "new") == "april"
+
+
+def test_load_racing_an_invalidation_is_not_stored(clock):
+    cache = QueryCache()
+
+    def load_during_write():
+        cache.invalidate("sessions")  # a write commits while the query runs
+        return "stale"
+
+    assert cache.get_or_load("k", ("sessions",), 60, {}, load_during_write) == "stale"
+    assert cache.get_or_load("k", ("sessions",), 60, {}, lambda: "fresh") == "fresh"
+    assert cache.get_or_load("k", ("sessions",), 60, {}, lambda: "later") == "fresh"
+
+
+def test_clear_also_bumps_generations(clock):
+    cache = QueryCache()
+    cache.get_or_load("k", ("sessions",), 60, {}, lambda: "old")
+    cache.invalidate("sessions")
+
+    def load_during_clear():
+        cache.clear()
+        return "stale"
+
+    cache.get_or_load("k", ("sessions",), 60, {}, load_during_clear)
+    assert cache.get_or_load("k", ("sessions",), 60, {}, lambda: "fresh") == "fresh"
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = QueryCache(max_entries=2)
+    cache.get_or_load("a", ("sessions",), 60, {}, lambda: "a")
+    cache.get_or_load("b", ("sessions",), 60, {}, lambda: "b")
+    cache.get_or_load("a", ("sessions",), 60, {}, lambda: "a2")
+    cache.get_or_load("c", ("sessions",), 60, {}, lambda: "c")
+    assert cache.get_or_load("a", ("sessions",), 60, {}, lambda: "a3") == "a"
+    assert cache.get_or_load("b", ("sessions",), 60, {}, lambda: "b2") == "b2"
+    assert cache.stats()["evictions"] == 2
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from utils.session_timeout import TimeoutScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = TimeoutScheduler()
+    yield scheduler
+    scheduler.stop()
+
+
+def recorder():
+    fired = []
+    done = threading.Event()
+
+    def callback_for(key):
+        def callback():
+            fired.append(key)
+            done.set()
+        return callback
+    return fired, done, callback_for
+
+
+def test_fires_after_the_delay(scheduler):
+    fired, done, callback_for = recorder()
+    scheduler.arm("a", 0.05, callback_for("a"))
+    assert scheduler.pending() == 1
+    assert done.wait(2)
+    assert fired == ["a"]
+    assert scheduler.pending() == 0
+
+
+def test_cancelled_timeout_does_not_fire(scheduler):
+    fired, done, callback_for = recorder()
+    scheduler.arm("a", 0.05, callback_for("a"))
+    assert scheduler.cancel("a")
+    assert not scheduler.cancel("a")
+    scheduler.arm("b", 0.1, callback_for("b"))
+    assert done.wait(2)
+    assert fired == ["b"]
+
+
+def test_rearming_replaces_the_timeout(scheduler):
+    fired, done, callback_for = recorder()
+    scheduler.arm("a", 0.05, callback_for("first"))
+    scheduler.arm("a", 0.1, callback_for("second"))
+    assert scheduler.pending() == 1
+    assert done.wait(2)
+    time.sleep(0.1)
+    assert fired == ["second"]
+
+
+def test_earlier_deadline_wakes_the_thread(scheduler):
+    fired, done, callback_for = recorder()
+    scheduler.arm("late", 60, callback_for("late"))
+    time.sleep(0.05)  # the thread is now sleeping towards "late"
+    started = time.monotonic()
+    scheduler.arm("soon", 0.05, callback_for("soon"))
+    assert done.wait(2)
+    assert fired == ["soon"]
+    assert time.monotonic() - started < 1
+
+
+def test_failing_callback_does_not_stop_the_thread(scheduler):
+    fired, done, callback_for = recorder()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    scheduler.arm("bad", 0.01, fail)
+    scheduler.arm("good", 0.05, callback_for("good"))
+    assert done.wait(2)
+    assert fired == ["good"]
+
+
+def test_heap_is_rebuilt_when_mostly_cancelled(scheduler):
+    for key in range(200):
+        scheduler.arm(key, 60, lambda: None)
+    for key in range(150):
+        scheduler.cancel(key)
+    assert scheduler.pending() == 50
+    assert len(scheduler._heap) < 200
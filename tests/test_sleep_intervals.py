@@ -0,0 +1,88 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import sleep_intervals
+from utils.sleep_intervals import batch_sleep_minutes, sleep_intervals as intervals_of, sleep_minutes
+
+CLOCK_IN = datetime(2024, 3, 4, 9, 0)
+
+
+def at(minutes):
+    return CLOCK_IN + timedelta(minutes=minutes)
+
+
+def test_pairs_sleep_with_resume():
+    events = [("sleep", at(10)), ("resume", at(25)), ("sleep", at(60)), ("resume", at(61))]
+    assert intervals_of(events) == [(at(10), at(25)), (at(60), at(61))]
+    assert sleep_minutes(events, CLOCK_IN, at(120)) == 16
+
+
+def test_repeated_sleep_does_not_move_the_start():
+    events = [("sleep", at(10)), ("sleep", at(20)), ("resume", at(30))]
+    assert sleep_minutes(events) == 20
+
+
+def test_sources_merge_while_any_is_asleep():
+    events = [
+        ("sleep", at(10), "system"),
+        ("sleep", at(15), "user"),
+        ("resume", at(20), "system"),
+        ("resume", at(40), "user"),
+    ]
+    assert intervals_of(events) == [(at(10), at(40))]
+
+
+def test_simultaneous_resume_and_sleep_keep_one_interval():
+    events = [
+        ("sleep", at(10), "system"),
+        ("resume", at(20), "system"),
+        ("sleep", at(20), "user"),
+        ("resume", at(30), "user"),
+    ]
+    assert intervals_of(events) == [(at(10), at(30))]
+
+
+def test_clamped_to_the_session_window():
+    events = [("sleep", at(-30)), ("resume", at(10)), ("sleep", at(100))]
+    assert sleep_minutes(events, CLOCK_IN, at(110)) == 20
+    # Still asleep in a running session: the open interval is not counted yet.
+    assert sleep_minutes(events, CLOCK_IN, None) == 10
+
+
+def test_rounds_down_once_per_session():
+    events = [("sleep", at(0)), ("resume", at(0.5)), ("sleep", at(1)), ("resume", at(1.5))]
+    assert sleep_minutes(events, CLOCK_IN, at(5)) == 1
+
+
+def test_millisecond_times():
+    events = [("sleep", 60_000), ("resume", 150_000)]
+    assert sleep_minutes(events, 0, 600_000) == 1
+
+
+def _random_sessions(rng, count):
+    rows = []
+    windows = {}
+    for session_id in range(1, count + 1):
+        length = rng.randrange(1, 10) * 3_600_000
+        windows[session_id] = (0, None if rng.random() < 0.2 else length)
+        times = sorted(rng.randrange(-600_000, length + 600_000) for _ in range(rng.randrange(0, 12)))
+        for event_time in times:
+            # Coarse times make ties, and other event types must be ignored.
+            event_time -= event_time % 60_000 if rng.random() < 0.3 else 0
+            event_type = rng.choice(["sleep", "resume", "sleep", "resume", "lock"])
+            rows.append((session_id, event_type, event_time, rng.choice(["system", "user", None])))
+    rows.sort(key=lambda row: (row[0], row[2]))
+    return rows, windows
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_numpy_and_python_paths_agree(seed, monkeypatch):
+    pytest.importorskip("numpy")
+    rows, windows = _random_sessions(random.Random(seed), 200)
+    windows[0] = (0, 3_600_000)  # a session without events
+
+    vectorized = batch_sleep_minutes(rows, windows)
+    monkeypatch.setattr(sleep_intervals, "_numpy", lambda: None)
+    assert batch_sleep_minutes(rows, windows) == vectorized
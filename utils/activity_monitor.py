@@ -4,37 +4,63 @@ import win32gui
 import win32api
 import win32ts
 from win32gui import PumpMessages
-from database.queries import log_sleep_event
+from database.db_connection import load_db_config
+from utils.event_coalescer import DEFAULT_DEBOUNCE_SECONDS, EventCoalescer
+from utils.session_manager import get_session_manager
 import threading
 import pythoncom
 import wmi
 import time
+from datetime import datetime
 
 WTS_SESSION_LOCK = 0x7
 WTS_SESSION_UNLOCK = 0x8
 WM_WTSSESSION_CHANGE = 0x02B1
 NOTIFY_FOR_THIS_SESSION = 0
 
-def activity_window_proc(account_id, session_id):
+# FILETIME (100 ns ticks since 1601) of the Unix epoch.
+_FILETIME_EPOCH = 116444736000000000
+
+_coalescer = None
+
+
+def coalescer_stats():
+    """Counters of the running monitor's coalescer, or None before clock-in."""
+    return _coalescer.stats() if _coalescer is not None else None
+
+
+def _debounce_seconds():
+    return load_db_config().get("activity", {}).get("debounce_seconds", DEFAULT_DEBOUNCE_SECONDS)
+
+
+def _wmi_event_time(event):
+    """When WMI raised the event; its delivery can lag well behind."""
+    try:
+        return datetime.fromtimestamp((int(event.TIME_CREATED) - _FILETIME_EPOCH) / 1e7)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def activity_window_proc(coalescer):
     def wndProc(hWnd, msg, wParam, lParam):
         if msg == win32con.WM_POWERBROADCAST:
             if wParam == win32con.PBT_APMSUSPEND:
-                log_sleep_event(account_id, session_id, 'sleep', source='system')
+                coalescer.submit('sleep', 'power')
             elif wParam == win32con.PBT_APMRESUMEAUTOMATIC:
-                log_sleep_event(account_id, session_id, 'resume', source='system')
+                coalescer.submit('resume', 'power')
 
         elif msg == WM_WTSSESSION_CHANGE:
             if wParam == WTS_SESSION_LOCK:
-                log_sleep_event(account_id, session_id, 'sleep', source='user')
+                coalescer.submit('sleep', 'wts')
             elif wParam == WTS_SESSION_UNLOCK:
-                log_sleep_event(account_id, session_id, 'resume', source='user')
+                coalescer.submit('resume', 'wts')
 
         return win32gui.DefWindowProc(hWnd, msg, wParam, lParam)
 
     return wndProc
 
 
-def monitor_sleep_resume(account_id, session_id):
+def monitor_sleep_resume(coalescer):
     pythoncom.CoInitialize()
     c = wmi.WMI()
     watcher = c.Win32_PowerManagementEvent.watch_for()
@@ -42,21 +68,29 @@ def monitor_sleep_resume(account_id, session_id):
         try:
             event = watcher()
             if event.Type == 4:  # Suspend
-                log_sleep_event(account_id, session_id, 'sleep')
+                coalescer.submit('sleep', 'wmi', _wmi_event_time(event))
             elif event.Type == 7:  # Resume
-                log_sleep_event(account_id, session_id, 'resume')
+                coalescer.submit('resume', 'wmi', _wmi_event_time(event))
         except Exception as e:
             print("WMI Sleep/Resume Monitor Error:", e)
             time.sleep(1)
 
-def start_activity_monitor(account_id, session_id):
-    threading.Thread(target=monitor_sleep_resume, args=(account_id, session_id), daemon=True).start()
+def start_activity_monitor(account_id, session_id, debounce_seconds=None):
+    global _coalescer
+    coalescer = _coalescer = EventCoalescer(
+        lambda event_type, source, event_time: get_session_manager().log_event(
+            account_id, session_id, event_type, source=source, event_time=event_time
+        ),
+        window=_debounce_seconds() if debounce_seconds is None else debounce_seconds,
+    )
+
+    threading.Thread(target=monitor_sleep_resume, args=(coalescer,), daemon=True).start()
 
     hInstance = win32api.GetModuleHandle()
     className = "ActivityMonitorWindow"
 
     wndClass = win32gui.WNDCLASS()
-    wndClass.lpfnWndProc = activity_window_proc(account_id, session_id)
+    wndClass.lpfnWndProc = activity_window_proc(coalescer)
     wndClass.hInstance = hInstance
     wndClass.lpszClassName = className
     win32gui.RegisterClass(wndClass)
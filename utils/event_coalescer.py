@@ -0,0 +1,90 @@
+# event_coalescer.py
+"""
+Collapses the OS's sleep/lock notifications into one event per transition.
+
+Windows reports a suspend both as WM_POWERBROADCAST and through WMI, and
+WMI's copy can arrive seconds late; utils.activity_monitor feeds every
+notification through an EventCoalescer before it reaches the
+SessionManager.
+"""
+import threading
+import time
+from datetime import datetime
+
+# Which sleep_events.source each OS notification reports. A suspend arrives
+# both as WM_POWERBROADCAST and through the WMI watcher; a lock through WTS.
+ORIGIN_SOURCES = {
+    'power': 'system',
+    'wmi': 'system',
+    'wts': 'user',
+}
+
+DEFAULT_DEBOUNCE_SECONDS = 5.0
+
+
+class EventCoalescer:
+    """
+    Sits between the OS notifications and SessionManager.log_event so one
+    suspend or lock becomes one row.
+
+    Each source is asleep or awake, and the state is checked first: an
+    event that repeats it is dropped, as a duplicate if the same transition
+    was accepted less than `window` seconds ago and as a no-op otherwise.
+    An event that changes the state is dropped only if it is a late echo:
+    the same transition was accepted less than `window` seconds ago from
+    another listener (e.g. a WMI suspend delivered after the resume it
+    preceded), or it is timestamped before the source's last accepted
+    transition (stale). A real lock, unlock, lock from the same listener
+    inside the window is therefore three events.
+    """
+
+    def __init__(self, sink, window=DEFAULT_DEBOUNCE_SECONDS, clock=time.monotonic):
+        self.sink = sink
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = {}        # source -> (event_type, event_time) last accepted
+        self._accepted = {}     # (event_type, source) -> (clock() when accepted, origin)
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.noops = 0
+        self.stale = 0
+
+    def submit(self, event_type, origin, event_time=None):
+        """Pass one notification on unless it is redundant; returns whether it was written."""
+        source = ORIGIN_SOURCES[origin]
+        event_time = event_time or datetime.now()
+        now = self.clock()
+        with self._lock:
+            current = self._state.get(source)
+            accepted = self._accepted.get((event_type, source))
+            recent = accepted is not None and now - accepted[0] < self.window
+            # Sources start awake, so a resume before any sleep is a no-op too.
+            if (current[0] if current else 'resume') == event_type:
+                if recent:
+                    self.duplicates += 1
+                else:
+                    self.noops += 1
+                return False
+            if recent and accepted[1] != origin:
+                self.duplicates += 1
+                return False
+            if current and event_time < current[1]:
+                self.stale += 1
+                return False
+            self._state[source] = (event_type, event_time)
+            self._accepted[(event_type, source)] = (now, origin)
+            self.accepted += 1
+        self.sink(event_type, source, event_time)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "accepted": self.accepted,
+                "suppressed": self.duplicates + self.noops + self.stale,
+                "duplicates": self.duplicates,
+                "noops": self.noops,
+                "stale": self.stale,
+            }
@@ -0,0 +1,16 @@
+# local_storage.py
+import os
+
+APP_DIR_NAME = "EmployeeSleepTracker"
+
+
+def data_dir():
+    """Per-user directory for files the app keeps on the local machine."""
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    path = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def data_path(filename):
+    return os.path.join(data_dir(), filename)
@@ -0,0 +1,115 @@
+# session_manager.py
+"""
+The sessions this client has open, kept in memory so clocking out is one
+round trip.
+
+The dashboards clock in through start(), the activity monitor logs sleep
+and resume events through log_event(), and both the dashboards and the
+session timeout clock out through end(). Because every event of a session
+passes through here, end() already knows the clock-in time and the events,
+computes the sleep and work minutes locally and sends them in a single
+batch that closes the row and updates the rollups (close_session). The
+events themselves still go through the write-behind queue; when they reach
+the database, refresh_sleep_minutes recomputes the same totals, so nothing
+changes.
+
+Clock-in and clock-out times are kept to whole seconds, like event times,
+so the local computation and the server's agree exactly. If the manager
+does not know the session (the client restarted, or the timeout and the
+user clocked out at once) or the session was already closed elsewhere,
+end() falls back to end_session, which recomputes everything on the server.
+"""
+import threading
+from datetime import datetime
+from operator import itemgetter
+
+from database.queries import close_session, end_session, log_sleep_event, open_session
+from utils.session_timeout import cancel_timeout
+from utils.sleep_intervals import sleep_minutes
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class ActiveSession:
+    __slots__ = ("account_id", "session_id", "clock_in", "events")
+
+    def __init__(self, account_id, session_id, clock_in):
+        self.account_id = account_id
+        self.session_id = session_id
+        self.clock_in = clock_in
+        self.events = []  # (event_type, event_time, source) in the order logged
+
+    def totals(self, clock_out):
+        """(total_work_minutes, sleep_minutes) if the session ended at clock_out."""
+        events = sorted(self.events, key=itemgetter(1))  # stable: ties keep the logged order
+        sleep = sleep_minutes(events, self.clock_in, clock_out)
+        return int((clock_out - self.clock_in).total_seconds() / 60) - sleep, sleep
+
+
+class SessionManager:
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def start(self, account_id, clock_in_time):
+        """
+        Clock in; returns (session_id, clock_in), or None if the account is
+        being purged. If the account was already clocked in (e.g. a retried
+        clock-in whose first attempt did commit), that session is returned;
+        its earlier events are not known here, so end() recomputes it on
+        the server.
+        """
+        opened = open_session(account_id, clock_in_time.replace(microsecond=0))
+        if opened is None:
+            return None
+        session_id, clock_in, created = opened
+        if created:
+            with self._lock:
+                self._sessions[session_id] = ActiveSession(account_id, session_id, clock_in)
+        return session_id, clock_in
+
+    def log_event(self, account_id, session_id, event_type, source='system', event_time=None):
+        """Remember the event for end() and queue it for the database (see log_sleep_event)."""
+        event_time = (event_time or datetime.now()).replace(microsecond=0)
+        with self._lock:
+            active = self._sessions.get(session_id)
+            if active is not None:
+                active.events.append((event_type, event_time, source))
+        log_sleep_event(account_id, session_id, event_type, source=source, event_time=event_time)
+
+    def end(self, session_id, clock_out_time):
+        """Clock out; returns total_work_minutes."""
+        cancel_timeout(session_id)
+        clock_out_time = clock_out_time.replace(microsecond=0)
+        with self._lock:
+            # Taken out first, so a second end() of the same session (the
+            # timeout firing during a clock-out) goes to the server instead.
+            active = self._sessions.pop(session_id, None)
+        if active is None:
+            return end_session(session_id, clock_out_time)
+
+        total_minutes, sleep = active.totals(clock_out_time)
+        try:
+            closed = close_session(session_id, clock_out_time, total_minutes, sleep)
+        except Exception:
+            with self._lock:
+                self._sessions.setdefault(session_id, active)
+            raise
+        if not closed:
+            # Closed meanwhile, e.g. by the auto_close job.
+            return end_session(session_id, clock_out_time)
+        return total_minutes
+
+    def is_active(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+
+def get_session_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionManager()
+    return _manager
@@ -1,18 +1,121 @@
 #session_timeout.py
+"""
+Auto-ends sessions that stay open longer than the timeout.
+
+One scheduler thread serves every tracked session: deadlines sit in a heap
+and the thread sleeps until the earliest one is due. Cancelling marks the
+entry dead and leaves it in the heap until it surfaces (or until dead
+entries outnumber live ones and the heap is rebuilt), so arm, cancel and
+re-arm are all O(log n). Clocking out (SessionManager.end, end_session)
+cancels the session's timeout.
+"""
+import heapq
+import itertools
+import logging
 import threading
 import time
-from datetime import datetime
-from database.queries import end_session
+from datetime import datetime, timedelta
+
+DEFAULT_TIMEOUT_MINUTES = 240
+
+logger = logging.getLogger(__name__)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class TimeoutScheduler:
+    def __init__(self):
+        self._heap = []        # [due (monotonic), seq, key, callback, live]
+        self._entries = {}     # key -> its live heap entry
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def arm(self, key, delay, callback):
+        """Run callback() after `delay` seconds, replacing any timeout already armed for key."""
+        with self._cond:
+            self._cancel_locked(key)
+            entry = [time.monotonic() + delay, next(self._seq), key, callback, True]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-timeouts", daemon=True)
+                self._thread.start()
+            elif self._heap[0] is entry:
+                self._cond.notify()  # earlier than what the thread is sleeping towards
+
+    def cancel(self, key):
+        """Drop key's timeout; returns whether one was armed."""
+        with self._cond:
+            return self._cancel_locked(key)
+
+    def _cancel_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[4] = False
+        if len(self._heap) > 64 and len(self._entries) < len(self._heap) // 2:
+            self._heap = [item for item in self._heap if item[4]]
+            heapq.heapify(self._heap)
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._entries)
 
-def start_timeout_monitor(account_id, session_id, clock_in_time, timeout_minutes=240):
-    def monitor():
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
         while True:
-            now = datetime.now()
-            duration = (now - clock_in_time).total_seconds() / 60
-            if duration > timeout_minutes:
-                print(f"Auto-ending session {session_id} due to timeout.")
-                end_session(session_id, now)
-                break
-            time.sleep(60)
-    thread = threading.Thread(target=monitor, daemon=True)
-    thread.start()
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    while self._heap and not self._heap[0][4]:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                entry = heapq.heappop(self._heap)
+                del self._entries[entry[2]]
+                callback = entry[3]
+            try:
+                callback()
+            except Exception:
+                logger.exception("Session timeout callback for %s failed", entry[2])
+
+
+def get_timeout_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = TimeoutScheduler()
+    return _scheduler
+
+
+def start_timeout_monitor(account_id, session_id, clock_in_time, timeout_minutes=DEFAULT_TIMEOUT_MINUTES):
+    deadline = clock_in_time + timedelta(minutes=timeout_minutes)
+
+    def expire():
+        from utils.session_manager import get_session_manager  # which imports this module
+        print(f"Auto-ending session {session_id} due to timeout.")
+        get_session_manager().end(session_id, datetime.now())
+
+    delay = max(0.0, (deadline - datetime.now()).total_seconds())
+    get_timeout_scheduler().arm(session_id, delay, expire)
+
+
+def cancel_timeout(session_id):
+    """Forget session_id's timeout. Does nothing if the scheduler never started."""
+    if _scheduler is not None:
+        _scheduler.cancel(session_id)
@@ -0,0 +1,214 @@
+# sleep_intervals.py
+"""
+Turns sleep/resume events into sleep intervals.
+
+Each source ('system', 'user') is either asleep or awake: 'sleep' puts it to
+sleep, 'resume' wakes it, and a repeated event for a source already in that
+state changes nothing (so a second 'sleep' does not move the start of the
+first). The machine counts as asleep while any source is asleep, which
+merges overlapping intervals from different sources. Intervals are clamped
+to the session's [clock_in, clock_out] window; a sleep still open at
+clock_out ends there, and one still open in a running session is not
+counted yet.
+
+Durations are summed exactly and rounded down to whole minutes once per
+session. Times are datetimes, or integer milliseconds (e.g. offsets from
+clock_in computed in SQL).
+
+sleep_minutes() handles one session in a single pass over its events.
+batch_sleep_minutes() does many sessions at once; with NumPy installed and
+millisecond times it works on whole arrays, otherwise per session. Building
+arrays from datetime objects costs about as much as the per-session pass,
+so only numeric times are worth vectorizing. NumPy is imported on the first
+such batch, not with this module, which database.queries (and so the login
+window's import path) pulls in.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+from itertools import count, repeat
+from operator import itemgetter
+
+MINUTE = timedelta(minutes=1)
+MS_PER_MINUTE = 60_000
+
+
+def _parts(event):
+    # Callers pass (event_type, event_time) or (event_type, event_time, source).
+    if len(event) > 2:
+        return event[0], event[1], event[2] or 'system'
+    return event[0], event[1], 'system'
+
+
+def sleep_intervals(events, window_start=None, window_end=None):
+    """
+    Merged sleep intervals [(start, end), ...] for events sorted by time.
+    window_start/window_end clamp the result; without window_end a sleep that
+    is never resumed is left out.
+    """
+    intervals = []
+    asleep = set()
+    opened = None
+
+    def close(start, end):
+        if window_start is not None and start < window_start:
+            start = window_start
+        if window_end is not None and end > window_end:
+            end = window_end
+        if end <= start:
+            return
+        if intervals and start <= intervals[-1][1]:
+            intervals[-1] = (intervals[-1][0], max(end, intervals[-1][1]))
+        else:
+            intervals.append((start, end))
+
+    # When the last source wakes, the interval is only closed once a later
+    # event shows nobody fell asleep again at that same instant, so the
+    # order of simultaneous events does not matter.
+    woke = None
+    for event in events:
+        event_type, event_time, source = _parts(event)
+        if woke is not None and event_time > woke:
+            close(opened, woke)
+            woke = None
+        if event_type == 'sleep':
+            if source not in asleep:
+                if not asleep and woke is None:
+                    opened = event_time
+                woke = None
+                asleep.add(source)
+        elif event_type == 'resume' and source in asleep:
+            asleep.discard(source)
+            if not asleep:
+                woke = event_time
+
+    if woke is not None:
+        close(opened, woke)
+    elif asleep and window_end is not None:
+        close(opened, window_end)
+    return intervals
+
+
+def sleep_minutes(events, window_start=None, window_end=None):
+    """Total whole minutes asleep; see sleep_intervals()."""
+    spans = [end - start for start, end in sleep_intervals(events, window_start, window_end)]
+    if not spans:
+        return 0
+    total = sum(spans[1:], spans[0])
+    if isinstance(total, timedelta):
+        return total // MINUTE
+    return int(total // MS_PER_MINUTE)
+
+
+def batch_sleep_minutes(rows, windows):
+    """
+    Sleep minutes for many sessions at once.
+
+    rows: (session_id, event_type, event_time, source) sorted by session_id
+    and event_time. windows: {session_id: (clock_in, clock_out)}, clock_out
+    None for a running session. Returns {session_id: minutes} for every
+    session in windows.
+    """
+    rows = list(rows)
+    if rows and isinstance(rows[0][2], int):
+        np = _numpy()
+        if np is not None:
+            return _batch_sleep_minutes_numpy(np, rows, windows)
+
+    by_session = {session_id: [] for session_id in windows}
+    for session_id, event_type, event_time, source in rows:
+        if session_id in by_session:
+            by_session[session_id].append((event_type, event_time, source))
+    return {
+        session_id: sleep_minutes(by_session[session_id], *windows[session_id])
+        for session_id in windows
+    }
+
+
+_STATES = {'resume': 0, 'sleep': 1}
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    try:
+        import numpy
+    except ImportError:  # optional; batch_sleep_minutes falls back to sleep_minutes
+        return None
+    return numpy
+
+
+def _batch_sleep_minutes_numpy(np, rows, windows):
+    no_end = np.iinfo(np.int64).max
+    session_ids = list(windows)
+    size = len(rows)
+    positions = {session_id: index for index, session_id in enumerate(session_ids)}
+    source_codes = defaultdict(count().__next__)
+    source_codes[None] = source_codes['system']
+
+    # -1 marks rows of other sessions and event types other than sleep/resume.
+    session = np.fromiter(map(positions.get, map(itemgetter(0), rows), repeat(-1)), np.int64, size)
+    state = np.fromiter(map(_STATES.get, map(itemgetter(1), rows), repeat(-1)), np.int8, size)
+    time = np.fromiter(map(itemgetter(2), rows), np.int64, size)
+    source = np.fromiter(map(source_codes.__getitem__, map(itemgetter(3), rows)), np.int64, size)
+
+    keep = (session >= 0) & (state >= 0)
+    if not keep.all():
+        session, state, time, source = session[keep], state[keep], time[keep], source[keep]
+    if not len(session):
+        return {session_id: 0 for session_id in session_ids}
+
+    low = np.fromiter((windows[s][0] for s in session_ids), np.int64, len(session_ids))
+    high = np.fromiter(
+        (no_end if windows[s][1] is None else windows[s][1] for s in session_ids),
+        np.int64, len(session_ids)
+    )
+
+    # 1. Per-source state: each event leaves its source asleep (sleep) or
+    #    awake (resume); compare with the state before it in the same
+    #    (session, source) run, where every source starts awake.
+    order = np.lexsort((time, source, session))
+    session, source, time, state = session[order], source[order], time[order], state[order]
+    previous = np.zeros(len(order), dtype=np.int8)
+    previous[1:] = state[:-1]
+    previous[1:][(session[1:] != session[:-1]) | (source[1:] != source[:-1])] = 0
+
+    # 2. Keep the changes of state: +1 falling asleep, -1 waking.
+    changed = state != previous
+    session, time = session[changed], time[changed]
+    delta = (state[changed] - previous[changed]).astype(np.int64)
+    if not len(delta):
+        return {session_id: 0 for session_id in session_ids}
+
+    # 3. Merge sources: sleeping sources per session after each change, and
+    #    the clamped time until the session's next change (or its clock_out).
+    order = np.lexsort((-delta, time, session))  # at equal times, falling asleep first
+    session, time, delta = session[order], time[order], delta[order]
+    running = np.cumsum(delta)
+    first = np.ones(len(delta), dtype=bool)
+    first[1:] = session[1:] != session[:-1]
+    base = np.maximum.accumulate(np.where(first, np.arange(len(delta)), 0))
+    asleep = running - (running[base] - delta[base])
+
+    last = np.ones(len(delta), dtype=bool)
+    last[:-1] = session[1:] != session[:-1]
+    following = np.empty_like(time)
+    following[:-1] = time[1:]
+    following[last] = high[session[last]]
+    following = np.where(following == no_end, time, following)
+
+    start = np.clip(time, low[session], high[session])
+    end = np.clip(following, low[session], high[session])
+    spans = np.where(asleep > 0, end - start, 0)
+
+    # A running session's sleep that has not been resumed yet is not counted,
+    # including the part before its last event.
+    index = np.arange(len(delta))
+    last_awake = np.full(len(session_ids), -1, dtype=np.int64)
+    np.maximum.at(last_awake, session, np.where(asleep == 0, index, -1))
+    unresolved = (high[session] == no_end) & (index > last_awake[session])
+    spans[unresolved] = 0
+
+    totals = np.zeros(len(session_ids), dtype=np.int64)
+    np.add.at(totals, session, spans)
+    minutes = totals // MS_PER_MINUTE
+    return {session_id: int(minutes[index]) for index, session_id in enumerate(session_ids)}
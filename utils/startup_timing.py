@@ -0,0 +1,73 @@
+# startup_timing.py
+"""
+Where the time goes between launching the app and the first window the user
+works in.
+
+main.py imports this module first, which starts the clock, and marks each
+phase on the main thread as it ends. Work running alongside on other
+threads (the connection warm-up) is recorded with its own start and end.
+report() lists the phases with their start offsets and durations; with
+`python main.py --startup-timing` it is printed to stderr once a dashboard
+is on screen.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_origin = time.perf_counter()
+_last = _origin
+_phases = []  # (name, start offset, seconds, background)
+_lock = threading.Lock()
+_finished = False
+
+report_requested = False
+
+
+def mark(name):
+    """End the main-thread phase that ran since the previous mark."""
+    global _last
+    now = time.perf_counter()
+    with _lock:
+        if _finished:
+            return
+        _phases.append((name, _last - _origin, now - _last, False))
+        _last = now
+
+
+def skip(name="idle"):
+    """Mark, but label the elapsed time as not ours (e.g. the user typing)."""
+    mark(f"({name})")
+
+
+@contextmanager
+def measure(name):
+    """Record a block running off the main thread without moving the mark."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        with _lock:
+            if not _finished:
+                _phases.append((name, started - _origin, ended - started, True))
+
+
+def report():
+    with _lock:
+        phases = sorted(_phases, key=lambda phase: phase[1])
+    lines = ["Startup phases (ms from start):"]
+    for name, start, seconds, background in phases:
+        lines.append(f"  {start * 1000:>8.1f} {seconds * 1000:>+9.1f}  {name}{'  [background]' if background else ''}")
+    return "\n".join(lines)
+
+
+def finish():
+    """Stop recording (later logins are not startup) and print report() if --startup-timing was given."""
+    global _finished
+    with _lock:
+        if _finished:
+            return
+        _finished = True
+    if report_requested:
+        print(report(), file=sys.stderr)